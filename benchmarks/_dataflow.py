@@ -0,0 +1,34 @@
+"""Shared setup for the Dataflow pipeline benchmarks.
+
+Puts src/ on sys.path so dataflow.* and ml_pipelines_kfp.* import as they do
+in the Beam SDK container, quiets the pipeline's per-element logging, and
+provides iris-like entities and features.
+"""
+
+import logging
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+if str(REPO_ROOT / "src") not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT / "src"))
+
+# The pipeline modules log through ml_pipelines_kfp.log loggers, which set their own level
+logging.disable(logging.ERROR)
+
+FEATURE_COLUMNS = ["sepal_length_cm", "sepal_width_cm", "petal_length_cm", "petal_width_cm"]
+
+
+def iris_features(n, seed=0):
+    """{entity_id: {feature: value}} for n entities, values rounded like pubsub_producer.py."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    rows = np.round(rng.uniform([4.0, 2.0, 1.0, 0.1], [8.0, 4.5, 7.0, 2.5], size=(n, 4)), 1)
+    return {f"{i}_streaming": dict(zip(FEATURE_COLUMNS, map(float, row))) for i, row in enumerate(rows)}
+
+
+def batches(items, size):
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
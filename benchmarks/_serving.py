@@ -0,0 +1,136 @@
+"""Shared setup for the FastAPI serving benchmarks.
+
+Puts the serving container's flat module layout (main.py, models/, log.py)
+on sys.path, trains an iris model like the KFP model components do, and
+imports the FastAPI app against it.
+"""
+
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+FASTAPI_DIR = REPO_ROOT / "src/ml_pipelines_kfp/iris_xgboost/pipelines/components/fastapi"
+IRIS_CSV = REPO_ROOT / "src/ml_pipelines_kfp/iris_xgboost/data/iris.csv"
+
+SERVING_PATHS = [
+    str(REPO_ROOT / "src"),
+    str(REPO_ROOT / "src/ml_pipelines_kfp"),
+    str(REPO_ROOT / "src/ml_pipelines_kfp/iris_xgboost"),
+    str(FASTAPI_DIR),
+]
+
+for path in SERVING_PATHS:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Benchmarks score bare arrays in feature_names_in_ order, as the server does
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+
+def load_training_data():
+    """Iris CSV with canonical feature names and integer labels."""
+    import pandas as pd
+    from feature_store.iris.feature_definitions import IRIS_CONFIG
+
+    df = pd.read_csv(IRIS_CSV).rename(columns=IRIS_CONFIG.column_mappings["camel"])
+    X = df[IRIS_CONFIG.feature_columns]
+    y = df[IRIS_CONFIG.target_column].astype("category").cat.codes
+    return X, y
+
+
+def train_model(kind="random_forest"):
+    """Fit the same estimators as components/models.py on the bundled iris CSV."""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.tree import DecisionTreeClassifier
+
+    X, y = load_training_data()
+    model = RandomForestClassifier(random_state=42) if kind == "random_forest" else DecisionTreeClassifier(random_state=42)
+    model.fit(X, y)
+    return model
+
+
+def save_model(model, directory=None):
+    import joblib
+
+    directory = directory or tempfile.mkdtemp(prefix="bench-model-")
+    path = os.path.join(directory, "model.joblib")
+    joblib.dump(model, path)
+    return path
+
+
+def load_app(model_path, **env):
+    """Import fastapi_server with MODEL_PATH pointing at a local model.
+
+    Extra keyword arguments are set as environment variables before import,
+    so benchmarks can toggle server features.
+    """
+    os.environ["MODEL_PATH"] = model_path
+    os.environ.pop("MODEL_GCS_PATH", None)
+    os.environ.pop("AIP_STORAGE_URI", None)
+    # OTLP exporter needs no credentials; nothing listens there, exports just fail quietly.
+    os.environ.setdefault("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317")
+    logging.getLogger("opentelemetry").setLevel(logging.CRITICAL)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    for key, value in env.items():
+        os.environ[key] = str(value)
+
+    import fastapi_server
+
+    return fastapi_server.app
+
+
+def server_env(model_path, **env):
+    """Environment for running fastapi_server under uvicorn in a subprocess."""
+    inherited = {k: v for k, v in os.environ.items() if k not in ("MODEL_GCS_PATH", "AIP_STORAGE_URI")}
+    return {
+        **inherited,
+        "PYTHONPATH": os.pathsep.join(SERVING_PATHS),
+        "MODEL_PATH": model_path,
+        "OTEL_EXPORTER_OTLP_ENDPOINT": os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317"),
+        "LOG_LEVEL": "WARNING",
+        **{key: str(value) for key, value in env.items()},
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(model_path, timeout=60, **env):
+    """Run fastapi_server under uvicorn on a free port; returns (process, base_url)."""
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fastapi_server:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=FASTAPI_DIR, env=server_env(model_path, **env),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {proc.returncode} (env {env})")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise TimeoutError(f"Server did not start within {timeout}s (env {env})")
+
+
+def random_rows(n, seed=0):
+    """n random feature rows within the iris value ranges, rounded like pubsub_producer.py."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    low = np.array([4.0, 2.0, 1.0, 0.1])
+    high = np.array([8.0, 4.5, 7.0, 2.5])
+    return np.round(rng.uniform(low, high, size=(n, 4)), 1)
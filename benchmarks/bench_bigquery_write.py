@@ -0,0 +1,96 @@
+"""Benchmark: prediction rows through the Storage Write API sink, and their billed size.
+
+Builds rows shaped like the inference pipeline's PREDICTION_SCHEMA output
+and reports:
+  - bytes per row as a tabledata.insertAll JSON payload (legacy streaming
+    inserts bill at least 1 KB per row) and as the proto rows AppendRows
+    sends (billed as sent);
+  - rows/s through WriteToBigQueryStorage's append DoFns against a fake
+    BigQueryWrite service on localhost, at-least-once and exactly-once, for
+    each --batch-sizes value, with --latency-ms per AppendRows call.
+The fake stores rows in memory, so the rows/s show the client-side cost of
+encoding and appending plus the injected latency, not BigQuery's.
+
+Usage:
+    python benchmarks/bench_bigquery_write.py
+    python benchmarks/bench_bigquery_write.py --rows 50000 --batch-sizes 100 500 --latency-ms 20
+"""
+
+import argparse
+import functools
+import json
+import time
+
+from _dataflow import FEATURE_COLUMNS, batches, iris_features
+
+from dataflow.iris_inference_pipeline import PREDICTION_SCHEMA
+from dataflow.testing.fake_bigquery_write import FakeBigQueryWrite, bigquery_write_client
+from dataflow.utils.bigquery_storage_write import ProtoRowEncoder, _AppendAtOffsets, _AppendToDefaultStream
+
+STREAMING_INSERT_MIN_BYTES = 1024
+
+
+def _prediction_rows(n):
+    rows = []
+    for entity_id, features in iris_features(n).items():
+        rows.append({
+            "entity_id": entity_id,
+            "features": json.dumps({col: features[col] for col in FEATURE_COLUMNS}),
+            "timestamp": "2026-01-01T00:00:00.123456+00:00",
+            "prediction": "1",
+            "class_probabilities": [0.05, 0.9, 0.05],
+            "prediction_timestamp": "2026-01-01T00:00:00.234567+00:00",
+            "model_service": "https://iris-classifier-xgboost-service-abc123-uc.a.run.app",
+            "processing_time": 0.0123,
+            "dataflow_processing_time": "2026-01-01T00:00:00.345678+00:00",
+        })
+    return rows
+
+
+def _throughput(fake, dofn_class, input_batches):
+    dofn = dofn_class("project:dataset.predictions", PREDICTION_SCHEMA, "inference",
+                      functools.partial(bigquery_write_client, fake.target))
+    dofn.setup()
+    try:
+        stream = dofn._create_stream() if dofn_class is _AppendAtOffsets else None
+        offset = 0
+        start = time.perf_counter()
+        for batch in input_batches:
+            if stream is None:
+                list(dofn.process(batch))
+            else:
+                written, _ = dofn._write(stream, batch, offset)
+                offset += written
+        elapsed = time.perf_counter() - start
+    finally:
+        dofn.teardown()
+    return sum(len(batch) for batch in input_batches) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Added to every AppendRows call")
+    args = parser.parse_args()
+
+    rows = _prediction_rows(args.rows)
+    encoder = ProtoRowEncoder(PREDICTION_SCHEMA)
+    json_bytes = sum(len(json.dumps({"json": row})) for row in rows) / len(rows)
+    proto_bytes = sum(len(encoder.encode(row)) for row in rows) / len(rows)
+    print(f"{'payload':<34} {'bytes/row':>10} {'billed/row':>11}")
+    print(f"{'insertAll JSON (streaming inserts)':<34} {json_bytes:>10.0f} "
+          f"{max(json_bytes, STREAMING_INSERT_MIN_BYTES):>11.0f}")
+    print(f"{'AppendRows proto (Storage Write)':<34} {proto_bytes:>10.0f} {proto_bytes:>11.0f}")
+
+    print(f"\n{args.rows} rows, AppendRows {args.latency_ms}ms, one DoFn instance")
+    print(f"{'mode':<16} {'batch size':>10} {'rows/s':>9}")
+    for name, dofn_class in [("at-least-once", _AppendToDefaultStream), ("exactly-once", _AppendAtOffsets)]:
+        for batch_size in args.batch_sizes:
+            with FakeBigQueryWrite(latency_secs=args.latency_ms / 1000) as fake:
+                throughput = _throughput(fake, dofn_class, batches(rows, batch_size))
+            print(f"{name:<16} {batch_size:>10} {throughput:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Throughput benchmark: compiled tree engine vs sklearn predict_proba.
+
+Times the model call alone (no HTTP) for the Decision Tree and Random Forest
+used by the training pipeline, after checking the outputs are identical.
+
+Usage:
+    python benchmarks/bench_compiled_trees.py --iterations 50
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+from _serving import random_rows, train_model
+
+from compiled_trees import compile_model
+
+BATCH_SIZES = [1, 50, 500, 5000]
+
+
+def _median_secs(fn, iterations):
+    fn()  # warm-up
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    args = parser.parse_args()
+
+    print(f"{'model':>14} {'batch':>6} {'sklearn rows/s':>15} {'compiled rows/s':>16} {'speedup':>8}")
+    for kind in ("decision_tree", "random_forest"):
+        model = train_model(kind)
+        compiled = compile_model(model)
+        for n in args.batch_sizes:
+            X = random_rows(n).astype("float32")
+            np.testing.assert_array_equal(compiled.predict_proba(X), model.predict_proba(X))
+            sklearn_secs = _median_secs(lambda: model.predict_proba(X), args.iterations)
+            compiled_secs = _median_secs(lambda: compiled.predict_proba(X), args.iterations)
+            print(
+                f"{kind:>14} {n:>6} {n / sklearn_secs:>15,.0f} {n / compiled_secs:>16,.0f} "
+                f"{sklearn_secs / compiled_secs:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
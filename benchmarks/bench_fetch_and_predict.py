@@ -0,0 +1,206 @@
+"""Benchmark: fused FetchAndPredict vs separate fetch and prediction stages.
+
+Batches of entity ids arrive at --rate elements/s, as out of the
+pipeline's first BatchElements. A fake online store and a fake /predict
+service on localhost stand in for Feature Store and the FastAPI container.
+
+two-stage is the pipeline's default layout. One thread runs
+FetchFeaturesFromOnlineStore. Its output is re-batched, as "Batch for
+Prediction" does: a batch is flushed once batch-size elements are buffered
+or --window-ms after its first element. A second thread runs
+BatchCallFastAPIService on those batches.
+
+fused runs FetchAndPredict on one thread. The bundle ends, and pending
+predictions are flushed, whenever it catches up with the arrivals.
+
+Latency is measured per element, from its batch's arrival to its prediction
+row. Shuffle bytes are the FastPrimitivesCoder-encoded size of the elements
+that enter a stateful BatchElements, counted per input entity:
+  - two-stage shuffles the parsed ids and then the fetched elements;
+  - fused shuffles only the ids.
+The first BatchElements is the same in both layouts. Its buffering is not
+in the measured latency.
+
+Usage:
+    python benchmarks/bench_fetch_and_predict.py
+    python benchmarks/bench_fetch_and_predict.py --rate 600 --predict-ms 40 --missing-fraction 0.1
+"""
+
+import argparse
+import queue
+import threading
+import time
+
+import numpy as np
+from _dataflow import FEATURE_COLUMNS, batches, iris_features
+from apache_beam.coders import FastPrimitivesCoder
+from apache_beam.transforms.window import GlobalWindow
+from apache_beam.utils.windowed_value import WindowedValue
+
+from dataflow.iris_inference_pipeline import BatchCallFastAPIService, FetchAndPredict
+from dataflow.testing.fake_online_store import FakeOnlineStore
+from dataflow.testing.fake_prediction_service import FakePredictionService
+from dataflow.utils.online_store_reader import FetchFeaturesFromOnlineStore
+
+_DONE = object()
+
+
+class FakeStoreFetch(FetchFeaturesFromOnlineStore):
+    def __init__(self, store, **kwargs):
+        super().__init__("project", "region", "store", "view", FEATURE_COLUMNS, **kwargs)
+        self.store = store
+
+    def _create_client(self):
+        return self.store.client()
+
+
+def _arrivals(entity_batches, rate):
+    """(arrival time, batch of elements) per batch, paced at rate elements/s from now."""
+    start = time.perf_counter()
+    at = start
+    for batch in entity_batches:
+        yield at, [{"entity_id": e} for e in batch]
+        at += len(batch) / rate
+
+
+def _wait_until(at):
+    delay = at - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def _rows(outputs):
+    """Prediction rows among a DoFn's outputs, unwrapping WindowedValues and dropping tagged outputs."""
+    for output in outputs:
+        if isinstance(output, WindowedValue):
+            output = output.value
+        if isinstance(output, dict):
+            yield output
+
+
+def run_two_stage(fetch_fn, predict_fn, entity_batches, args):
+    arrived = {}
+    latencies = []
+    fetched = queue.Queue()
+    window_secs = args.window_ms / 1000
+    shuffled = [0]
+    coder = FastPrimitivesCoder()
+
+    def fetch_stage():
+        fetch_fn.setup()
+        try:
+            for at, batch in _arrivals(entity_batches, args.rate):
+                _wait_until(at)
+                for element in batch:
+                    arrived[element["entity_id"]] = at
+                for result in fetch_fn.process(batch):
+                    if isinstance(result, dict):
+                        shuffled[0] += len(coder.encode(result))
+                        fetched.put(result)
+        finally:
+            fetch_fn.teardown()
+            fetched.put(_DONE)
+
+    def predict(buffer):
+        for row in predict_fn.process(buffer):
+            latencies.append(time.perf_counter() - arrived[row["entity_id"]])
+
+    thread = threading.Thread(target=fetch_stage)
+    start = time.perf_counter()
+    thread.start()
+    predict_fn.setup()
+    try:
+        buffer, flush_at, done = [], None, False
+        while not done:
+            timeout = None if flush_at is None else max(flush_at - time.perf_counter(), 0)
+            try:
+                element = fetched.get(timeout=timeout)
+            except queue.Empty:
+                element = None
+            if element is _DONE:
+                done = True
+            elif element is not None:
+                buffer.append(element)
+                flush_at = flush_at or time.perf_counter() + window_secs
+            if buffer and (done or len(buffer) >= args.batch_size or time.perf_counter() >= flush_at):
+                predict(buffer)
+                buffer, flush_at = [], None
+    finally:
+        predict_fn.teardown()
+        thread.join()
+    return time.perf_counter() - start, latencies, shuffled[0]
+
+
+def run_fused(fetch_fn, predict_fn, entity_batches, args):
+    arrived = {}
+    latencies = []
+    dofn = FetchAndPredict(fetch_fn, predict_fn, max_pending_batches=args.max_pending_batches)
+
+    def record(outputs):
+        for row in _rows(outputs):
+            latencies.append(time.perf_counter() - arrived[row["entity_id"]])
+
+    start = time.perf_counter()
+    dofn.setup()
+    try:
+        dofn.start_bundle()
+        for at, batch in _arrivals(entity_batches, args.rate):
+            if at > time.perf_counter():
+                # Caught up with the input: the runner commits the bundle
+                record(dofn.finish_bundle())
+                _wait_until(at)
+                dofn.start_bundle()
+            for element in batch:
+                arrived[element["entity_id"]] = at
+            record(dofn.process(batch, timestamp=0, window=GlobalWindow()))
+        record(dofn.finish_bundle())
+    finally:
+        dofn.teardown()
+    return time.perf_counter() - start, latencies, 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entities", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=500.0, help="Arriving elements per second")
+    parser.add_argument("--fetch-ms", type=float, default=5.0, help="Online store latency per lookup")
+    parser.add_argument("--fetch-concurrency", type=int, default=16)
+    parser.add_argument("--predict-ms", type=float, default=20.0, help="/predict latency per call")
+    parser.add_argument("--window-ms", type=float, default=1000.0, help="max_batch_duration_secs of the re-batching")
+    parser.add_argument("--missing-fraction", type=float, default=0.02)
+    parser.add_argument("--max-pending-batches", type=int, default=2)
+    args = parser.parse_args()
+
+    features = iris_features(args.entities)
+    pool = list(features)
+    n_missing = int(len(pool) * args.missing_fraction)
+    # Spread the missing entities over the batches, as late-arriving features would be
+    missing = set(pool[::max(len(pool) // n_missing, 1)][:n_missing]) if n_missing else set()
+    stored = {e: f for e, f in features.items() if e not in missing}
+    entity_batches = batches(pool, args.batch_size)
+    coder = FastPrimitivesCoder()
+    id_bytes = sum(len(coder.encode({"entity_id": e, "timestamp": None})) for e in pool)
+
+    print(f"{args.entities} entities in batches of {args.batch_size} at {args.rate:.0f}/s, "
+          f"{len(missing)} missing; store {args.fetch_ms}ms x{args.fetch_concurrency}, "
+          f"/predict {args.predict_ms}ms, re-batch window {args.window_ms:.0f}ms")
+    print(f"{'layout':<10} {'rows':>6} {'rows/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'calls':>6} {'shuffle B/entity':>17}")
+    layouts = [("two-stage", run_two_stage), ("fused", run_fused)]
+    with FakeOnlineStore(stored, latency_secs=args.fetch_ms / 1000, max_workers=128) as store:
+        for name, run in layouts:
+            with FakePredictionService(FEATURE_COLUMNS, latency_secs=args.predict_ms / 1000) as service:
+                fetch_fn = FakeStoreFetch(
+                    store, max_concurrency=args.fetch_concurrency, max_retries=0,
+                )
+                predict_fn = BatchCallFastAPIService(service.url)
+                elapsed, latencies, fetched_bytes = run(fetch_fn, predict_fn, entity_batches, args)
+            ms = np.array(latencies) * 1000
+            print(f"{name:<10} {len(ms):>6} {len(ms) / elapsed:>8.0f} {np.percentile(ms, 50):>8.1f} "
+                  f"{np.percentile(ms, 99):>8.1f} {ms.max():>8.1f} {service.requests:>6} "
+                  f"{(id_bytes + fetched_bytes) / len(pool):>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark: DirectRunner rows/s, in-worker model vs calls to a /predict stub.
+
+Runs the inference pipeline's prediction step over batches of iris rows
+on the DirectRunner, three ways:
+  - PredictWithLocalModel (--inference_mode=local) scoring a random forest
+    trained like the KFP model component;
+  - BatchCallFastAPIService against a fake /predict on localhost scoring
+    the same model, with JSON or msgpack bodies and --latency-ms per call.
+The stub runs in the benchmark's process, so its scoring shares the CPU the
+DoFn runs on. --latency-ms stands in for the Cloud Run round trip.
+
+Usage:
+    python benchmarks/bench_local_inference.py
+    python benchmarks/bench_local_inference.py --rows 50000 --batch-size 100 --latency-ms 5
+"""
+
+import argparse
+import time
+
+import apache_beam as beam
+from apache_beam.metrics.metric import MetricsFilter
+from _dataflow import FEATURE_COLUMNS, batches, iris_features
+from _serving import save_model, train_model
+
+from dataflow.iris_inference_pipeline import BatchCallFastAPIService, PredictWithLocalModel
+from dataflow.testing.fake_prediction_service import FakePredictionService
+from ml_pipelines_kfp.model_adapter import load_adapter
+
+
+def _run(predict_fn, input_batches):
+    """(rows scored, seconds) for one DirectRunner pipeline applying predict_fn to input_batches."""
+    pipeline = beam.Pipeline()
+    _ = pipeline | beam.Create(input_batches, reshuffle=False) | beam.ParDo(predict_fn)
+    start = time.perf_counter()
+    result = pipeline.run()
+    result.wait_until_finish()
+    elapsed = time.perf_counter() - start
+    counters = result.metrics().query(MetricsFilter().with_name("prediction_success"))["counters"]
+    return sum(counter.committed for counter in counters), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added to every stub /predict call")
+    parser.add_argument("--model", default="random_forest", choices=["random_forest", "decision_tree"])
+    args = parser.parse_args()
+
+    elements = [{"entity_id": e, **features} for e, features in iris_features(args.rows).items()]
+    input_batches = batches(elements, args.batch_size)
+    model_path = save_model(train_model(args.model))
+
+    print(f"{args.rows} rows in batches of {args.batch_size}, DirectRunner, "
+          f"{args.model}, stub latency {args.latency_ms}ms")
+    print(f"{'prediction step':<28} {'rows/s':>9} {'seconds':>8}")
+    rows, elapsed = _run(PredictWithLocalModel(model_path, refresh_interval_secs=0), input_batches)
+    print(f"{'local model':<28} {rows / elapsed:>9.0f} {elapsed:>8.2f}")
+    model = load_adapter(model_path)
+    for wire_format in ["json", "msgpack"]:
+        with FakePredictionService(FEATURE_COLUMNS, latency_secs=args.latency_ms / 1000, model=model.predict) as service:
+            rows, elapsed = _run(BatchCallFastAPIService(service.url, wire_format=wire_format), input_batches)
+        print(f"{'http stub, ' + wire_format:<28} {rows / elapsed:>9.0f} {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
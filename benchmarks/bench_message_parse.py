@@ -0,0 +1,121 @@
+"""Benchmark: Pub/Sub message parsing, per-message json + Pydantic model vs batched orjson + TypedDict validation.
+
+Builds a synthetic corpus of --messages Pub/Sub payloads, shaped like the
+feature pipeline's input, with --invalid-fraction of them malformed JSON or
+failing validation, and reports messages/s for:
+  - the per-message path ParsePubSubMessage used: json.loads, then
+    PubSubIrisMessage(**data).model_dump() on a Pydantic model;
+  - BatchMessageParser, orjson-decoding each payload and validating
+    --batch-size payloads per Pydantic call, for each batch size;
+  - BatchMessageParser without a record type, the inference pipeline's
+    decode-only parse.
+Both paths must agree on which messages are invalid.
+
+Usage:
+    python benchmarks/bench_message_parse.py
+    python benchmarks/bench_message_parse.py --messages 200000 --batch-size 100 500 2000
+"""
+
+import argparse
+import gc
+import json
+import random
+import time
+from typing import Optional
+
+from _dataflow import FEATURE_COLUMNS, iris_features
+from pydantic import BaseModel, ValidationError
+
+from dataflow.models.iris_schema import PubSubIrisMessage
+from dataflow.utils.message_parser import BatchMessageParser, ParseError
+
+SNAKE_NAMES = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
+
+
+class PubSubIrisModel(BaseModel):
+    """PubSubIrisMessage as the Pydantic model it replaced."""
+
+    sepal_length: float
+    sepal_width: float
+    petal_length: float
+    petal_width: float
+    timestamp: Optional[str] = None
+    sample_id: Optional[int] = None
+
+
+def _corpus(n, invalid_fraction, seed=0):
+    """n payloads; distinct feature rows repeat, so a large corpus builds quickly."""
+    rng = random.Random(seed)
+    rows = list(iris_features(min(n, 10000), seed).values())
+    payloads = []
+    for i in range(n):
+        features = rows[i % len(rows)]
+        message = {name: features[col] for name, col in zip(SNAKE_NAMES, FEATURE_COLUMNS)}
+        message.update(timestamp="2026-01-01T00:00:00.123456+00:00", sample_id=i)
+        if rng.random() < invalid_fraction:
+            if rng.random() < 0.5:
+                payloads.append(json.dumps(message).encode()[:-3])
+                continue
+            message["petal_width"] = "n/a"
+        payloads.append(json.dumps(message).encode())
+    return payloads
+
+
+def _per_message(payloads):
+    results = []
+    for payload in payloads:
+        try:
+            results.append(PubSubIrisModel(**json.loads(payload.decode("utf-8"))).model_dump())
+        except (ValidationError, json.JSONDecodeError) as e:
+            results.append(e)
+    return results
+
+
+def _batched(parser, payloads, batch_size):
+    results = []
+    for start in range(0, len(payloads), batch_size):
+        results.extend(parser.parse(payloads[start:start + batch_size]))
+    return results
+
+
+def _per_sec(fn, payloads):
+    # Without the cyclic GC, as timeit does: the results of a 1M corpus would otherwise be rescanned on every collection
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        results = fn(payloads)
+        return results, len(payloads) / (time.perf_counter() - start)
+    finally:
+        gc.enable()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--invalid-fraction", type=float, default=0.01)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[1, 50, 500, 5000])
+    args = parser.parse_args()
+
+    payloads = _corpus(args.messages, args.invalid_fraction)
+    print(f"{len(payloads)} messages, {sum(map(len, payloads)) / len(payloads):.0f} bytes each, "
+          f"{args.invalid_fraction:.1%} invalid")
+
+    results, baseline = _per_sec(_per_message, payloads)
+    invalid = [isinstance(result, Exception) for result in results]
+    print(f"{'parser':<34} {'msgs/s':>10} {'speedup':>8}")
+    print(f"{'json + model + model_dump':<34} {baseline:>10.0f} {1:>7.2f}x")
+
+    batch_parser = BatchMessageParser(PubSubIrisMessage)
+    for batch_size in args.batch_size:
+        results, per_sec = _per_sec(lambda p: _batched(batch_parser, p, batch_size), payloads)
+        assert [isinstance(result, ParseError) for result in results] == invalid
+        label = f"orjson + batch validate ({batch_size})"
+        print(f"{label:<34} {per_sec:>10.0f} {per_sec / baseline:>7.2f}x")
+
+    _, per_sec = _per_sec(lambda p: _batched(BatchMessageParser(), p, max(args.batch_size)), payloads)
+    print(f"{'orjson decode only':<34} {per_sec:>10.0f} {per_sec / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
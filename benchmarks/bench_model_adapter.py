@@ -0,0 +1,52 @@
+"""Microbenchmark: ModelAdapter single pass vs predict() + predict_proba().
+
+Times the model call alone (no HTTP) for the Decision Tree and Random Forest
+used by the training pipeline.
+
+Usage:
+    python benchmarks/bench_model_adapter.py --iterations 50
+"""
+
+import argparse
+import statistics
+import time
+
+from _serving import random_rows, train_model
+
+from model_adapter import ModelAdapter
+
+BATCH_SIZES = [1, 50, 500, 5000]
+
+
+def _median_secs(fn, iterations):
+    fn()  # warm-up
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    args = parser.parse_args()
+
+    print(f"{'model':>14} {'batch':>6} {'two calls ms':>13} {'adapter ms':>11} {'speedup':>8}")
+    for kind in ("decision_tree", "random_forest"):
+        model = train_model(kind)
+        adapter = ModelAdapter(model)
+        for n in args.batch_sizes:
+            X = random_rows(n).astype("float32")
+            separate = _median_secs(lambda: (model.predict(X), model.predict_proba(X)), args.iterations)
+            single = _median_secs(lambda: adapter.predict(X), args.iterations)
+            print(
+                f"{kind:>14} {n:>6} {separate * 1000:>13.3f} {single * 1000:>11.3f} "
+                f"{separate / single:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Benchmark: FetchFeaturesFromOnlineStore throughput, serial vs concurrent.
+
+Serves a fake FeatureOnlineStoreService on localhost with a fixed
+per-request latency (standing in for the Bigtable-backed online store's
+round trip) and runs the DoFn's process() over batches of entity ids, as
+the inference pipeline does after BatchElements. --missing-fraction of the
+entities have no features, so they are retried with backoff before being
+dead-lettered.
+
+--distinct draws the entity ids with replacement from a smaller pool, as
+pubsub_producer.py reuses sample_ids, and --cache-size enables the
+worker-local feature cache; the store reads column shows what it saves.
+
+Usage:
+    python benchmarks/bench_online_store_fetch.py --latency-ms 5 --concurrency 1 4 8 16 32
+    python benchmarks/bench_online_store_fetch.py --entities 5000 --distinct 1000 --cache-size 10000
+"""
+
+import argparse
+import random
+import time
+
+from _dataflow import FEATURE_COLUMNS, batches, iris_features
+
+from dataflow.testing.fake_online_store import FakeOnlineStore
+from dataflow.utils.online_store_reader import FetchFeaturesFromOnlineStore
+
+
+class FakeStoreFetch(FetchFeaturesFromOnlineStore):
+    def __init__(self, store, **kwargs):
+        super().__init__("project", "region", "store", "view", FEATURE_COLUMNS, **kwargs)
+        self.store = store
+
+    def _create_client(self):
+        return self.store.client()
+
+
+def _measure(store, entity_batches, concurrency, args):
+    dofn = FakeStoreFetch(
+        store, max_concurrency=concurrency, max_retries=args.max_retries,
+        initial_backoff_secs=args.backoff_ms / 1000, cache_max_entries=args.cache_size,
+    )
+    dofn.setup()
+    try:
+        start = time.perf_counter()
+        batch_times = []
+        outputs = 0
+        for batch in entity_batches:
+            batch_start = time.perf_counter()
+            outputs += sum(1 for _ in dofn.process([{"entity_id": e} for e in batch]))
+            batch_times.append(time.perf_counter() - batch_start)
+        elapsed = time.perf_counter() - start
+    finally:
+        dofn.teardown()
+    batch_times.sort()
+    return outputs, elapsed, batch_times[len(batch_times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entities", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--missing-fraction", type=float, default=0.02)
+    parser.add_argument("--max-retries", type=int, default=1)
+    parser.add_argument("--backoff-ms", type=float, default=50.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--distinct", type=int, default=None, help="Entity id pool size (default: all distinct)")
+    parser.add_argument("--cache-size", type=int, default=0)
+    args = parser.parse_args()
+
+    features = iris_features(args.distinct or args.entities)
+    pool = list(features)
+    n_missing = int(len(pool) * args.missing_fraction)
+    stored = {e: features[e] for e in pool[n_missing:]}
+    entity_ids = pool if args.distinct is None else random.Random(0).choices(pool, k=args.entities)
+    entity_batches = batches(entity_ids, args.batch_size)
+
+    with FakeOnlineStore(stored, latency_secs=args.latency_ms / 1000, max_workers=128) as store:
+        print(f"{args.entities} lookups of {len(pool)} entities, batch {args.batch_size}, "
+              f"{args.latency_ms}ms per lookup, {n_missing} missing ({args.max_retries} retry, "
+              f"{args.backoff_ms}ms backoff), feature cache {args.cache_size or 'off'}")
+        print(f"{'concurrency':>11} {'entities/s':>11} {'p50 batch ms':>13} {'speedup':>8} {'store reads':>12}")
+        baseline = None
+        for concurrency in args.concurrency:
+            reads_before = store.requests
+            outputs, elapsed, p50 = _measure(store, entity_batches, concurrency, args)
+            assert outputs == args.entities, f"expected {args.entities} outputs, got {outputs}"
+            throughput = args.entities / elapsed
+            baseline = baseline or throughput
+            print(f"{concurrency:>11} {throughput:>11,.0f} {p50 * 1000:>13.1f} {throughput / baseline:>7.1f}x "
+                  f"{store.requests - reads_before:>12,}")
+
+
+if __name__ == "__main__":
+    main()
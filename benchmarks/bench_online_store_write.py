@@ -0,0 +1,88 @@
+"""Benchmark: WriteToOnlineStore throughput, a stream per batch vs one long-lived stream.
+
+Serves a fake FeatureViewDirectWrite stream on localhost that answers each
+write request after --latency-ms (standing in for the online store's
+round trip and Bigtable mutation) and writes --rows feature rows in
+batches of --batch-size, as the feature pipeline does after "Batch for
+Online Store":
+  - stream per batch: the previous WriteToOnlineStore.process, which opened
+    a stream with iter([request]) for every batch and drained it before
+    taking the next (building requests as WriteToOnlineStore does now, so
+    only the stream handling differs);
+  - long-lived stream: WriteToOnlineStore as it is now, one stream per DoFn
+    instance with up to --in-flight batches on it.
+Reports rows/s and the streams each approach opened.
+
+Usage:
+    python benchmarks/bench_online_store_write.py
+    python benchmarks/bench_online_store_write.py --rows 50000 --batch-size 100 --latency-ms 20 --in-flight 1 4 16
+"""
+
+import argparse
+import functools
+import time
+
+from _dataflow import FEATURE_COLUMNS, batches, iris_features
+from apache_beam.transforms.window import GlobalWindow
+
+from dataflow.testing.fake_online_store import FakeOnlineStore, direct_write_client
+from dataflow.utils.online_store_writer import WriteToOnlineStore
+
+
+def _writer(store, in_flight):
+    return WriteToOnlineStore(
+        "project", "us-central1", "store", "iris_features", FEATURE_COLUMNS,
+        max_in_flight_batches=in_flight, client_factory=functools.partial(direct_write_client, store.target),
+    )
+
+
+def _stream_per_batch(store, input_batches):
+    dofn = _writer(store, 1)
+    dofn.setup()
+    start = time.perf_counter()
+    for batch in input_batches:
+        for _ in dofn._client.feature_view_direct_write(requests=iter([dofn._build_request(batch)])):
+            pass
+    return time.perf_counter() - start
+
+
+def _long_lived_stream(store, input_batches, in_flight):
+    dofn = _writer(store, in_flight)
+    dofn.setup()
+    try:
+        start = time.perf_counter()
+        dofn.start_bundle()
+        for batch in input_batches:
+            for _ in dofn.process(batch, timestamp=0, window=GlobalWindow()):
+                pass
+        for _ in dofn.finish_bundle() or []:
+            pass
+        return time.perf_counter() - start
+    finally:
+        dofn.teardown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=10.0)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    rows = [{"entity_id": entity_id, **features} for entity_id, features in iris_features(args.rows).items()]
+    input_batches = batches(rows, args.batch_size)
+
+    print(f"{args.rows} rows in batches of {args.batch_size}, write {args.latency_ms}ms per request")
+    print(f"{'writer':<28} {'rows/s':>9} {'streams':>8}")
+    with FakeOnlineStore(write_latency_secs=args.latency_ms / 1000, max_workers=128) as store:
+        elapsed = _stream_per_batch(store, input_batches)
+    print(f"{'stream per batch':<28} {args.rows / elapsed:>9.0f} {store.write_streams:>8}")
+    for in_flight in args.in_flight:
+        with FakeOnlineStore(write_latency_secs=args.latency_ms / 1000, max_workers=128) as store:
+            elapsed = _long_lived_stream(store, input_batches, in_flight)
+        print(f"{f'long-lived, {in_flight} in flight':<28} {args.rows / elapsed:>9.0f} {store.write_streams:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark: BatchCallFastAPIService throughput with more batches in flight.
+
+Runs the DoFn's process()/finish_bundle() over batches of iris rows, as
+the inference pipeline does after "Batch for Prediction", against a fake
+/predict on localhost that answers after --latency-ms. With
+max_in_flight_batches=1 every process() call waits for its own response;
+higher values keep that many calls in flight on the DoFn's background
+event loop. --bundle-batches sets how many batches share a bundle, which
+bounds the overlap: results must be emitted before the bundle ends.
+
+Usage:
+    python benchmarks/bench_pipelined_predict.py --latency-ms 50 --in-flight 1 2 4 8
+    python benchmarks/bench_pipelined_predict.py --bundle-batches 4 --wire-format msgpack
+"""
+
+import argparse
+import time
+
+from _dataflow import FEATURE_COLUMNS, batches, iris_features
+from apache_beam.transforms.window import GlobalWindow
+
+from dataflow.iris_inference_pipeline import BatchCallFastAPIService
+from dataflow.testing.fake_prediction_service import FakePredictionService
+
+
+def _measure(service, input_batches, in_flight, args):
+    dofn = BatchCallFastAPIService(
+        service.url, wire_format=args.wire_format, max_in_flight_batches=in_flight,
+    )
+    dofn.setup()
+    try:
+        rows = 0
+        start = time.perf_counter()
+        for bundle in batches(input_batches, args.bundle_batches):
+            dofn.start_bundle()
+            for batch in bundle:
+                rows += sum(1 for _ in dofn.process(batch, timestamp=0, window=GlobalWindow()))
+            rows += sum(1 for _ in dofn.finish_bundle())
+        elapsed = time.perf_counter() - start
+    finally:
+        dofn.teardown()
+    return rows, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--bundle-batches", type=int, default=100)
+    parser.add_argument("--wire-format", default="json", choices=["json", "msgpack", "arrow"])
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    elements = [{"entity_id": e, **features} for e, features in iris_features(args.rows).items()]
+    input_batches = batches(elements, args.batch_size)
+
+    print(f"{args.rows} rows in batches of {args.batch_size}, {args.bundle_batches} batches per bundle, "
+          f"/predict {args.latency_ms}ms, {args.wire_format}")
+    print(f"{'in flight':>9} {'rows/s':>9} {'seconds':>8} {'speedup':>8} {'peak server':>12}")
+    baseline = None
+    for in_flight in args.in_flight:
+        with FakePredictionService(FEATURE_COLUMNS, latency_secs=args.latency_ms / 1000) as service:
+            rows, elapsed = _measure(service, input_batches, in_flight, args)
+        throughput = rows / elapsed
+        baseline = baseline or throughput
+        print(f"{in_flight:>9} {throughput:>9.0f} {elapsed:>8.2f} {throughput / baseline:>7.1f}x "
+              f"{service.peak_in_flight:>12}")
+
+
+if __name__ == "__main__":
+    main()
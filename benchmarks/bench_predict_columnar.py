@@ -0,0 +1,57 @@
+"""Benchmark /predict (per-row Pydantic + DataFrame) against /predict:columnar.
+
+Both endpoints run in-process through FastAPI's TestClient against a
+RandomForest trained on the bundled iris CSV, so the numbers include request
+parsing and response encoding but no network.
+
+Usage:
+    python benchmarks/bench_predict_columnar.py --iterations 50
+"""
+
+import argparse
+import statistics
+import time
+
+from _serving import load_app, random_rows, save_model, train_model
+
+BATCH_SIZES = [1, 50, 500, 5000]
+FEATURES = ["sepal_length_cm", "sepal_width_cm", "petal_length_cm", "petal_width_cm"]
+
+
+def _time_requests(client, url, payload, iterations):
+    client.post(url, json=payload).raise_for_status()  # warm-up
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = client.post(url, json=payload)
+        timings.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    app = load_app(save_model(train_model("random_forest")))
+
+    print(f"{'batch':>6} {'path':>10} {'median ms':>10} {'rows/s':>10} {'speedup':>8}")
+    with TestClient(app) as client:
+        for n in args.batch_sizes:
+            rows = random_rows(n)
+            row_payload = {"instances": [dict(zip(FEATURES, r)) for r in rows.tolist()]}
+            column_payload = {col: rows[:, i].tolist() for i, col in enumerate(FEATURES)}
+
+            row_time = _time_requests(client, "/predict", row_payload, args.iterations)
+            col_time = _time_requests(client, "/predict:columnar", column_payload, args.iterations)
+
+            print(f"{n:>6} {'row':>10} {row_time * 1000:>10.2f} {n / row_time:>10.0f} {'':>8}")
+            print(f"{n:>6} {'columnar':>10} {col_time * 1000:>10.2f} {n / col_time:>10.0f} {row_time / col_time:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark: full vs compact prediction rows, bytes per row and worker CPU per row.
+
+Builds the rows the inference pipeline's prediction DoFns emit for
+iris-like entities, in each --output_format, and reports:
+  - bytes per row as BigQuery stores it (2 + UTF-8 bytes per STRING,
+    8 per FLOAT / TIMESTAMP value), as a tabledata.insertAll JSON payload,
+    and as the proto row AppendRows sends;
+  - worker CPU microseconds per row (time.process_time) to build the row,
+    to log it, and to encode it for the Storage Write API.
+Logging is measured against a handler writing to os.devnull, so it counts
+formatting and handler cost but not the Cloud Logging agent's: "every row"
+is the old logger.info(f"Row processed - {row}"), "sampled" a SampledLog
+logging one row in --sample-every.
+
+Usage:
+    python benchmarks/bench_prediction_rows.py
+    python benchmarks/bench_prediction_rows.py --rows 200000 --sample-every 100
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+from _dataflow import iris_features
+
+from dataflow.iris_inference_pipeline import OUTPUT_FORMATS, PREDICTION_SCHEMAS, _prediction_row
+from dataflow.utils.bigquery_storage_write import ProtoRowEncoder
+from dataflow.utils.sampled_log import SampledLog
+
+SERVICE_URL = "https://iris-classifier-xgboost-service-abc123-uc.a.run.app"
+MODEL_VERSION = "7"
+BQ_VALUE_BYTES = {"FLOAT": 8, "TIMESTAMP": 8}
+
+
+def _stored_bytes(row, schema):
+    """BigQuery's logical (billed storage) size of a row."""
+    size = 0
+    for field in schema["fields"]:
+        value = row.get(field["name"])
+        if value is None:
+            continue
+        values = value if field.get("mode") == "REPEATED" else [value]
+        if field["type"] == "STRING":
+            size += sum(2 + len(v.encode("utf-8")) for v in values)
+        else:
+            size += BQ_VALUE_BYTES[field["type"]] * len(values)
+    return size
+
+
+def _cpu_us_per_row(fn, items):
+    start = time.process_time()
+    for item in items:
+        fn(item)
+    return (time.process_time() - start) / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--sample-every", type=int, default=1000)
+    args = parser.parse_args()
+
+    elements = [
+        {"entity_id": entity_id, "timestamp": "2026-01-01T00:00:00.123456+00:00", **features}
+        for entity_id, features in iris_features(args.rows).items()
+    ]
+    logging.disable(logging.NOTSET)
+    row_logger = logging.getLogger("bench_prediction_rows")
+    row_logger.propagate = False
+    row_logger.setLevel(logging.INFO)
+    devnull = open(os.devnull, "w")
+    row_logger.addHandler(logging.StreamHandler(devnull))
+
+    print(f"{args.rows} rows")
+    print(f"{'format':<8} {'stored B':>9} {'JSON B':>7} {'proto B':>8} {'build us':>9} "
+          f"{'log every row us':>17} {'log sampled us':>15} {'encode us':>10}")
+    for output_format in OUTPUT_FORMATS:
+        schema = PREDICTION_SCHEMAS[output_format]
+        encoder = ProtoRowEncoder(schema)
+
+        def build(element):
+            return _prediction_row(element, "1", [0.05, 0.9, 0.05], SERVICE_URL, MODEL_VERSION, 0.0123, output_format)
+
+        build_us = _cpu_us_per_row(build, elements)
+        rows = [build(element) for element in elements]
+        for row in rows:
+            row["dataflow_processing_time"] = "2026-01-01T00:00:00.345678+00:00"
+        every_row_us = _cpu_us_per_row(lambda row: row_logger.info(f"Row processed - {row}"), rows)
+        sampled_us = _cpu_us_per_row(
+            SampledLog(row_logger, "Row processed", sample_every=args.sample_every).log, rows,
+        )
+        encode_us = _cpu_us_per_row(encoder.encode, rows)
+
+        stored = sum(_stored_bytes(row, schema) for row in rows) / len(rows)
+        json_bytes = sum(len(json.dumps({"json": row})) for row in rows) / len(rows)
+        proto_bytes = sum(len(encoder.encode(row)) for row in rows) / len(rows)
+        print(f"{output_format:<8} {stored:>9.0f} {json_bytes:>7.0f} {proto_bytes:>8.0f} {build_us:>9.2f} "
+              f"{every_row_us:>17.2f} {sampled_us:>15.2f} {encode_us:>10.2f}")
+    devnull.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Benchmark: schema rows with RowCoder vs dicts with PickleCoder / FastPrimitivesCoder.
+
+Builds --rows iris-like elements of each kind the pipelines shuffle (parsed
+Pub/Sub messages and requests, feature rows, scoring rows, prediction rows
+in both --output_format's) and reports, per element:
+  - bytes and encode/decode microseconds for the dict under PickleCoder
+    (what the stateful DoFns' PickleCoder state specs store) and
+    FastPrimitivesCoder (what Beam picks for an untyped or Dict[str, Any]
+    PCollection), and for the schema row under RowCoder;
+  - the microseconds to convert a dict to a row and back, which --schema_rows
+    adds around each shuffle.
+Then runs keyed elements through a GroupByKey on the DirectRunner, as dicts
+and as schema rows, and reports elements/s for each.
+
+Usage:
+    python benchmarks/bench_row_coders.py
+    python benchmarks/bench_row_coders.py --rows 200000 --pipeline-rows 50000
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, Tuple
+
+import apache_beam as beam
+from _dataflow import FEATURE_COLUMNS, iris_features
+from apache_beam.coders import FastPrimitivesCoder, PickleCoder
+
+from dataflow.models.row_schemas import IRIS_ROWS, to_dict, to_row
+
+TIMESTAMP = "2026-01-01T00:00:00.123456+00:00"
+SERVICE_URL = "https://iris-classifier-xgboost-service-abc123-uc.a.run.app"
+SNAKE_NAMES = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
+
+
+def _elements(n):
+    """{kind: (row type, [dict elements])} for n entities."""
+    entities = iris_features(n).items()
+    prediction = {"prediction": "1", "class_probabilities": [0.05, 0.9, 0.05], "prediction_timestamp": TIMESTAMP,
+                  "processing_time": 0.0123, "dataflow_processing_time": TIMESTAMP}
+    return {
+        "message": (IRIS_ROWS.message, [
+            {**{name: features[col] for name, col in zip(SNAKE_NAMES, FEATURE_COLUMNS)},
+             "timestamp": TIMESTAMP, "sample_id": i}
+            for i, (_, features) in enumerate(entities)
+        ]),
+        "request": (IRIS_ROWS.request, [{"entity_id": entity_id, "timestamp": TIMESTAMP} for entity_id, _ in entities]),
+        "feature_row": (IRIS_ROWS.feature_row, [
+            {**features, "species": None, "source": "streaming", "entity_id": entity_id,
+             "feature_timestamp": TIMESTAMP}
+            for entity_id, features in entities
+        ]),
+        "scoring_row": (IRIS_ROWS.scoring_row, [
+            {"entity_id": entity_id, "timestamp": TIMESTAMP, **features} for entity_id, features in entities
+        ]),
+        "prediction": (IRIS_ROWS.prediction, [
+            {"entity_id": entity_id, "features": json.dumps(features), "timestamp": TIMESTAMP,
+             "model_service": SERVICE_URL, **prediction}
+            for entity_id, features in entities
+        ]),
+        "compact_prediction": (IRIS_ROWS.compact_prediction, [
+            {"entity_id": entity_id, "feature_values": [features[col] for col in FEATURE_COLUMNS],
+             "timestamp": TIMESTAMP, "model_version": "7", **prediction}
+            for entity_id, features in entities
+        ]),
+    }
+
+
+def _us_per_item(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def _coder_costs(coder, items):
+    encoded = [coder.encode(item) for item in items]
+    return (
+        sum(map(len, encoded)) / len(items),
+        _us_per_item(coder.encode, items),
+        _us_per_item(coder.decode, encoded),
+    )
+
+
+def _grouped_per_sec(elements, row_type):
+    """Elements/s through Key by Entity -> GroupByKey on the DirectRunner, as dicts or as row_type."""
+    start = time.perf_counter()
+    with beam.Pipeline() as pipeline:
+        keyed = pipeline | beam.Create(elements, reshuffle=False)
+        if row_type is None:
+            keyed |= beam.Map(lambda e: (e["entity_id"], e)).with_output_types(Tuple[str, Dict[str, Any]])
+        else:
+            keyed |= beam.Map(lambda e: (e["entity_id"], to_row(e, row_type))).with_output_types(Tuple[str, row_type])
+        _ = keyed | beam.GroupByKey() | beam.Map(lambda kv: [to_dict(e) for e in kv[1]])
+    return len(elements) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--pipeline-rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{args.rows} elements of each kind; bytes, encode us, decode us per element")
+    print(f"{'kind':<19} {'pickle dict':>20} {'fast-primitives dict':>22} {'RowCoder row':>20} {'convert us':>11}")
+    for kind, (row_type, elements) in _elements(args.rows).items():
+        rows = [to_row(element, row_type) for element in elements]
+        costs = [
+            _coder_costs(PickleCoder(), elements),
+            _coder_costs(FastPrimitivesCoder(), elements),
+            _coder_costs(beam.coders.registry.get_coder(row_type), rows),
+        ]
+        convert_us = _us_per_item(lambda e: to_dict(to_row(e, row_type)), elements)
+        cells = [f"{size:>5.0f} {encode:>6.2f} {decode:>6.2f}" for size, encode, decode in costs]
+        print(f"{kind:<19} {cells[0]:>20} {cells[1]:>22} {cells[2]:>20} {convert_us:>11.2f}")
+
+    print(f"\n{args.pipeline_rows} keyed elements through a GroupByKey on the DirectRunner")
+    print(f"{'kind':<19} {'dicts/s':>9} {'rows/s':>9}")
+    for kind, (row_type, elements) in _elements(args.pipeline_rows).items():
+        if kind == "message":
+            continue
+        dicts = _grouped_per_sec(elements, None)
+        rows = _grouped_per_sec(elements, row_type)
+        print(f"{kind:<19} {dicts:>9.0f} {rows:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark: BatchCallFastAPIService with hedged requests and a circuit breaker.
+
+Two scenarios, each calling the DoFn's process() batch by batch as the
+inference pipeline does after "Batch for Prediction":
+  - slow tail: a fake /predict answering in --latency-ms, except for
+    --tail-fraction of calls that take --tail-ms longer. Reports per-batch
+    p50/p99 latency and calls sent, without and with hedging at
+    --hedge-percentile;
+  - outage: nothing listening, so every call fails. Reports the worker
+    seconds spent per batch before it is dead-lettered, without and with
+    the circuit breaker (--failure-threshold).
+
+Usage:
+    python benchmarks/bench_service_faults.py
+    python benchmarks/bench_service_faults.py --tail-fraction 0.02 --tail-ms 1000 --outage-batches 10
+"""
+
+import argparse
+import time
+
+import numpy as np
+from _dataflow import FEATURE_COLUMNS, batches, iris_features
+from apache_beam.transforms.window import GlobalWindow
+
+from dataflow.iris_inference_pipeline import BatchCallFastAPIService
+from dataflow.testing.fake_prediction_service import FakePredictionService
+
+
+def _per_batch_secs(dofn, input_batches):
+    """Seconds each process() call took."""
+    dofn.setup()
+    try:
+        seconds = []
+        dofn.start_bundle()
+        for batch in input_batches:
+            start = time.perf_counter()
+            list(dofn.process(batch, timestamp=0, window=GlobalWindow()))
+            seconds.append(time.perf_counter() - start)
+    finally:
+        dofn.teardown()
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batches", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=10.0)
+    parser.add_argument("--tail-fraction", type=float, default=0.05)
+    parser.add_argument("--tail-ms", type=float, default=300.0)
+    parser.add_argument("--hedge-percentile", type=float, default=95.0)
+    parser.add_argument("--outage-batches", type=int, default=3)
+    parser.add_argument("--failure-threshold", type=int, default=3)
+    args = parser.parse_args()
+
+    elements = [{"entity_id": e, **features} for e, features in iris_features(args.batches * args.batch_size).items()]
+    input_batches = batches(elements, args.batch_size)
+
+    print(f"slow tail: {args.batches} batches of {args.batch_size}, /predict {args.latency_ms}ms, "
+          f"{args.tail_fraction:.0%} of calls +{args.tail_ms}ms")
+    print(f"{'client':<24} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'calls':>7}")
+    for name, hedge_percentile in [("no hedging", None), (f"hedge at p{args.hedge_percentile:g}", args.hedge_percentile)]:
+        with FakePredictionService(
+            FEATURE_COLUMNS, latency_secs=args.latency_ms / 1000,
+            tail_fraction=args.tail_fraction, tail_latency_secs=args.tail_ms / 1000,
+        ) as service:
+            dofn = BatchCallFastAPIService(service.url, hedge_percentile=hedge_percentile)
+            seconds = _per_batch_secs(dofn, input_batches)
+        p50, p99, worst = np.percentile(seconds, [50, 99, 100]) * 1000
+        print(f"{name:<24} {p50:>8.1f} {p99:>8.1f} {worst:>8.1f} {service.requests:>7}")
+
+    print(f"\noutage: {args.outage_batches} batches against a service that refuses connections")
+    print(f"{'client':<24} {'s/batch':>8} {'total s':>8}")
+    for name, threshold in [("no breaker", 0), (f"breaker after {args.failure_threshold}", args.failure_threshold)]:
+        # Nothing listens on port 1
+        dofn = BatchCallFastAPIService("http://127.0.0.1:1", circuit_breaker_failure_threshold=threshold)
+        seconds = _per_batch_secs(dofn, input_batches[:args.outage_batches])
+        print(f"{name:<24} {np.mean(seconds):>8.3f} {sum(seconds):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
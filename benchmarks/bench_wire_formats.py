@@ -0,0 +1,95 @@
+"""Benchmark: /predict bytes on the wire and batch latency per encoding.
+
+Starts fastapi_server under uvicorn and posts the same feature batch as
+JSON (Vertex-style instances), msgpack and Arrow IPC, the three
+BatchCallFastAPIService --wire_format modes. Latency is end to end from the
+client's view: encode, HTTP round trip, server decode/predict/encode, and
+client decode.
+
+Usage:
+    python benchmarks/bench_wire_formats.py --batch-sizes 50 500 5000
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import aiohttp
+import numpy as np
+
+from _serving import random_rows, save_model, start_server, train_model
+
+from wire_format import JSON, WIRE_FORMATS, decode_response, encode_request
+
+FEATURE_COLUMNS = ["sepal_length_cm", "sepal_width_cm", "petal_length_cm", "petal_width_cm"]
+BATCH_SIZES = [50, 500, 5000]
+
+
+def _encode(rows, media):
+    """(body, headers) as BatchCallFastAPIService sends them."""
+    if media == JSON:
+        instances = [dict(zip(FEATURE_COLUMNS, row)) for row in rows.tolist()]
+        return json.dumps({"instances": instances}).encode(), {"Content-Type": JSON}
+    return encode_request(rows, FEATURE_COLUMNS, media), {"Content-Type": media, "Accept": media}
+
+
+def _decode(body, media):
+    if media == JSON:
+        predictions = json.loads(body)["predictions"]
+        return [p["class_"] for p in predictions]
+    classes, _ = decode_response(body, media)
+    return classes.tolist()
+
+
+async def _measure(session, url, rows, media, iterations):
+    timings = []
+    for i in range(iterations + 1):
+        start = time.perf_counter()
+        body, headers = _encode(rows, media)
+        async with session.post(url, data=body, headers=headers) as response:
+            response.raise_for_status()
+            response_body = await response.read()
+        classes = _decode(response_body, media)
+        if i:  # first call is warm-up
+            timings.append(time.perf_counter() - start)
+    return len(body), len(response_body), statistics.median(timings), classes
+
+
+async def _run(base_url, args):
+    url = f"{base_url}/predict"
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120)) as session:
+        for n in args.batch_sizes:
+            rows = random_rows(n).astype(np.float32)
+            reference = None
+            for name, media in WIRE_FORMATS.items():
+                request_bytes, response_bytes, latency, classes = await _measure(
+                    session, url, rows, media, args.iterations
+                )
+                if reference is None:
+                    reference = classes
+                assert classes == reference, f"{name} predictions differ from json"
+                print(
+                    f"{n:>6} {name:>8} {request_bytes:>11,} {response_bytes:>12,} "
+                    f"{request_bytes / n:>9.1f} {latency * 1000:>10.2f}"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    args = parser.parse_args()
+
+    proc, base_url = start_server(save_model(train_model("random_forest")))
+    try:
+        print(f"{'batch':>6} {'format':>8} {'req bytes':>11} {'resp bytes':>12} {'req B/row':>9} {'p50 ms':>10}")
+        asyncio.run(_run(base_url, args))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    main()
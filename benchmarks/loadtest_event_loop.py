@@ -0,0 +1,108 @@
+"""Load test: health-check and small-prediction latency while large batches are in flight.
+
+Starts fastapi_server under uvicorn once per INFERENCE_EXECUTOR mode, keeps
+--large-concurrency large /predict:columnar requests in flight, and probes
+/health/live and a 1-row /predict every --probe-interval-ms. With the inline
+executor the probes queue behind the large batches on the event loop; with
+the thread or process executor they should not.
+
+Usage:
+    python benchmarks/loadtest_event_loop.py --modes inline thread process
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import aiohttp
+
+from _serving import random_rows, save_model, start_server, train_model
+
+SMALL_PAYLOAD = {
+    "instances": [
+        {"sepal_length_cm": 5.1, "sepal_width_cm": 3.5, "petal_length_cm": 1.4, "petal_width_cm": 0.2}
+    ]
+}
+
+
+async def _keep_busy(session, url, payload, stop):
+    while not stop.is_set():
+        async with session.post(url, json=payload) as response:
+            await response.read()
+
+
+async def _probe(session, method, url, payload, stop, interval_secs):
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        async with session.request(method, url, json=payload) as response:
+            await response.read()
+            response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval_secs)
+    return latencies
+
+
+async def _run_load(base_url, args):
+    rows = random_rows(args.large_batch_size)
+    features = list(SMALL_PAYLOAD["instances"][0])
+    large_payload = {col: rows[:, i].tolist() for i, col in enumerate(features)}
+    interval = args.probe_interval_ms / 1000
+
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        stop = asyncio.Event()
+        busy = [
+            asyncio.create_task(_keep_busy(session, f"{base_url}/predict:columnar", large_payload, stop))
+            for _ in range(args.large_concurrency)
+        ]
+        await asyncio.sleep(0.5)
+        probes = asyncio.gather(
+            _probe(session, "GET", f"{base_url}/health/live", None, stop, interval),
+            _probe(session, "POST", f"{base_url}/predict", SMALL_PAYLOAD, stop, interval),
+        )
+        await asyncio.sleep(args.duration)
+        stop.set()
+        health, small = await probes
+        await asyncio.gather(*busy, return_exceptions=True)
+    return health, small
+
+
+def _percentiles_ms(latencies):
+    if len(latencies) < 2:
+        return float("nan"), float("nan")
+    cuts = statistics.quantiles(latencies, n=100)
+    return statistics.median(latencies) * 1000, cuts[98] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["inline", "thread", "process"])
+    parser.add_argument("--workers", type=int, default=0, help="INFERENCE_WORKERS (default: CPU limit)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per mode")
+    parser.add_argument("--large-batch-size", type=int, default=5000)
+    parser.add_argument("--large-concurrency", type=int, default=4)
+    parser.add_argument("--probe-interval-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    model_path = save_model(train_model("random_forest"))
+
+    print(f"{'mode':>8} {'probe':>8} {'n':>5} {'p50 ms':>9} {'p99 ms':>9}")
+    for mode in args.modes:
+        env = {"INFERENCE_EXECUTOR": mode}
+        if args.workers:
+            env["INFERENCE_WORKERS"] = args.workers
+        proc, base_url = start_server(model_path, **env)
+        try:
+            health, small = asyncio.run(_run_load(base_url, args))
+        finally:
+            proc.terminate()
+            proc.wait()
+        for name, latencies in (("health", health), ("predict1", small)):
+            p50, p99 = _percentiles_ms(latencies)
+            print(f"{mode:>8} {name:>8} {len(latencies):>5} {p50:>9.1f} {p99:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
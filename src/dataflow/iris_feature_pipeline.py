@@ -7,21 +7,29 @@ Reads from Pub/Sub, renames fields to canonical names, and dual-writes to:
 No model calls — this pipeline only persists features.
 """
 
-import json
 import argparse
 import logging
 import uuid
 from datetime import datetime, timezone
+from typing import Any, Dict, Tuple
 
 import apache_beam as beam
 from apache_beam.options.pipeline_options import GoogleCloudOptions, PipelineOptions
 from apache_beam.io import ReadFromPubSub, WriteToBigQuery
 from apache_beam.transforms.util import BatchElements
-from pydantic import ValidationError
 
 from dataflow.models.iris_schema import PubSubIrisMessage
-from dataflow.utils.online_store_writer import WriteToOnlineStore
+from dataflow.models.row_schemas import IrisFeatureRow, to_dict, to_row
+from dataflow.utils.bigquery_storage_write import (
+    STORAGE_WRITE_EXACTLY_ONCE,
+    STREAMING_INSERTS,
+    WRITE_METHODS,
+    WriteToBigQueryStorage,
+)
+from dataflow.utils.online_store_writer import CoalesceLatestByKey, WriteToOnlineStore
 from dataflow.utils.dead_letter import DEAD_LETTER_TAG, build_dead_letter, write_dead_letters
+from dataflow.utils.message_parser import VALIDATION, ParseError, ParseMessagesInBatches
+from dataflow.utils.sampled_log import SampledLog
 from ml_pipelines_kfp.log import get_logger
 
 logger = get_logger(__name__)
@@ -50,35 +58,30 @@ FEATURE_TABLE_SCHEMA = {
 }
 
 
-class ParsePubSubMessage(beam.DoFn):
-    """Parse and validate JSON message from Pub/Sub using Pydantic schema."""
+class ParsePubSubMessage(ParseMessagesInBatches):
+    """Parse and validate JSON messages from Pub/Sub against PubSubIrisMessage, batch_size at a time."""
 
-    def __init__(self):
+    def __init__(self, batch_size=500):
+        super().__init__(PubSubIrisMessage, batch_size)
         self.parse_success = beam.metrics.Metrics.counter("ParsePubSubMessage", "parse_success")
         self.parse_error = beam.metrics.Metrics.counter("ParsePubSubMessage", "parse_error")
         self.validation_error = beam.metrics.Metrics.counter("ParsePubSubMessage", "validation_error")
 
-    def process(self, element):
-        try:
-            message_data = json.loads(element.decode("utf-8"))
-            validated = PubSubIrisMessage(**message_data)
+    def _outputs(self, payload, parsed):
+        if not isinstance(parsed, ParseError):
             self.parse_success.inc()
-            yield validated.model_dump()
-
-        except ValidationError as e:
+            yield parsed
+            return
+        if parsed.error_type == VALIDATION:
             self.validation_error.inc()
-            logger.warning(f"Invalid message: {e}")
-            yield beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
-                pipeline="feature", stage="parse", error_type="validation",
-                error_message=e, original_message=element,
-            ))
-        except (json.JSONDecodeError, AttributeError) as e:
+            logger.warning(f"Invalid message: {parsed.error}")
+        else:
             self.parse_error.inc()
-            logger.error(f"Error parsing message: {e}, message: {element}")
-            yield beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
-                pipeline="feature", stage="parse", error_type="json_decode",
-                error_message=e, original_message=element,
-            ))
+            logger.error(f"Error parsing message: {parsed.error}, message: {payload}")
+        yield beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
+            pipeline="feature", stage="parse", error_type=parsed.error_type,
+            error_message=parsed.error, original_message=payload,
+        ))
 
 
 class MapToFeatureRow(beam.DoFn):
@@ -87,6 +90,9 @@ class MapToFeatureRow(beam.DoFn):
     def __init__(self):
         self.rows_mapped = beam.metrics.Metrics.counter("MapToFeatureRow", "rows_mapped")
 
+    def setup(self):
+        self._entity_log = SampledLog(logger, "Processing entity_id")
+
     def process(self, element):
         self.rows_mapped.inc()
         row = {
@@ -95,7 +101,7 @@ class MapToFeatureRow(beam.DoFn):
         }
 
         sample_id = element.get("sample_id") or uuid.uuid4().hex[:8]
-        logger.info(f"Processing entity_id: {sample_id}_streaming")
+        self._entity_log.log(f"{sample_id}_streaming")
         row["species"] = None
         row["source"] = "streaming"
         row["entity_id"] = f"{sample_id}_streaming"
@@ -120,12 +126,44 @@ def run_pipeline(argv=None):
     )
     parser.add_argument("--project_id", required=True, help="GCP project ID")
     parser.add_argument("--region", required=True, help="GCP Region")
+    parser.add_argument(
+        "--parse_batch_size",
+        type=int,
+        default=500,
+        help="Pub/Sub messages decoded and validated together within a bundle (default: 500)",
+    )
     parser.add_argument(
         "--online_batch_size",
         type=int,
         default=100,
         help="Max rows per online store write batch (default: 100)",
     )
+    parser.add_argument(
+        "--online_write_max_in_flight",
+        type=int,
+        default=4,
+        help="Online store write batches in flight per worker DoFn on its direct-write stream (default: 4)",
+    )
+    parser.add_argument(
+        "--online_write_max_retries",
+        type=int,
+        default=3,
+        help="Times a row whose online store write failed with a retryable status is written again "
+             "before it is dead-lettered (default: 3)",
+    )
+    parser.add_argument(
+        "--online_write_coalesce_secs",
+        type=float,
+        default=0,
+        help="Write only the latest row per entity_id seen within this many seconds to the online store; "
+             "the offline store still gets every row (default: 0, write every row)",
+    )
+    parser.add_argument(
+        "--schema_rows",
+        action="store_true",
+        help="Shuffle feature rows into the coalescing stage and the Storage Write API sink as "
+             "schema rows encoded by RowCoder instead of dicts",
+    )
     parser.add_argument(
         "--online_store_id",
         default="ml_online_store",
@@ -141,6 +179,19 @@ def run_pipeline(argv=None):
         default=None,
         help="BigQuery dead letter table (PROJECT:DATASET.TABLE). If unset, dead letters are logged only.",
     )
+    parser.add_argument(
+        "--bigquery_write_method",
+        choices=WRITE_METHODS,
+        default=STREAMING_INSERTS,
+        help="How feature rows and dead letters reach BigQuery: legacy streaming inserts or the "
+             "Storage Write API, which dead-letters rows the offline store refuses",
+    )
+    parser.add_argument(
+        "--storage_write_batch_size",
+        type=int,
+        default=500,
+        help="Rows per AppendRows request with a storage_write_* --bigquery_write_method (default: 500)",
+    )
     parser.add_argument(
         "--no_wait",
         action="store_true",
@@ -162,7 +213,7 @@ def run_pipeline(argv=None):
     parse_results = (
         p
         | "Read from Pub/Sub" >> ReadFromPubSub(topic=known_args.input_topic)
-        | "Parse JSON" >> beam.ParDo(ParsePubSubMessage()).with_outputs(
+        | "Parse JSON" >> beam.ParDo(ParsePubSubMessage(known_args.parse_batch_size)).with_outputs(
             DEAD_LETTER_TAG, main="parsed",
         )
     )
@@ -172,6 +223,7 @@ def run_pipeline(argv=None):
             parse_results[DEAD_LETTER_TAG],
             table=known_args.dead_letter_table,
             label_prefix="Parse",
+            method=known_args.bigquery_write_method,
         )
 
     feature_rows = (
@@ -179,15 +231,48 @@ def run_pipeline(argv=None):
         | "Map to Feature Row" >> beam.ParDo(MapToFeatureRow())
     )
 
-    feature_rows | "Write to BQ (Offline Store)" >> WriteToBigQuery(
-        table=known_args.output_table,
-        schema=FEATURE_TABLE_SCHEMA,
-        write_disposition=beam.io.BigQueryDisposition.WRITE_APPEND,
-        create_disposition=beam.io.BigQueryDisposition.CREATE_NEVER,
-    )
+    if known_args.bigquery_write_method == STREAMING_INSERTS:
+        feature_rows | "Write to BQ (Offline Store)" >> WriteToBigQuery(
+            table=known_args.output_table,
+            schema=FEATURE_TABLE_SCHEMA,
+            write_disposition=beam.io.BigQueryDisposition.WRITE_APPEND,
+            create_disposition=beam.io.BigQueryDisposition.CREATE_NEVER,
+        )
+    else:
+        offline_store_dead_letters = feature_rows | "Write to BQ (Offline Store)" >> WriteToBigQueryStorage(
+            table=known_args.output_table,
+            schema=FEATURE_TABLE_SCHEMA,
+            pipeline="feature",
+            exactly_once=known_args.bigquery_write_method == STORAGE_WRITE_EXACTLY_ONCE,
+            batch_size=known_args.storage_write_batch_size,
+            row_type=IrisFeatureRow if known_args.schema_rows else None,
+        )
+        if known_args.dead_letter_table:
+            write_dead_letters(
+                offline_store_dead_letters,
+                table=known_args.dead_letter_table,
+                label_prefix="Offline Store",
+                method=known_args.bigquery_write_method,
+            )
 
-    (
-        feature_rows
+    online_rows = feature_rows
+    if known_args.online_write_coalesce_secs > 0:
+        if known_args.schema_rows:
+            keyed_rows = feature_rows | "Key by Entity" >> beam.Map(
+                lambda row: (row["entity_id"], to_row(row, IrisFeatureRow))
+            ).with_output_types(Tuple[str, IrisFeatureRow])
+        else:
+            keyed_rows = feature_rows | "Key by Entity" >> beam.Map(
+                lambda row: (row["entity_id"], row)
+            ).with_output_types(Tuple[str, Dict[str, Any]])
+        online_rows = (
+            keyed_rows
+            | "Coalesce by Entity" >> beam.ParDo(CoalesceLatestByKey(known_args.online_write_coalesce_secs))
+            | "Rows to Dicts" >> beam.Map(to_dict)
+        )
+
+    online_store_results = (
+        online_rows
         | "Batch for Online Store"
         >> BatchElements(
             min_batch_size=1,
@@ -201,10 +286,20 @@ def run_pipeline(argv=None):
                 online_store_id=known_args.online_store_id,
                 feature_view_id=known_args.feature_view_id,
                 feature_columns=list(PUBSUB_TO_CANONICAL.values()),
+                max_in_flight_batches=known_args.online_write_max_in_flight,
+                max_retries=known_args.online_write_max_retries,
             )
-        )
+        ).with_outputs(DEAD_LETTER_TAG, main="written")
     )
 
+    if known_args.dead_letter_table:
+        write_dead_letters(
+            online_store_results[DEAD_LETTER_TAG],
+            table=known_args.dead_letter_table,
+            label_prefix="Online Store",
+            method=known_args.bigquery_write_method,
+        )
+
     result = p.run()
     if not known_args.no_wait:
         result.wait_until_finish()
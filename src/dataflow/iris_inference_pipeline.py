@@ -12,18 +12,54 @@ import json
 import argparse
 import asyncio
 import logging
+import shutil
+import tempfile
 from datetime import datetime, timezone
+import threading
 import time
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Tuple
 
 import aiohttp
 import apache_beam as beam
+import grpc
+import numpy as np
 from apache_beam.options.pipeline_options import GoogleCloudOptions, PipelineOptions
 from apache_beam.transforms.util import BatchElements
 from apache_beam.io import ReadFromPubSub, WriteToBigQuery
+from apache_beam.io.filesystems import FileSystems
 from apache_beam.io.gcp.bigquery import BigQueryWriteFn, RetryStrategy
-from dataflow.utils.online_store_reader import FetchFeaturesFromOnlineStore
+from apache_beam.utils.shared import Shared
+from apache_beam.utils.windowed_value import WindowedValue
+from dataflow.models.row_schemas import IrisCompactPrediction, IrisPrediction, IrisRequest, IrisScoringRow, to_row
+from dataflow.utils.online_store_reader import (
+    MISSING_FEATURES_TAG,
+    FetchFeaturesFromOnlineStore,
+    RetryMissingFeatures,
+)
+from dataflow.utils.adaptive_batching import DECREASE, INCREASE, AdaptiveBatchController
+from dataflow.utils.bigquery_storage_write import (
+    STORAGE_WRITE_EXACTLY_ONCE,
+    STREAMING_INSERTS,
+    WRITE_METHODS,
+    WriteToBigQueryStorage,
+)
+from dataflow.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
 from dataflow.utils.dead_letter import DEAD_LETTER_TAG, build_dead_letter, write_dead_letters
+from dataflow.utils.deferred_metrics import DeferredMetrics
+from dataflow.utils.hedging import LatencyWindow, hedged
+from dataflow.utils.message_parser import ParseError, ParseMessagesInBatches
+from dataflow.utils.sampled_log import SampledLog
+from ml_pipelines_kfp.grpc_inference import (
+    PREDICT_METHOD,
+    PREDICT_STREAM_METHOD,
+    decode_predict_response,
+    encode_predict_request,
+)
 from ml_pipelines_kfp.log import get_logger
+from ml_pipelines_kfp.model_adapter import load_adapter
+from ml_pipelines_kfp.wire_format import JSON, WIRE_FORMATS, decode_response, encode_request
 
 logger = get_logger(__name__)
 
@@ -32,6 +68,14 @@ REGION = "us-central1"
 MODEL_NAME = "Iris-Classifier-XGBoost"
 FASTAPI_SERVICE_NAME = "iris-classifier-xgboost-service"
 
+INFERENCE_MODES = ("service", "local")
+INFERENCE_TRANSPORTS = ("http", "grpc", "grpc_stream")
+OUTPUT_FORMATS = ("full", "compact")
+
+# Set by the FastAPI server on every /predict response
+MODEL_VERSION_HEADER = "X-Model-Version"
+UNKNOWN_MODEL_VERSION = "unknown"
+
 FEATURE_COLUMNS = [
     "sepal_length_cm",
     "sepal_width_cm",
@@ -53,75 +97,230 @@ PREDICTION_SCHEMA = {
     ]
 }
 
+# --output_format=compact: the features as typed values in FEATURE_COLUMNS
+# order instead of a JSON string, and the short model version id the service
+# answered with instead of its URL
+COMPACT_PREDICTION_SCHEMA = {
+    "fields": [
+        {"name": "entity_id", "type": "STRING", "mode": "REQUIRED"},
+        {"name": "feature_values", "type": "FLOAT", "mode": "REPEATED"},
+        {"name": "timestamp", "type": "TIMESTAMP", "mode": "REQUIRED"},
+        {"name": "prediction", "type": "STRING", "mode": "REQUIRED"},
+        {"name": "class_probabilities", "type": "FLOAT", "mode": "REPEATED"},
+        {"name": "prediction_timestamp", "type": "TIMESTAMP", "mode": "REQUIRED"},
+        {"name": "model_version", "type": "STRING", "mode": "REQUIRED"},
+        {"name": "processing_time", "type": "FLOAT", "mode": "NULLABLE"},
+        {"name": "dataflow_processing_time", "type": "TIMESTAMP", "mode": "REQUIRED"},
+    ]
+}
+
+PREDICTION_SCHEMAS = {"full": PREDICTION_SCHEMA, "compact": COMPACT_PREDICTION_SCHEMA}
+PREDICTION_ROW_TYPES = {"full": IrisPrediction, "compact": IrisCompactPrediction}
+
 
-class ParsePubSubMessage(beam.DoFn):
-    """Parse JSON message from Pub/Sub — only entity_id is required.
+def _prediction_row(element, predicted_class, class_probabilities, model_service, model_version, processing_time,
+                    output_format="full"):
+    """A PREDICTION_SCHEMAS[output_format] row (without dataflow_processing_time) for one scored element."""
+    now = datetime.now(timezone.utc).isoformat()
+    row = {
+        "entity_id": element["entity_id"],
+        "timestamp": element.get("timestamp", now),
+        "prediction": predicted_class,
+        "class_probabilities": class_probabilities,
+        "prediction_timestamp": now,
+        "processing_time": processing_time,
+    }
+    if output_format == "compact":
+        row["feature_values"] = [float(element[col]) for col in FEATURE_COLUMNS]
+        row["model_version"] = model_version
+    else:
+        row["features"] = json.dumps({col: element[col] for col in FEATURE_COLUMNS})
+        row["model_service"] = model_service
+    return row
+
+
+def _row_dicts(batch):
+    return [row._asdict() for row in batch]
+
+
+def _check_output_format(output_format):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output_format {output_format!r}, expected one of {list(OUTPUT_FORMATS)}")
+
+
+class ParsePubSubMessage(ParseMessagesInBatches):
+    """Parse JSON messages from Pub/Sub, batch_size at a time — only entity_id is required.
 
     Accepts messages with either 'entity_id' directly or 'sample_id'
     (converted to '{sample_id}_streaming' for backward compat with
     the feature ingestion pipeline's entity_id format).
     """
 
-    def __init__(self):
+    def __init__(self, batch_size=500):
+        super().__init__(batch_size=batch_size)
         self.parse_success = beam.metrics.Metrics.counter("ParsePubSubMessage", "parse_success")
         self.parse_error = beam.metrics.Metrics.counter("ParsePubSubMessage", "parse_error")
         self.missing_id = beam.metrics.Metrics.counter("ParsePubSubMessage", "missing_entity_id")
 
-    def process(self, element):
-        try:
-            message_data = json.loads(element.decode("utf-8"))
-
-            entity_id = message_data.get("entity_id")
-            if not entity_id:
-                sample_id = message_data.get("sample_id")
-                if sample_id is not None:
-                    entity_id = f"{sample_id}_streaming"
-                    logger.info(f"Entity Id scored = {entity_id}")
-                else:
-                    self.missing_id.inc()
-                    logger.warning(f"Message missing entity_id and sample_id: {message_data}")
-                    yield beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
-                        pipeline="inference", stage="parse", error_type="missing_field",
-                        error_message="Message missing entity_id and sample_id",
-                        original_message=element,
-                    ))
-                    return
-
-            self.parse_success.inc()
-            yield {
-                "entity_id": entity_id,
-                "timestamp": message_data.get("timestamp"),
-            }
-
-        except (json.JSONDecodeError, AttributeError) as e:
+    def setup(self):
+        super().setup()
+        self._id_log = SampledLog(logger, "Entity Id scored")
+
+    def _outputs(self, payload, parsed):
+        if isinstance(parsed, ParseError):
             self.parse_error.inc()
-            logger.error(f"Error parsing message: {e}, message: {element}")
+            logger.error(f"Error parsing message: {parsed.error}, message: {payload}")
             yield beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
-                pipeline="inference", stage="parse", error_type="json_decode",
-                error_message=e, original_message=element,
+                pipeline="inference", stage="parse", error_type=parsed.error_type,
+                error_message=parsed.error, original_message=payload,
             ))
+            return
+
+        entity_id = parsed.get("entity_id")
+        if not entity_id:
+            sample_id = parsed.get("sample_id")
+            if sample_id is None:
+                self.missing_id.inc()
+                logger.warning(f"Message missing entity_id and sample_id: {parsed}")
+                yield beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
+                    pipeline="inference", stage="parse", error_type="missing_field",
+                    error_message="Message missing entity_id and sample_id",
+                    original_message=payload,
+                ))
+                return
+            entity_id = f"{sample_id}_streaming"
+            self._id_log.log(entity_id)
+
+        self.parse_success.inc()
+        yield {
+            "entity_id": entity_id,
+            "timestamp": parsed.get("timestamp"),
+        }
 
 
 class BatchCallFastAPIService(beam.DoFn):
-    """Call FastAPI with a batch of instances using async HTTP."""
+    """Call FastAPI with a batch of instances using async HTTP.
+
+    wire_format selects the /predict body encoding: "json" (Vertex-style
+    instances), or "msgpack" / "arrow" for compact binary feature matrices
+    (see ml_pipelines_kfp/wire_format.py).
+
+    With an AdaptiveBatchController each incoming batch is split into calls
+    of the controller's target batch size, with up to its target concurrency
+    in flight; every call's latency and retryable failures feed back into
+    those targets, which are exported as the target_batch_size and
+    target_concurrency gauges. The incoming batch size is the upper bound.
+
+    With max_in_flight_batches > 1 the calls run on an event loop in a
+    background thread instead of blocking process() on each batch: up to
+    that many batches are in flight at once, and process() blocks only while
+    the queue is full (backpressure, counted in backpressure_wait_ms).
+    Results are emitted, in their input batch's window and timestamp, by
+    whichever process() call finds them settled, or by finish_bundle, since
+    Beam must receive a bundle's outputs before it commits.
+
+    With circuit_breaker_failure_threshold > 0, a CircuitBreaker shared by
+    the step's DoFn instances on a worker opens after that many consecutive
+    failed calls. While it is open, batches go straight to dead letters
+    (error_type "circuit_open") instead of sleeping through their retries;
+    after circuit_breaker_reset_secs one probe call decides whether it
+    closes again. Transitions are counted in circuit_opened,
+    circuit_half_opened and circuit_closed, refused rows in circuit_rejected.
+
+    With hedge_percentile set (e.g. 95), a call still unanswered after that
+    percentile of the DoFn's recent call latencies (at least
+    hedge_min_delay_ms) is sent a second time and the first answer wins;
+    hedge_sent and hedge_won count the duplicates and the ones that beat the
+    original. Calls are not hedged while the breaker is not closed.
+
+    output_format "full" writes PREDICTION_SCHEMA rows; "compact" writes
+    COMPACT_PREDICTION_SCHEMA rows, with the model version the service
+    reports in its X-Model-Version header. Output rows are logged through a
+    SampledLog, one in every row_log_sample_every (0: only the periodic
+    counts).
+    """
 
     MAX_RETRIES = 3
     RETRY_BACKOFF_BASE = 2
 
-    def __init__(self, service_url, max_concurrent=4):
+    def __init__(self, service_url, max_concurrent=4, wire_format="json", controller=None,
+                 max_in_flight_batches=1, circuit_breaker_failure_threshold=0, circuit_breaker_reset_secs=30.0,
+                 hedge_percentile=None, hedge_min_delay_ms=10.0, output_format="full", row_log_sample_every=1000):
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(f"Unknown wire_format {wire_format!r}, expected one of {list(WIRE_FORMATS)}")
+        if max_in_flight_batches < 1:
+            raise ValueError(f"max_in_flight_batches must be >= 1, got {max_in_flight_batches}")
+        _check_output_format(output_format)
         self.service_url = service_url
         self.predict_url = f"{service_url}/predict"
-        self.max_concurrent = max_concurrent
+        self.controller = controller
+        self.max_in_flight_batches = max_in_flight_batches
+        self.max_concurrent = max(
+            max_concurrent, max_in_flight_batches, controller.max_concurrency if controller else 1,
+        )
+        if hedge_percentile is not None:
+            # Room for a hedge next to every call
+            self.max_concurrent *= 2
+        self.circuit_breaker_failure_threshold = circuit_breaker_failure_threshold
+        self.circuit_breaker_reset_secs = circuit_breaker_reset_secs
+        self._shared_breaker = Shared() if circuit_breaker_failure_threshold > 0 else None
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay_ms = hedge_min_delay_ms
+        self.output_format = output_format
+        self.row_log_sample_every = row_log_sample_every
+        self.media_type = WIRE_FORMATS[wire_format]
         self.prediction_success = beam.metrics.Metrics.counter("BatchCallFastAPIService", "prediction_success")
         self.prediction_error = beam.metrics.Metrics.counter("BatchCallFastAPIService", "prediction_error")
         self.prediction_retry = beam.metrics.Metrics.counter("BatchCallFastAPIService", "prediction_retry")
         self.prediction_latency = beam.metrics.Metrics.distribution("BatchCallFastAPIService", "prediction_latency_ms")
         self.batch_size = beam.metrics.Metrics.distribution("BatchCallFastAPIService", "batch_size")
+        self.target_batch_size = beam.metrics.Metrics.gauge("BatchCallFastAPIService", "target_batch_size")
+        self.target_concurrency = beam.metrics.Metrics.gauge("BatchCallFastAPIService", "target_concurrency")
+        self.target_increase = beam.metrics.Metrics.counter("BatchCallFastAPIService", "target_increase")
+        self.target_decrease = beam.metrics.Metrics.counter("BatchCallFastAPIService", "target_decrease")
+        self.in_flight_batches = beam.metrics.Metrics.distribution("BatchCallFastAPIService", "in_flight_batches")
+        self.backpressure_wait = beam.metrics.Metrics.distribution("BatchCallFastAPIService", "backpressure_wait_ms")
+        self.circuit_opened = beam.metrics.Metrics.counter("BatchCallFastAPIService", "circuit_opened")
+        self.circuit_half_opened = beam.metrics.Metrics.counter("BatchCallFastAPIService", "circuit_half_opened")
+        self.circuit_closed = beam.metrics.Metrics.counter("BatchCallFastAPIService", "circuit_closed")
+        self.circuit_rejected = beam.metrics.Metrics.counter("BatchCallFastAPIService", "circuit_rejected")
+        self.hedge_sent = beam.metrics.Metrics.counter("BatchCallFastAPIService", "hedge_sent")
+        self.hedge_won = beam.metrics.Metrics.counter("BatchCallFastAPIService", "hedge_won")
+        self.hedge_delay = beam.metrics.Metrics.distribution("BatchCallFastAPIService", "hedge_delay_ms")
 
     def setup(self):
+        self._start_loop()
+        self._session = self._run(self._create_session())
+
+    def _start_loop(self):
+        self._breaker = self._shared_breaker.acquire(self._create_breaker) if self._shared_breaker else None
+        self._latencies = LatencyWindow()
+        self._row_log = SampledLog(logger, "Row processed", sample_every=self.row_log_sample_every)
         self._loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self._loop)
-        self._session = self._loop.run_until_complete(self._create_session())
+        self._loop_thread = None
+        if self.max_in_flight_batches == 1:
+            asyncio.set_event_loop(self._loop)
+            return
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name="predict-loop", daemon=True)
+        self._loop_thread.start()
+        # Calls update metrics on the loop thread; process() replays them on the bundle thread
+        self._deferred_metrics = DeferredMetrics()
+        self._deferred_metrics.wrap_all(self)
+
+    def _create_breaker(self):
+        return CircuitBreaker(self.circuit_breaker_failure_threshold, self.circuit_breaker_reset_secs)
+
+    def _run(self, coro):
+        """Run coro on self._loop from the bundle thread and return its result."""
+        if self._loop_thread is None:
+            return self._loop.run_until_complete(coro)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _stop_loop(self):
+        if self._loop_thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+        self._loop.close()
 
     async def _create_session(self):
         connector = aiohttp.TCPConnector(limit=self.max_concurrent)
@@ -131,61 +330,200 @@ class BatchCallFastAPIService(beam.DoFn):
         return aiohttp.ClientSession(connector=connector, timeout=timeout)
 
     def teardown(self):
-        self._loop.run_until_complete(self._session.close())
-        self._loop.close()
+        self._run(self._session.close())
+        self._stop_loop()
 
-    def process(self, batch):
-        results, dead_letters = self._loop.run_until_complete(self._call_async(batch))
-        yield from results
-        for dl in dead_letters:
-            yield beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, dl)
+    def start_bundle(self):
+        # (concurrent future, timestamp, window) per in-flight batch, oldest first
+        self._in_flight = []
+
+    def process(self, batch, timestamp=beam.DoFn.TimestampParam, window=beam.DoFn.WindowParam):
+        if self._loop_thread is None:
+            results, dead_letters = self._loop.run_until_complete(self._predict(batch))
+            yield from results
+            for dl in dead_letters:
+                yield beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, dl)
+            return
+
+        if len(self._in_flight) >= self.max_in_flight_batches:
+            wait_start = time.monotonic()
+            futures.wait([future for future, _, _ in self._in_flight], return_when=futures.FIRST_COMPLETED)
+            self.backpressure_wait.update(int((time.monotonic() - wait_start) * 1000))
+        future = asyncio.run_coroutine_threadsafe(self._predict(batch), self._loop)
+        self._in_flight.append((future, timestamp, window))
+        self.in_flight_batches.update(len(self._in_flight))
+        self._in_flight, outputs = _settled_outputs(self._in_flight)
+        self._deferred_metrics.flush()
+        yield from outputs
+
+    def finish_bundle(self):
+        if self._loop_thread is None or not self._in_flight:
+            return
+        futures.wait([future for future, _, _ in self._in_flight])
+        self._in_flight, outputs = _settled_outputs(self._in_flight)
+        self._deferred_metrics.flush()
+        yield from outputs
+
+    async def _predict(self, batch):
+        """(rows, dead letters) for batch: one call, or controller-sized calls with a controller."""
+        if self.controller is None:
+            return await self._call_async(batch)
+        results, dead_letters = [], []
+        in_flight = set()
+        start = 0
+        while start < len(batch) or in_flight:
+            while start < len(batch) and len(in_flight) < self.controller.concurrency:
+                chunk = batch[start:start + self.controller.batch_size]
+                start += len(chunk)
+                in_flight.add(asyncio.ensure_future(self._call_async(chunk)))
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for call in done:
+                chunk_results, chunk_dead_letters = call.result()
+                results.extend(chunk_results)
+                dead_letters.extend(chunk_dead_letters)
+        return results, dead_letters
+
+    def _observe(self, generation, attempt_start, failed=False):
+        """Feed one call attempt's outcome to the controller and export its targets."""
+        if self.controller is None:
+            return
+        latency_ms = (time.monotonic() - attempt_start) * 1000
+        decision = self.controller.record(generation, latency_ms, failed)
+        if decision == INCREASE:
+            self.target_increase.inc()
+        elif decision == DECREASE:
+            self.target_decrease.inc()
+        self.target_batch_size.set(self.controller.batch_size)
+        self.target_concurrency.set(self.controller.concurrency)
+
+    def _allow_request(self):
+        if self._breaker is None:
+            return True
+        allowed, transition = self._breaker.allow_request()
+        self._count_transition(transition)
+        return allowed
+
+    def _record_outcome(self, failed):
+        if self._breaker is not None:
+            self._count_transition(self._breaker.record_failure() if failed else self._breaker.record_success())
+
+    def _release_request(self):
+        if self._breaker is not None:
+            self._breaker.release()
+
+    def _count_transition(self, state):
+        if state is None:
+            return
+        {OPEN: self.circuit_opened, HALF_OPEN: self.circuit_half_opened, CLOSED: self.circuit_closed}[state].inc()
+        logger.warning(f"Circuit breaker for {self.service_url} is now {state}")
+
+    async def _send_hedged(self, request):
+        """_send's (predictions, model version), duplicated after the hedge delay while the breaker is closed."""
+        if self.hedge_percentile is None:
+            return await self._send(request)
+        delay_ms = self._latencies.percentile(self.hedge_percentile)
+        if delay_ms is not None and (self._breaker is None or self._breaker.state == CLOSED):
+            delay_ms = max(delay_ms, self.hedge_min_delay_ms)
+            self.hedge_delay.update(int(delay_ms))
+        else:
+            delay_ms = None
+        start = time.monotonic()
+        result, hedge_won = await hedged(
+            lambda: self._send(request), None if delay_ms is None else delay_ms / 1000, on_hedge=self.hedge_sent.inc,
+        )
+        self._latencies.record((time.monotonic() - start) * 1000)
+        if hedge_won:
+            self.hedge_won.inc()
+        return result
+
+    def _encode_batch(self, batch):
+        """Keyword arguments for session.post carrying the batch in self.media_type."""
+        if self.media_type == JSON:
+            instances = [
+                {col: e[col] for col in FEATURE_COLUMNS}
+                for e in batch
+            ]
+            return {"json": {"instances": instances}}
+        X = np.array([[e[col] for col in FEATURE_COLUMNS] for e in batch], dtype=np.float32)
+        return {
+            "data": encode_request(X, FEATURE_COLUMNS, self.media_type),
+            "headers": {"Content-Type": self.media_type, "Accept": self.media_type},
+        }
+
+    async def _read_predictions(self, response):
+        """Response body as a list of {"class_", "class_probabilities"} dicts."""
+        if self.media_type == JSON:
+            result_data = await response.json()
+            return result_data.get("predictions", [])
+        classes, probabilities = decode_response(await response.read(), self.media_type)
+        return [
+            {"class_": int(cls), "class_probabilities": proba.tolist()}
+            for cls, proba in zip(classes, probabilities)
+        ]
+
+    async def _send(self, request):
+        """One prediction call for an encoded batch: (_read_predictions' dicts, model version)."""
+        async with self._session.post(self.predict_url, **request) as response:
+            response.raise_for_status()
+            model_version = response.headers.get(MODEL_VERSION_HEADER, UNKNOWN_MODEL_VERSION)
+            return await self._read_predictions(response), model_version
+
+    def _is_retryable(self, error):
+        """Whether error says the service is unhealthy: a 5xx or 429, a connection error or a timeout.
+
+        Any other 4xx is the batch's own problem and is not retried.
+        """
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status >= 500 or error.status == 429
+        return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
 
     async def _call_async(self, batch):
         start_time = time.time()
         self.batch_size.update(len(batch))
 
-        instances = [
-            {col: e[col] for col in FEATURE_COLUMNS}
-            for e in batch
-        ]
+        request = self._encode_batch(batch)
 
         last_error = None
         retry_count = 0
         for attempt in range(self.MAX_RETRIES):
+            if not self._allow_request():
+                last_error = CircuitOpenError(f"Circuit breaker for {self.service_url} is open")
+                self.circuit_rejected.inc(len(batch))
+                break
+            generation = self.controller.generation if self.controller else None
+            attempt_start = time.monotonic()
             try:
-                async with self._session.post(
-                    self.predict_url,
-                    json={"instances": instances},
-                ) as response:
-                    response.raise_for_status()
-                    result_data = await response.json()
-
-                predictions = result_data.get("predictions", [])
+                predictions, model_version = await self._send_hedged(request)
+                self._observe(generation, attempt_start)
+                self._record_outcome(failed=False)
+
                 processing_time = time.time() - start_time
 
                 self.prediction_latency.update(int(processing_time * 1000))
                 self.prediction_success.inc(len(predictions))
 
-                results = []
-                for element, pred in zip(batch, predictions):
-                    predicted_class = str(pred.get("class_", "unknown"))
-                    features = {col: element[col] for col in FEATURE_COLUMNS}
-                    row = {
-                        "entity_id": element["entity_id"],
-                        "features": json.dumps(features),
-                        "timestamp": element.get("timestamp", datetime.now(timezone.utc).isoformat()),
-                        "prediction": predicted_class,
-                        "class_probabilities": pred.get("class_probabilities", []),
-                        "prediction_timestamp": datetime.now(timezone.utc).isoformat(),
-                        "model_service": self.service_url,
-                        "processing_time": processing_time / len(batch),
-                    }
-                    logger.info(f"Row processed - {row}")
-                    results.append(row)
+                results = [
+                    _prediction_row(
+                        element, str(pred.get("class_", "unknown")), pred.get("class_probabilities", []),
+                        self.service_url, model_version, processing_time / len(batch), self.output_format,
+                    )
+                    for element, pred in zip(batch, predictions)
+                ]
+                for row in results:
+                    self._row_log.log(row)
                 return results, []
 
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            except Exception as e:
                 last_error = e
+                if not self._is_retryable(e):
+                    # The service answered; the batch itself is the problem, which says nothing about the
+                    # service's health either way, for the breaker or the controller
+                    self._release_request()
+                    break
+                self._observe(generation, attempt_start, failed=True)
+                self._record_outcome(failed=True)
+                if self._breaker is not None and self._breaker.state == OPEN:
+                    break
                 retry_count += 1
                 self.prediction_retry.inc()
                 wait = self.RETRY_BACKOFF_BASE ** attempt
@@ -194,13 +532,17 @@ class BatchCallFastAPIService(beam.DoFn):
                     f"failed ({len(batch)} instances): {e}. Retrying in {wait}s..."
                 )
                 await asyncio.sleep(wait)
-            except Exception as e:
-                last_error = e
-                break
 
         self.prediction_error.inc(len(batch))
         logging.error(f"Batch prediction failed after retries ({len(batch)} instances): {last_error}")
-        error_type = "timeout" if isinstance(last_error, asyncio.TimeoutError) else "connection"
+        if isinstance(last_error, CircuitOpenError):
+            error_type = "circuit_open"
+        elif isinstance(last_error, aiohttp.ClientResponseError) and not self._is_retryable(last_error):
+            error_type = "client_error"
+        elif isinstance(last_error, asyncio.TimeoutError):
+            error_type = "timeout"
+        else:
+            error_type = "connection"
         dead_letters = [
             build_dead_letter(
                 pipeline="inference", stage="predict", error_type=error_type,
@@ -212,6 +554,325 @@ class BatchCallFastAPIService(beam.DoFn):
         return [], dead_letters
 
 
+def _settled_outputs(pending):
+    """Split (future, timestamp, window) prediction calls into those still running and the outputs of the rest.
+
+    Works for asyncio and concurrent.futures futures alike; each finished
+    call's rows and dead letters become WindowedValues in its batch's window.
+    """
+    running, outputs = [], []
+    for future, timestamp, window in pending:
+        if not future.done():
+            running.append((future, timestamp, window))
+            continue
+        results, dead_letters = future.result()
+        outputs.extend(WindowedValue(row, timestamp, (window,)) for row in results)
+        outputs.extend(
+            beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, WindowedValue(dl, timestamp, (window,)))
+            for dl in dead_letters
+        )
+    return running, outputs
+
+
+class StreamPredictionError(Exception):
+    """An error message answering one request on a PredictStream."""
+
+    def __init__(self, code, detail):
+        super().__init__(f"{code}: {detail}")
+        self.code = code
+
+
+class BatchCallGrpcService(BatchCallFastAPIService):
+    """Call the FastAPI container's gRPC inference service with a batch of instances.
+
+    Same output rows, retries and dead letters as BatchCallFastAPIService.
+    With streaming=False each batch is a unary Predict call; with
+    streaming=True the DoFn instance keeps one PredictStream open for its
+    lifetime and matches responses to batches by request_id. A stream the
+    server or network breaks is reopened on the next attempt.
+    """
+
+    RETRYABLE_CODES = frozenset({"UNAVAILABLE", "DEADLINE_EXCEEDED", "RESOURCE_EXHAUSTED"})
+    TIMEOUT_SECS = 30
+    CHANNEL_OPTIONS = [
+        ("grpc.keepalive_time_ms", 30_000),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.max_receive_message_length", 32 * 1024 * 1024),
+        ("grpc.max_send_message_length", 32 * 1024 * 1024),
+    ]
+
+    def __init__(self, target, streaming=False, max_concurrent=4, controller=None, max_in_flight_batches=1,
+                 circuit_breaker_failure_threshold=0, circuit_breaker_reset_secs=30.0,
+                 hedge_percentile=None, hedge_min_delay_ms=10.0, output_format="full", row_log_sample_every=1000):
+        super().__init__(
+            f"grpc://{target}", max_concurrent=max_concurrent, wire_format="msgpack",
+            controller=controller, max_in_flight_batches=max_in_flight_batches,
+            circuit_breaker_failure_threshold=circuit_breaker_failure_threshold,
+            circuit_breaker_reset_secs=circuit_breaker_reset_secs,
+            hedge_percentile=hedge_percentile, hedge_min_delay_ms=hedge_min_delay_ms,
+            output_format=output_format, row_log_sample_every=row_log_sample_every,
+        )
+        self.target = target
+        self.streaming = streaming
+
+    def setup(self):
+        self._start_loop()
+        self._run(self._open_channel())
+
+    async def _open_channel(self):
+        # grpc.aio binds the channel to the running loop, so create it on self._loop
+        self._channel = grpc.aio.insecure_channel(self.target, options=self.CHANNEL_OPTIONS)
+        self._predict_unary = self._channel.unary_unary(PREDICT_METHOD)
+        self._predict_stream = self._channel.stream_stream(PREDICT_STREAM_METHOD)
+        self._stream = None
+        self._pending = {}
+        self._next_request_id = 0
+
+    def teardown(self):
+        self._run(self._close_channel())
+        self._stop_loop()
+
+    async def _close_channel(self):
+        if self._stream is not None:
+            self._stream.cancel()
+        await self._channel.close()
+
+    def _encode_batch(self, batch):
+        return np.array([[e[col] for col in FEATURE_COLUMNS] for e in batch], dtype=np.float32)
+
+    async def _send(self, X):
+        self._next_request_id += 1
+        body = encode_predict_request(X, FEATURE_COLUMNS, request_id=self._next_request_id)
+        if self.streaming:
+            message = await self._send_on_stream(self._next_request_id, body)
+        else:
+            message = decode_predict_response(await self._predict_unary(body, timeout=self.TIMEOUT_SECS))
+        if "error" in message:
+            raise StreamPredictionError(message["code"], message["error"])
+        predictions = [
+            {"class_": int(cls), "class_probabilities": proba.tolist()}
+            for cls, proba in zip(message["predictions"], message["class_probabilities"])
+        ]
+        return predictions, message.get("model_version") or UNKNOWN_MODEL_VERSION
+
+    async def _send_on_stream(self, request_id, body):
+        if self._stream is None:
+            self._stream = self._predict_stream()
+            asyncio.ensure_future(self._read_stream(self._stream))
+        stream = self._stream
+        response = self._loop.create_future()
+        self._pending[request_id] = response
+        try:
+            await stream.write(body)
+            return await asyncio.wait_for(response, self.TIMEOUT_SECS)
+        except Exception:
+            if stream.done() and self._stream is stream:
+                self._stream = None
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+            # A failed write may leave the reader's exception on the future unobserved
+            if response.done() and not response.cancelled():
+                response.exception()
+
+    async def _read_stream(self, stream):
+        error = ConnectionError("PredictStream closed by the server")
+        try:
+            async for body in stream:
+                message = decode_predict_response(body)
+                response = self._pending.get(message["request_id"])
+                if response is not None and not response.done():
+                    response.set_result(message)
+        except grpc.aio.AioRpcError as e:
+            error = e
+        except asyncio.CancelledError:
+            return
+        if self._stream is stream:
+            self._stream = None
+        for response in self._pending.values():
+            if not response.done():
+                response.set_exception(error)
+
+    def _is_retryable(self, error):
+        if isinstance(error, grpc.aio.AioRpcError):
+            return error.code().name in self.RETRYABLE_CODES
+        if isinstance(error, StreamPredictionError):
+            return error.code in self.RETRYABLE_CODES
+        return isinstance(error, (ConnectionError, asyncio.TimeoutError))
+
+
+class FetchAndPredict(beam.DoFn):
+    """Fetch features for a batch and send the fetched subset straight to the model service.
+
+    Fuses a FetchFeaturesFromOnlineStore and a BatchCallFastAPIService (or
+    BatchCallGrpcService) into one step, so fetched elements skip the second
+    BatchElements and its buffering window and shuffle. Both wrapped DoFns
+    keep their own metrics, retries and dead letters; missing-feature
+    elements still leave under MISSING_FEATURES_TAG with defer_missing.
+
+    The prediction call for one batch runs on the predict DoFn's event loop
+    while later batches' features are fetched: lookups run on a pool of
+    fetch_fn.max_concurrency threads awaited from that loop, and fetch
+    backoffs are awaited rather than slept. Once more than
+    max_pending_batches calls are unanswered, process() waits for the
+    oldest. Predictions are emitted, in the window and timestamp of the
+    batch they belong to, as their calls settle or in finish_bundle.
+    """
+
+    def __init__(self, fetch_fn, predict_fn, max_pending_batches=2):
+        if max_pending_batches < 1:
+            raise ValueError(f"max_pending_batches must be >= 1, got {max_pending_batches}")
+        if predict_fn.max_in_flight_batches != 1:
+            raise ValueError("FetchAndPredict keeps its own calls in flight; predict_fn needs max_in_flight_batches=1")
+        self.fetch_fn = fetch_fn
+        self.predict_fn = predict_fn
+        self.max_pending_batches = max_pending_batches
+        self.pending_batches = beam.metrics.Metrics.distribution("FetchAndPredict", "pending_batches")
+
+    def setup(self):
+        self.fetch_fn.setup()
+        self.predict_fn.setup()
+        self._loop = self.predict_fn._loop
+        self._fetch_pool = ThreadPoolExecutor(self.fetch_fn.max_concurrency)
+
+    def teardown(self):
+        if getattr(self, "_fetch_pool", None) is not None:
+            self._fetch_pool.shutdown(wait=False, cancel_futures=True)
+        self.predict_fn.teardown()
+        self.fetch_fn.teardown()
+
+    def start_bundle(self):
+        # (prediction task, timestamp, window) per batch, oldest first
+        self._pending = []
+
+    def process(self, batch, timestamp=beam.DoFn.TimestampParam, window=beam.DoFn.WindowParam):
+        fetched = []
+        for result in self._loop.run_until_complete(self._fetch(batch)):
+            if isinstance(result, beam.pvalue.TaggedOutput):
+                yield result
+            else:
+                fetched.append(result)
+        if fetched:
+            task = self._loop.create_task(self.predict_fn._predict(fetched))
+            self._pending.append((task, timestamp, window))
+        self.pending_batches.update(len(self._pending))
+        if len(self._pending) > self.max_pending_batches:
+            self._loop.run_until_complete(asyncio.wait([self._pending[0][0]]))
+        self._pending, outputs = _settled_outputs(self._pending)
+        yield from outputs
+
+    def finish_bundle(self):
+        if self._pending:
+            self._loop.run_until_complete(asyncio.wait([task for task, _, _ in self._pending]))
+        self._pending, outputs = _settled_outputs(self._pending)
+        yield from outputs
+
+    async def _fetch(self, batch):
+        """Enriched elements and fetch TaggedOutputs for batch, in batch order after cache hits."""
+        served, batch = self.fetch_fn.serve_from_cache(batch)
+        return served + await asyncio.gather(
+            *(self.fetch_fn.fetch_async(element, self._fetch_pool) for element in batch)
+        )
+
+
+class PredictWithLocalModel(beam.DoFn):
+    """Score batches in-process with the model.joblib at model_uri instead of calling FastAPI.
+
+    The model is downloaded and loaded once per worker process through a
+    Shared handle, and used by every instance of this DoFn there, via the
+    same ModelAdapter the FastAPI server scores with. Every
+    refresh_interval_secs (0 disables) an instance compares model_uri's
+    modification time and size with the loaded version's; after deploy.py
+    copies a new blessed model there, the first instance to notice loads it
+    and the rest pick it up on their next check. A failed check or reload
+    keeps the current model.
+
+    Output rows match BatchCallFastAPIService's, with model_service set to
+    model_uri and, in compact rows, model_version to the loaded version; a
+    batch the model fails on is dead-lettered.
+    """
+
+    def __init__(self, model_uri, refresh_interval_secs=300.0, output_format="full", row_log_sample_every=1000):
+        _check_output_format(output_format)
+        self.model_uri = model_uri
+        self.refresh_interval_secs = refresh_interval_secs
+        self.output_format = output_format
+        self.row_log_sample_every = row_log_sample_every
+        self._shared_model = Shared()
+        self.prediction_success = beam.metrics.Metrics.counter("PredictWithLocalModel", "prediction_success")
+        self.prediction_error = beam.metrics.Metrics.counter("PredictWithLocalModel", "prediction_error")
+        self.prediction_latency = beam.metrics.Metrics.distribution("PredictWithLocalModel", "prediction_latency_ms")
+        self.batch_size = beam.metrics.Metrics.distribution("PredictWithLocalModel", "batch_size")
+        self.model_reload = beam.metrics.Metrics.counter("PredictWithLocalModel", "model_reload")
+        self.model_refresh_error = beam.metrics.Metrics.counter("PredictWithLocalModel", "model_refresh_error")
+        self.model_load_latency = beam.metrics.Metrics.distribution("PredictWithLocalModel", "model_load_latency_ms")
+
+    def setup(self):
+        self._model_version = self._current_version()
+        self._model = self._shared_model.acquire(self._load_model, tag=self._model_version)
+        self._checked_at = time.monotonic()
+        self._row_log = SampledLog(logger, "Row processed", sample_every=self.row_log_sample_every)
+
+    def _current_version(self):
+        """model_uri's (modification time, size): changes whenever a new model is copied there."""
+        metadata = FileSystems.match([self.model_uri])[0].metadata_list
+        if not metadata:
+            raise FileNotFoundError(f"No model at {self.model_uri}")
+        return f"{metadata[0].last_updated_in_seconds}-{metadata[0].size_in_bytes}"
+
+    def _load_model(self):
+        start = time.monotonic()
+        with FileSystems.open(self.model_uri) as source, tempfile.NamedTemporaryFile(suffix=".joblib") as local:
+            shutil.copyfileobj(source, local)
+            local.flush()
+            model = load_adapter(local.name)
+        self.model_load_latency.update(int((time.monotonic() - start) * 1000))
+        logger.info(f"Loaded {type(model.estimator).__name__} from {self.model_uri} ({model.mode})")
+        return model
+
+    def _refresh_model(self):
+        self._checked_at = time.monotonic()
+        try:
+            version = self._current_version()
+            if version != self._model_version:
+                self._model = self._shared_model.acquire(self._load_model, tag=version)
+                self._model_version = version
+                self.model_reload.inc()
+        except Exception as e:
+            self.model_refresh_error.inc()
+            logger.warning(f"Model refresh from {self.model_uri} failed, keeping version {self._model_version}: {e}")
+
+    def process(self, batch):
+        if self.refresh_interval_secs > 0 and time.monotonic() - self._checked_at >= self.refresh_interval_secs:
+            self._refresh_model()
+
+        start_time = time.time()
+        self.batch_size.update(len(batch))
+        X = np.array([[e[col] for col in FEATURE_COLUMNS] for e in batch], dtype=np.float32)
+        try:
+            classes, probabilities = self._model.predict(X)
+        except Exception as e:
+            self.prediction_error.inc(len(batch))
+            logger.error(f"Local model prediction failed ({len(batch)} instances): {e}")
+            for element in batch:
+                yield beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
+                    pipeline="inference", stage="predict", error_type="model_error",
+                    error_message=e, entity_id=element["entity_id"],
+                ))
+            return
+
+        processing_time = time.time() - start_time
+        self.prediction_latency.update(int(processing_time * 1000))
+        self.prediction_success.inc(len(batch))
+        for element, cls, proba in zip(batch, classes, probabilities):
+            row = _prediction_row(
+                element, str(int(cls)), proba.tolist(), self.model_uri, self._model_version,
+                processing_time / len(batch), self.output_format,
+            )
+            self._row_log.log(row)
+            yield row
+
+
 class AddProcessingMetadata(beam.DoFn):
     """Add processing metadata to records."""
 
@@ -246,15 +907,109 @@ def run_pipeline(argv=None):
     )
     parser.add_argument("--project_id", required=True, help="Project ID")
     parser.add_argument("--region", required=True, help="GCP Region")
-    parser.add_argument("--service_url", required=True, help="FastAPI service URL")
+    parser.add_argument(
+        "--inference_mode", default="service", choices=INFERENCE_MODES,
+        help="service: call the FastAPI model service; local: score with --model_uri inside the workers",
+    )
+    parser.add_argument(
+        "--model_uri", default=None,
+        help="model.joblib scored with --inference_mode=local, e.g. the blessed copy deploy.py writes to "
+             f"gs://BUCKET/deployed-models/{FASTAPI_SERVICE_NAME}/model.joblib",
+    )
+    parser.add_argument(
+        "--model_refresh_interval_secs", type=float, default=300.0,
+        help="How often --inference_mode=local checks --model_uri for a new model; 0 disables",
+    )
+    parser.add_argument("--service_url", default=None, help="FastAPI service URL (--inference_transport=http)")
+    parser.add_argument(
+        "--inference_transport", default="http", choices=INFERENCE_TRANSPORTS,
+        help="http: /predict; grpc: unary Predict calls; grpc_stream: one PredictStream per worker DoFn",
+    )
+    parser.add_argument(
+        "--grpc_target", default=None,
+        help="host:port of the gRPC inference service (--inference_transport=grpc or grpc_stream)",
+    )
     parser.add_argument(
         "--batch_size", type=int, default=50,
         help="Max instances per /predict call",
     )
+    parser.add_argument(
+        "--parse_batch_size", type=int, default=500,
+        help="Pub/Sub messages decoded together within a bundle",
+    )
     parser.add_argument(
         "--max_batch_duration_secs", type=float, default=1.0,
         help="Max seconds to buffer a partial batch before flushing",
     )
+    parser.add_argument(
+        "--max_in_flight_batches", type=int, default=1,
+        help="Prediction calls each DoFn keeps in flight on a background event loop; "
+             "1 waits for each batch's call in process()",
+    )
+    parser.add_argument(
+        "--adaptive_batching", action="store_true",
+        help="Tune rows per prediction call (up to --batch_size) and calls in flight from observed "
+             "latency and errors (AIMD)",
+    )
+    parser.add_argument(
+        "--min_predict_batch_size", type=int, default=1,
+        help="Smallest prediction call --adaptive_batching may shrink to",
+    )
+    parser.add_argument(
+        "--max_predict_concurrency", type=int, default=8,
+        help="Most prediction calls in flight per DoFn with --adaptive_batching",
+    )
+    parser.add_argument(
+        "--target_predict_latency_ms", type=float, default=500.0,
+        help="Prediction call latency above which --adaptive_batching shrinks the batch size",
+    )
+    parser.add_argument(
+        "--wire_format", default="json", choices=list(WIRE_FORMATS),
+        help="Encoding of /predict request and response bodies",
+    )
+    parser.add_argument(
+        "--circuit_breaker_failure_threshold", type=int, default=5,
+        help="Consecutive failed prediction calls that open each worker's circuit breaker, "
+             "dead-lettering batches without calling until a probe succeeds; 0 disables it",
+    )
+    parser.add_argument(
+        "--circuit_breaker_reset_secs", type=float, default=30.0,
+        help="How long an open circuit breaker refuses calls before letting a probe through",
+    )
+    parser.add_argument(
+        "--hedge_requests", action="store_true",
+        help="Send a duplicate of prediction calls slower than --hedge_percentile of recent latencies",
+    )
+    parser.add_argument(
+        "--hedge_percentile", type=float, default=95.0,
+        help="Latency percentile after which --hedge_requests sends the duplicate",
+    )
+    parser.add_argument(
+        "--fetch_concurrency", type=int, default=1,
+        help="Online store lookups in flight per batch; 1 fetches entities one at a time",
+    )
+    parser.add_argument(
+        "--feature_cache_size", type=int, default=0,
+        help="Entities kept in each worker's feature cache in front of the online store; 0 disables it",
+    )
+    parser.add_argument(
+        "--feature_cache_ttl_secs", type=float, default=60.0,
+        help="How long cached features are served before the online store is read again",
+    )
+    parser.add_argument(
+        "--feature_cache_negative_ttl_secs", type=float, default=5.0,
+        help="How long an entity found without features is dead-lettered from the cache",
+    )
+    parser.add_argument(
+        "--missing_feature_retry_horizon_secs", type=float, default=0.0,
+        help="Re-fetch entities found without features on Beam timers for up to this long before "
+             "dead-lettering them; 0 retries once inside the fetch step instead",
+    )
+    parser.add_argument(
+        "--fuse_fetch_and_predict", action="store_true",
+        help="Fetch features and call the model service in one step (FetchAndPredict) "
+             "instead of re-batching fetched elements for prediction",
+    )
     parser.add_argument(
         "--online_store_id",
         default="ml_online_store",
@@ -270,12 +1025,46 @@ def run_pipeline(argv=None):
         default=None,
         help="BigQuery dead letter table (PROJECT:DATASET.TABLE). If unset, dead letters are logged only.",
     )
+    parser.add_argument(
+        "--bigquery_write_method", choices=WRITE_METHODS, default=STREAMING_INSERTS,
+        help="How predictions and dead letters reach BigQuery: legacy streaming inserts, where a refused "
+             "prediction row fails the job, or the Storage Write API, where it becomes a dead letter",
+    )
+    parser.add_argument(
+        "--storage_write_batch_size", type=int, default=500,
+        help="Rows per AppendRows request with a storage_write_* --bigquery_write_method",
+    )
+    parser.add_argument(
+        "--output_format", choices=OUTPUT_FORMATS, default="full",
+        help="Prediction rows as PREDICTION_SCHEMA (features as a JSON string, the service URL) or "
+             "COMPACT_PREDICTION_SCHEMA (features as a REPEATED FLOAT, the model version id)",
+    )
+    parser.add_argument(
+        "--schema_rows", action="store_true",
+        help="Shuffle elements into the batching and missing-feature retry stages, and prediction rows "
+             "into the Storage Write API sink, as schema rows encoded by RowCoder instead of dicts",
+    )
+    parser.add_argument(
+        "--row_log_sample_every", type=int, default=1000,
+        help="Log one prediction row in this many (0 logs only periodic row counts)",
+    )
     parser.add_argument(
         "--no_wait", action="store_true",
         help="Submit the job and exit without waiting for it to finish",
     )
 
     known_args, pipeline_args = parser.parse_known_args(argv)
+    local_inference = known_args.inference_mode == "local"
+    if local_inference and not known_args.model_uri:
+        parser.error("--model_uri is required with --inference_mode=local")
+    if local_inference and known_args.fuse_fetch_and_predict:
+        parser.error("--fuse_fetch_and_predict needs --inference_mode=service")
+    if not local_inference and known_args.inference_transport == "http" and not known_args.service_url:
+        parser.error("--service_url is required with --inference_transport=http")
+    if not local_inference and known_args.inference_transport != "http" and not known_args.grpc_target:
+        parser.error(f"--grpc_target is required with --inference_transport={known_args.inference_transport}")
+    if known_args.fuse_fetch_and_predict and known_args.max_in_flight_batches > 1:
+        parser.error("--fuse_fetch_and_predict already overlaps prediction calls; leave --max_in_flight_batches at 1")
     logger.info(f"Known args: {known_args}")
     logger.info(f"Pipeline args: {pipeline_args}")
 
@@ -290,75 +1079,186 @@ def run_pipeline(argv=None):
     parse_results = (
         pipeline
         | "Read from Pub/Sub" >> ReadFromPubSub(topic=known_args.input_topic)
-        | "Parse JSON" >> beam.ParDo(ParsePubSubMessage()).with_outputs(
+        | "Parse JSON" >> beam.ParDo(ParsePubSubMessage(known_args.parse_batch_size)).with_outputs(
             DEAD_LETTER_TAG, main="parsed",
         )
     )
 
-    fetch_results = (
-        parse_results.parsed
+    defer_missing = known_args.missing_feature_retry_horizon_secs > 0
+    fetch_fn = FetchFeaturesFromOnlineStore(
+        project_id=known_args.project_id,
+        region=known_args.region,
+        online_store_id=known_args.online_store_id,
+        feature_view_id=known_args.feature_view_id,
+        feature_columns=FEATURE_COLUMNS,
+        max_concurrency=known_args.fetch_concurrency,
+        cache_max_entries=known_args.feature_cache_size,
+        cache_ttl_secs=known_args.feature_cache_ttl_secs,
+        cache_negative_ttl_secs=known_args.feature_cache_negative_ttl_secs,
+        defer_missing=defer_missing,
+    )
+
+    controller = None
+    if known_args.adaptive_batching:
+        controller = AdaptiveBatchController(
+            min_batch_size=known_args.min_predict_batch_size,
+            max_batch_size=known_args.batch_size,
+            max_concurrency=known_args.max_predict_concurrency,
+            target_latency_ms=known_args.target_predict_latency_ms,
+        )
+    service_call_args = dict(
+        controller=controller,
+        max_in_flight_batches=known_args.max_in_flight_batches,
+        circuit_breaker_failure_threshold=known_args.circuit_breaker_failure_threshold,
+        circuit_breaker_reset_secs=known_args.circuit_breaker_reset_secs,
+        hedge_percentile=known_args.hedge_percentile if known_args.hedge_requests else None,
+    )
+    row_args = dict(output_format=known_args.output_format, row_log_sample_every=known_args.row_log_sample_every)
+    if local_inference:
+        predict_fn = PredictWithLocalModel(
+            known_args.model_uri, refresh_interval_secs=known_args.model_refresh_interval_secs, **row_args,
+        )
+    elif known_args.inference_transport == "http":
+        predict_fn = BatchCallFastAPIService(
+            known_args.service_url, wire_format=known_args.wire_format, **service_call_args, **row_args,
+        )
+    else:
+        predict_fn = BatchCallGrpcService(
+            known_args.grpc_target, streaming=known_args.inference_transport == "grpc_stream",
+            **service_call_args, **row_args,
+        )
+
+    parsed = parse_results.parsed
+    if known_args.schema_rows:
+        parsed = parsed | "To Request Rows" >> beam.Map(to_row, IrisRequest).with_output_types(IrisRequest)
+    batched = (
+        parsed
         | "Batch Elements" >> BatchElements(
             min_batch_size=1,
             max_batch_size=known_args.batch_size,
             max_batch_duration_secs=known_args.max_batch_duration_secs,
         )
-        | "Fetch Features" >> beam.ParDo(
-            FetchFeaturesFromOnlineStore(
-                project_id=known_args.project_id,
-                region=known_args.region,
-                online_store_id=known_args.online_store_id,
-                feature_view_id=known_args.feature_view_id,
-                feature_columns=FEATURE_COLUMNS,
-            )
-        ).with_outputs(DEAD_LETTER_TAG, main="fetched")
     )
+    if known_args.schema_rows:
+        batched = batched | "Request Rows to Dicts" >> beam.Map(_row_dicts)
+
+    # Elements with features that still need a prediction call, and the finished predictions
+    to_predict = []
+    prediction_outputs = []
+    dead_letters = [parse_results[DEAD_LETTER_TAG]]
+    if known_args.fuse_fetch_and_predict:
+        fused_results = (
+            batched
+            | "Fetch and Predict" >> beam.ParDo(
+                FetchAndPredict(fetch_fn, predict_fn)
+            ).with_outputs(DEAD_LETTER_TAG, MISSING_FEATURES_TAG, main="predictions")
+        )
+        prediction_outputs.append(fused_results.predictions)
+        dead_letters.append(fused_results[DEAD_LETTER_TAG])
+        missing = fused_results[MISSING_FEATURES_TAG]
+    else:
+        fetch_results = (
+            batched
+            | "Fetch Features" >> beam.ParDo(fetch_fn).with_outputs(
+                DEAD_LETTER_TAG, MISSING_FEATURES_TAG, main="fetched",
+            )
+        )
+        to_predict.append(fetch_results.fetched)
+        dead_letters.append(fetch_results[DEAD_LETTER_TAG])
+        missing = fetch_results[MISSING_FEATURES_TAG]
+
+    if defer_missing:
+        if known_args.schema_rows:
+            keyed_missing = missing | "Key by Entity" >> beam.Map(
+                lambda e: (e["entity_id"], to_row(e, IrisRequest))
+            ).with_output_types(Tuple[str, IrisRequest])
+        else:
+            keyed_missing = missing | "Key by Entity" >> beam.Map(
+                lambda e: (e["entity_id"], e)
+            ).with_output_types(Tuple[str, Dict[str, Any]])
+        retry_results = (
+            keyed_missing
+            | "Retry Missing Features" >> beam.ParDo(
+                RetryMissingFeatures(
+                    project_id=known_args.project_id,
+                    region=known_args.region,
+                    online_store_id=known_args.online_store_id,
+                    feature_view_id=known_args.feature_view_id,
+                    feature_columns=FEATURE_COLUMNS,
+                    retry_horizon_secs=known_args.missing_feature_retry_horizon_secs,
+                )
+            ).with_outputs(DEAD_LETTER_TAG, main="fetched")
+        )
+        to_predict.append(retry_results.fetched)
+        dead_letters.append(retry_results[DEAD_LETTER_TAG])
 
-    predict_results = (
-        fetch_results.fetched
-        | "Batch for Prediction" >> BatchElements(
+    if to_predict:
+        fetched = to_predict[0]
+        if len(to_predict) > 1:
+            fetched = tuple(to_predict) | "Merge Retried Features" >> beam.Flatten()
+        if known_args.schema_rows:
+            fetched = fetched | "To Scoring Rows" >> beam.Map(to_row, IrisScoringRow).with_output_types(IrisScoringRow)
+        fetched_batches = fetched | "Batch for Prediction" >> BatchElements(
             min_batch_size=1,
             max_batch_size=known_args.batch_size,
             max_batch_duration_secs=known_args.max_batch_duration_secs,
         )
-        | "Call FastAPI Batch"
-        >> beam.ParDo(BatchCallFastAPIService(known_args.service_url)).with_outputs(
-            DEAD_LETTER_TAG, main="predictions",
+        if known_args.schema_rows:
+            fetched_batches = fetched_batches | "Scoring Rows to Dicts" >> beam.Map(_row_dicts)
+        predict_results = (
+            fetched_batches
+            | ("Predict with Local Model" if local_inference else "Call FastAPI Batch")
+            >> beam.ParDo(predict_fn).with_outputs(
+                DEAD_LETTER_TAG, main="predictions",
+            )
         )
-    )
+        prediction_outputs.append(predict_results.predictions)
+        dead_letters.append(predict_results[DEAD_LETTER_TAG])
 
-    predictions = (
-        predict_results.predictions
-        | "Add Metadata" >> beam.ParDo(AddProcessingMetadata())
-        | "Write to BigQuery"
-        >> WriteToBigQuery(
-            table=known_args.output_table,
-            schema=PREDICTION_SCHEMA,
-            write_disposition=beam.io.BigQueryDisposition.WRITE_APPEND,
-            create_disposition=beam.io.BigQueryDisposition.CREATE_NEVER,
-            insert_retry_strategy=RetryStrategy.RETRY_NEVER,
-            additional_bq_parameters={
-                "timePartitioning": {"type": "DAY", "field": "prediction_timestamp"}
-            },
-        )
-    )
+    prediction_rows = prediction_outputs[0]
+    if len(prediction_outputs) > 1:
+        prediction_rows = tuple(prediction_outputs) | "Merge Predictions" >> beam.Flatten()
 
-    _ = (
-        predictions[BigQueryWriteFn.FAILED_ROWS_WITH_ERRORS]
-        | "Raise on BQ Error" >> beam.ParDo(RaiseOnBigQueryError())
-    )
+    output_rows = prediction_rows | "Add Metadata" >> beam.ParDo(AddProcessingMetadata())
+    if known_args.bigquery_write_method == STREAMING_INSERTS:
+        predictions = (
+            output_rows
+            | "Write to BigQuery"
+            >> WriteToBigQuery(
+                table=known_args.output_table,
+                schema=PREDICTION_SCHEMAS[known_args.output_format],
+                write_disposition=beam.io.BigQueryDisposition.WRITE_APPEND,
+                create_disposition=beam.io.BigQueryDisposition.CREATE_NEVER,
+                insert_retry_strategy=RetryStrategy.RETRY_NEVER,
+                additional_bq_parameters={
+                    "timePartitioning": {"type": "DAY", "field": "prediction_timestamp"}
+                },
+            )
+        )
 
-    if known_args.dead_letter_table:
-        all_dead_letters = (
-            (
-                parse_results[DEAD_LETTER_TAG],
-                fetch_results[DEAD_LETTER_TAG],
-                predict_results[DEAD_LETTER_TAG],
+        _ = (
+            predictions[BigQueryWriteFn.FAILED_ROWS_WITH_ERRORS]
+            | "Raise on BQ Error" >> beam.ParDo(RaiseOnBigQueryError())
+        )
+    else:
+        dead_letters.append(
+            output_rows
+            | "Write to BigQuery" >> WriteToBigQueryStorage(
+                table=known_args.output_table,
+                schema=PREDICTION_SCHEMAS[known_args.output_format],
+                pipeline="inference",
+                exactly_once=known_args.bigquery_write_method == STORAGE_WRITE_EXACTLY_ONCE,
+                batch_size=known_args.storage_write_batch_size,
+                row_type=PREDICTION_ROW_TYPES[known_args.output_format] if known_args.schema_rows else None,
             )
-            | "Flatten Dead Letters" >> beam.Flatten()
         )
+
+    if known_args.dead_letter_table:
+        all_dead_letters = tuple(dead_letters) | "Flatten Dead Letters" >> beam.Flatten()
         write_dead_letters(
             all_dead_letters,
             table=known_args.dead_letter_table,
+            method=known_args.bigquery_write_method,
         )
 
     result = pipeline.run()
@@ -0,0 +1,108 @@
+"""Beam schema row types for the Dataflow pipelines, generated from a FeatureConfig.
+
+Elements are plain dicts inside the DoFns. Where they cross a shuffle, as
+typed rows these are encoded by RowCoder (field values only, in schema
+order) instead of pickling or FastPrimitivesCoder-encoding each dict with
+its key names.
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple, Optional, Sequence
+
+import apache_beam as beam
+
+from feature_store.iris.feature_definitions import IRIS_CONFIG
+from feature_store.schema import FeatureConfig
+
+
+class RowTypes(NamedTuple):
+    """The row types of one FeatureConfig's pipelines."""
+
+    # Feature pipeline: a validated Pub/Sub message, source-named features
+    message: type
+    # Feature pipeline: the offline/online store row, canonical features
+    feature_row: type
+    # Inference pipeline: a parsed request, entity id only
+    request: type
+    # Inference pipeline: a request with its features fetched
+    scoring_row: type
+    # Inference pipeline: a prediction row per --output_format
+    prediction: type
+    compact_prediction: type
+
+
+def _register(name, fields):
+    row_type = NamedTuple(name, fields)
+    row_type.__module__ = __name__
+    beam.coders.registry.register_row(row_type)
+    return row_type
+
+
+def row_types(config: FeatureConfig, message_mapping: str = "snake") -> RowTypes:
+    """Generate and register with RowCoder the row types for config.
+
+    message_mapping is the config.column_mappings label Pub/Sub messages
+    are named by.
+    """
+    prefix = config.name.title().replace("_", "")
+    entity_id = config.entity_id_column
+    features = [(column, float) for column in config.feature_columns]
+    # Sink rows may still lack a REQUIRED value here; the sink dead-letters them
+    nullable_features = [(column, Optional[float]) for column in config.feature_columns]
+    message_features = [
+        (source, float)
+        for source, canonical in config.column_mappings[message_mapping].items()
+        if canonical in config.feature_columns
+    ]
+    prediction_fields = [
+        ("prediction", Optional[str]),
+        ("class_probabilities", Sequence[float]),
+        ("prediction_timestamp", Optional[str]),
+        ("processing_time", Optional[float]),
+        ("dataflow_processing_time", Optional[str]),
+    ]
+    return RowTypes(
+        message=_register(f"{prefix}Message", [
+            *message_features, ("timestamp", Optional[str]), ("sample_id", Optional[int]),
+        ]),
+        feature_row=_register(f"{prefix}FeatureRow", [
+            *nullable_features,
+            (config.target_column, Optional[str]),
+            ("source", Optional[str]),
+            (entity_id, str),
+            (config.feature_timestamp_column, Optional[str]),
+        ]),
+        request=_register(f"{prefix}Request", [(entity_id, str), ("timestamp", Optional[str])]),
+        scoring_row=_register(f"{prefix}ScoringRow", [(entity_id, str), ("timestamp", Optional[str]), *features]),
+        prediction=_register(f"{prefix}Prediction", [
+            (entity_id, str), ("features", Optional[str]), ("timestamp", Optional[str]),
+            ("model_service", Optional[str]),
+            *prediction_fields,
+        ]),
+        compact_prediction=_register(f"{prefix}CompactPrediction", [
+            (entity_id, str), ("feature_values", Sequence[float]), ("timestamp", Optional[str]),
+            ("model_version", Optional[str]),
+            *prediction_fields,
+        ]),
+    )
+
+
+def to_row(element, row_type):
+    """row_type from a dict element, ignoring keys that are not its fields."""
+    return row_type(*(element.get(name) for name in row_type._fields))
+
+
+def to_dict(element):
+    """A dict from a row, or the element itself if it already is one."""
+    return element._asdict() if hasattr(element, "_asdict") else element
+
+
+IRIS_ROWS = row_types(IRIS_CONFIG)
+# Module attributes so the types pickle by reference
+IrisMessage = IRIS_ROWS.message
+IrisFeatureRow = IRIS_ROWS.feature_row
+IrisRequest = IRIS_ROWS.request
+IrisScoringRow = IRIS_ROWS.scoring_row
+IrisPrediction = IRIS_ROWS.prediction
+IrisCompactPrediction = IRIS_ROWS.compact_prediction
@@ -0,0 +1,148 @@
+"""In-memory BigQuery Storage Write API served over local gRPC.
+
+FakeBigQueryWrite implements the v1 BigQueryWrite CreateWriteStream and
+AppendRows methods on a localhost port, so WriteToBigQueryStorage can be
+exercised and benchmarked through the real BigQueryWriteClient and
+AppendRowsStream without GCP access. It decodes every appended batch with
+the writer schema the client sent and records it.
+"""
+
+import itertools
+import threading
+import time
+from concurrent import futures
+
+import grpc
+from google.cloud.bigquery_storage_v1 import BigQueryWriteClient, types
+from google.cloud.bigquery_storage_v1.services.big_query_write.transports import BigQueryWriteGrpcTransport
+from google.rpc import code_pb2, status_pb2
+
+from dataflow.utils.bigquery_storage_write import row_message_class
+
+SERVICE = "google.cloud.bigquery.storage.v1.BigQueryWrite"
+
+
+def bigquery_write_client(target):
+    """A real BigQueryWriteClient talking plaintext gRPC to target.
+
+    Takes only the target string, so functools.partial(bigquery_write_client,
+    target) pickles into the DoFns that call it from setup().
+    """
+    channel = grpc.insecure_channel(target)
+    return BigQueryWriteClient(transport=BigQueryWriteGrpcTransport(channel=channel))
+
+
+class FakeBigQueryWrite:
+    """AppendRows into per-stream row lists, refusing rows that miss required columns.
+
+    required_columns names the columns a row must carry; a batch with any
+    row missing one is answered with INVALID_ARGUMENT and a row error per
+    such row, and nothing in it is written, as BigQuery does. Appends with
+    an offset are checked against the stream's length: a smaller offset is
+    ALREADY_EXISTS and a larger one OUT_OF_RANGE. Each append sleeps
+    latency_secs.
+
+    appends records (stream name, offset, decoded rows) for every written
+    batch; rows(table_path) is everything written to a table.
+    """
+
+    def __init__(self, required_columns=(), latency_secs=0.0, max_workers=16):
+        self.required_columns = list(required_columns)
+        self.latency_secs = latency_secs
+        self.max_workers = max_workers
+        self.appends = []
+        self.streams = {}
+        self._stream_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._server = None
+        self.target = None
+
+    def rows(self, table_path):
+        return [row for stream, _, rows in self.appends if stream.startswith(f"{table_path}/") for row in rows]
+
+    def _create_write_stream(self, request, context):
+        with self._lock:
+            name = f"{request.parent}/streams/fake-{next(self._stream_ids)}"
+            self.streams[name] = 0
+        return types.WriteStream(name=name, type_=request.write_stream.type_)
+
+    def _append_rows(self, requests, context):
+        message_class = None
+        stream = None
+        for request in requests:
+            stream = request.write_stream or stream
+            if request.proto_rows.writer_schema.proto_descriptor.name:
+                message_class = row_message_class(request.proto_rows.writer_schema.proto_descriptor)
+            rows = [_decode(message_class, data) for data in request.proto_rows.rows.serialized_rows]
+            if self.latency_secs:
+                time.sleep(self.latency_secs)
+            yield self._write(stream, rows, request.offset if "offset" in request else None)
+
+    def _write(self, stream, rows, offset):
+        row_errors = []
+        for i, row in enumerate(rows):
+            missing = [column for column in self.required_columns if column not in row]
+            if missing:
+                row_errors.append(types.RowError(
+                    index=i, code=types.RowError.RowErrorCode.FIELDS_ERROR,
+                    message=f"Missing required field: {missing[0]}",
+                ))
+        if row_errors:
+            return _error(stream, code_pb2.INVALID_ARGUMENT, "Errors found while processing rows", row_errors)
+        with self._lock:
+            written = self.streams.get(stream, 0)
+            if offset is not None and not stream.endswith("/_default"):
+                if offset < written:
+                    return _error(stream, code_pb2.ALREADY_EXISTS, f"Offset {offset} already exists")
+                if offset > written:
+                    return _error(stream, code_pb2.OUT_OF_RANGE, f"Offset {offset} is beyond the end {written}")
+            self.streams[stream] = written + len(rows)
+            self.appends.append((stream, offset, rows))
+        return types.AppendRowsResponse(
+            write_stream=stream, append_result=types.AppendRowsResponse.AppendResult(offset=offset),
+        )
+
+    def start(self):
+        self._server = grpc.server(futures.ThreadPoolExecutor(self.max_workers))
+        handler = grpc.method_handlers_generic_handler(SERVICE, {
+            "CreateWriteStream": grpc.unary_unary_rpc_method_handler(
+                self._create_write_stream,
+                request_deserializer=types.CreateWriteStreamRequest.deserialize,
+                response_serializer=types.WriteStream.serialize,
+            ),
+            "AppendRows": grpc.stream_stream_rpc_method_handler(
+                self._append_rows,
+                request_deserializer=types.AppendRowsRequest.deserialize,
+                response_serializer=types.AppendRowsResponse.serialize,
+            ),
+        })
+        self._server.add_generic_rpc_handlers((handler,))
+        port = self._server.add_insecure_port("127.0.0.1:0")
+        self._server.start()
+        self.target = f"127.0.0.1:{port}"
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.stop(grace=None)
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _decode(message_class, data):
+    row = {}
+    for field, value in message_class.FromString(data).ListFields():
+        # Repeated fields come back as containers
+        row[field.name] = list(value) if hasattr(value, "append") else value
+    return row
+
+
+def _error(stream, code, message, row_errors=()):
+    return types.AppendRowsResponse(
+        write_stream=stream, error=status_pb2.Status(code=code, message=message), row_errors=list(row_errors),
+    )
@@ -0,0 +1,211 @@
+"""In-memory Feature Store online store served over local gRPC.
+
+FakeOnlineStore implements the v1 FeatureOnlineStoreService.FetchFeatureValues
+method and the v1beta1 FeatureViewDirectWrite stream on a localhost port,
+with injectable per-request latency and failures, so
+FetchFeaturesFromOnlineStore and WriteToOnlineStore can be exercised and
+benchmarked through the real FeatureOnlineStoreServiceClients without GCP
+access.
+"""
+
+import queue
+import random
+import threading
+import time
+from concurrent import futures
+
+import grpc
+from google.cloud import aiplatform_v1beta1
+from google.cloud.aiplatform_v1 import FeatureOnlineStoreServiceClient
+from google.cloud.aiplatform_v1.services.feature_online_store_service.transports import (
+    FeatureOnlineStoreServiceGrpcTransport,
+)
+from google.cloud.aiplatform_v1.types import FeatureValue, FetchFeatureValuesRequest, FetchFeatureValuesResponse
+from google.cloud.aiplatform_v1beta1.services.feature_online_store_service.transports import (
+    FeatureOnlineStoreServiceGrpcTransport as DirectWriteGrpcTransport,
+)
+from google.cloud.aiplatform_v1beta1.types import (
+    FeatureViewDataKey,
+    FeatureViewDirectWriteRequest,
+    FeatureViewDirectWriteResponse,
+)
+from google.rpc import code_pb2, status_pb2
+
+SERVICE = "google.cloud.aiplatform.v1.FeatureOnlineStoreService"
+WRITE_SERVICE = "google.cloud.aiplatform.v1beta1.FeatureOnlineStoreService"
+
+_PairList = FetchFeatureValuesResponse.FeatureNameValuePairList
+
+
+def online_store_client(target):
+    """A real FeatureOnlineStoreServiceClient talking plaintext gRPC to target.
+
+    Takes only the target string, so DoFns that call it from _create_client
+    stay picklable for the DirectRunner.
+    """
+    channel = grpc.insecure_channel(target)
+    return FeatureOnlineStoreServiceClient(transport=FeatureOnlineStoreServiceGrpcTransport(channel=channel))
+
+
+def direct_write_client(target):
+    """A real v1beta1 FeatureOnlineStoreServiceClient, for FeatureViewDirectWrite, talking plaintext gRPC to target."""
+    channel = grpc.insecure_channel(target)
+    return aiplatform_v1beta1.FeatureOnlineStoreServiceClient(transport=DirectWriteGrpcTransport(channel=channel))
+
+
+class FakeOnlineStore:
+    """FetchFeatureValues over {entity_id: {feature_name: float}}.
+
+    Each request sleeps latency_secs (plus up to jitter_secs), then fails
+    with UNAVAILABLE with probability failure_rate. Unknown entity ids
+    return no features, as the real store does; available_after maps entity
+    ids to how many reads answer empty before their features appear, to
+    simulate the feature pipeline racing the reader. max_workers bounds how
+    many requests the server handles at once.
+
+    Direct writes record each written entity's features in written. Every
+    write request on a stream is handled as it arrives, concurrently with
+    the others, after write_latency_secs; keys in refused_keys are answered
+    INVALID_ARGUMENT and, with probability failure_rate, a request's keys
+    UNAVAILABLE, each in a response of their own as the real service does.
+    flaky_keys maps keys to how many of their writes are answered
+    UNAVAILABLE before one succeeds.
+    write_streams and write_requests count the streams opened and requests
+    received.
+    """
+
+    def __init__(self, features_by_entity=None, latency_secs=0.0, jitter_secs=0.0,
+                 failure_rate=0.0, max_workers=64, seed=0, available_after=None,
+                 write_latency_secs=0.0, refused_keys=(), flaky_keys=None):
+        self.features_by_entity = dict(features_by_entity or {})
+        self.available_after = dict(available_after or {})
+        self.latency_secs = latency_secs
+        self.jitter_secs = jitter_secs
+        self.failure_rate = failure_rate
+        self.max_workers = max_workers
+        self.write_latency_secs = write_latency_secs
+        self.refused_keys = set(refused_keys)
+        self.flaky_keys = dict(flaky_keys or {})
+        self.requests = 0
+        self.written = {}
+        self.write_streams = 0
+        self.write_requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self.target = None
+
+    def _fetch_feature_values(self, request, context):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency_secs + self._random.uniform(0, self.jitter_secs)
+            fail = self._random.random() < self.failure_rate
+            entity_id = request.data_key.key
+            hidden = self.available_after.get(entity_id, 0) > 0
+            if hidden and not fail:
+                self.available_after[entity_id] -= 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            context.abort(grpc.StatusCode.UNAVAILABLE, "Injected failure")
+        features = {} if hidden else self.features_by_entity.get(entity_id, {})
+        return FetchFeatureValuesResponse(key_values=_PairList(features=[
+            _PairList.FeatureNameValuePair(name=name, value=FeatureValue(double_value=value))
+            for name, value in features.items()
+        ]))
+
+    def _feature_view_direct_write(self, requests, context):
+        with self._lock:
+            self.write_streams += 1
+        answers = queue.Queue()
+        pool = futures.ThreadPoolExecutor(self.max_workers)
+
+        def read_requests():
+            handled = []
+            try:
+                for request in requests:
+                    handled.append(pool.submit(lambda r: answers.put(self._direct_write(r)), request))
+                futures.wait(handled)
+            finally:
+                answers.put(None)
+
+        threading.Thread(target=read_requests, daemon=True).start()
+        try:
+            for responses in iter(answers.get, None):
+                yield from responses
+        finally:
+            pool.shutdown(wait=False)
+
+    def _direct_write(self, request):
+        """The responses for one write request: written keys, refused keys and failed keys apart."""
+        if self.write_latency_secs:
+            time.sleep(self.write_latency_secs)
+        outcomes = {code_pb2.OK: [], code_pb2.INVALID_ARGUMENT: [], code_pb2.UNAVAILABLE: []}
+        with self._lock:
+            self.write_requests += 1
+            fail = self._random.random() < self.failure_rate
+            for entry in request.data_key_and_feature_values:
+                key = entry.data_key.key
+                if key in self.refused_keys:
+                    outcomes[code_pb2.INVALID_ARGUMENT].append(key)
+                elif fail or self.flaky_keys.get(key, 0) > 0:
+                    if not fail:
+                        self.flaky_keys[key] -= 1
+                    outcomes[code_pb2.UNAVAILABLE].append(key)
+                else:
+                    self.written[key] = _written_features(entry)
+                    outcomes[code_pb2.OK].append(key)
+        return [
+            FeatureViewDirectWriteResponse(
+                status=status_pb2.Status(code=code, message="" if code == code_pb2.OK else "Injected failure"),
+                write_responses=[
+                    FeatureViewDirectWriteResponse.WriteResponse(data_key=FeatureViewDataKey(key=key)) for key in keys
+                ],
+            )
+            for code, keys in outcomes.items() if keys
+        ]
+
+    def start(self):
+        self._server = grpc.server(futures.ThreadPoolExecutor(self.max_workers))
+        handler = grpc.method_handlers_generic_handler(SERVICE, {
+            "FetchFeatureValues": grpc.unary_unary_rpc_method_handler(
+                self._fetch_feature_values,
+                request_deserializer=FetchFeatureValuesRequest.deserialize,
+                response_serializer=FetchFeatureValuesResponse.serialize,
+            ),
+        })
+        write_handler = grpc.method_handlers_generic_handler(WRITE_SERVICE, {
+            "FeatureViewDirectWrite": grpc.stream_stream_rpc_method_handler(
+                self._feature_view_direct_write,
+                # Raw protobuf: parsing into proto-plus would cost more than the writer being measured
+                request_deserializer=FeatureViewDirectWriteRequest.pb().FromString,
+                response_serializer=FeatureViewDirectWriteResponse.serialize,
+            ),
+        })
+        self._server.add_generic_rpc_handlers((handler, write_handler))
+        port = self._server.add_insecure_port("127.0.0.1:0")
+        self._server.start()
+        self.target = f"127.0.0.1:{port}"
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.stop(grace=None)
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def client(self):
+        return online_store_client(self.target)
+
+
+def _written_features(entry):
+    features = {}
+    for feature in entry.features:
+        value = feature.value_and_timestamp.value
+        features[feature.name] = getattr(value, value.WhichOneof("value"))
+    return features
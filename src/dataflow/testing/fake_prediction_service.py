@@ -0,0 +1,136 @@
+"""Stand-in for the FastAPI /predict endpoint served by aiohttp on localhost.
+
+FakePredictionService answers /predict in the JSON, msgpack and Arrow wire
+formats the inference pipeline can send, after an injectable delay, so
+BatchCallFastAPIService and the stages built on it can be exercised and
+benchmarked without a model or the serving container.
+"""
+
+import asyncio
+import threading
+
+import numpy as np
+from aiohttp import web
+
+from ml_pipelines_kfp.wire_format import JSON, decode_request, encode_response, media_type
+
+N_CLASSES = 3
+
+
+def predict(X):
+    """Deterministic (classes, probabilities) for a feature matrix: class = int(first feature) % 3."""
+    classes = np.asarray(X[:, 0], dtype=np.int64) % N_CLASSES
+    probabilities = np.full((len(X), N_CLASSES), 0.1)
+    probabilities[np.arange(len(X)), classes] = 0.8
+    return classes, probabilities
+
+
+class FakePredictionService:
+    """/predict over feature_columns, sleeping latency_secs + per_row_secs per row.
+
+    With tail_fraction > 0, that fraction of calls (drawn from a generator
+    seeded with seed) sleeps tail_latency_secs longer, for exercising
+    hedged requests against a slow tail.
+
+    model maps a float32 feature matrix to (classes, probabilities); the
+    default is the deterministic predict() above. Pass a real model's
+    adapter to pay its scoring cost on the server side. Every answer
+    carries model_version in its X-Model-Version header, as the FastAPI
+    server's do. With error_status set, every call is answered with that
+    HTTP status instead, as a request the server refuses would be.
+
+    Records the size of every batch it scores in batch_sizes, and the most
+    requests it was answering at once in peak_in_flight. Runs its own event
+    loop on a background thread; use as a context manager, then point the
+    DoFn at .url.
+    """
+
+    def __init__(self, feature_columns, latency_secs=0.0, per_row_secs=0.0, model=predict,
+                 tail_fraction=0.0, tail_latency_secs=0.0, seed=0, model_version="fake-v1", error_status=None):
+        self.feature_columns = list(feature_columns)
+        self.error_status = error_status
+        self.model = model
+        self.model_version = model_version
+        self.latency_secs = latency_secs
+        self.per_row_secs = per_row_secs
+        self.tail_fraction = tail_fraction
+        self.tail_latency_secs = tail_latency_secs
+        self._rng = np.random.default_rng(seed)
+        self.batch_sizes = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.url = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def requests(self):
+        return len(self.batch_sizes)
+
+    async def _predict(self, request):
+        request_media = media_type(request.headers.get("Content-Type"))
+        if request_media == JSON:
+            instances = (await request.json())["instances"]
+            X = np.array([[i[col] for col in self.feature_columns] for i in instances], dtype=np.float32)
+        else:
+            try:
+                X = decode_request(await request.read(), request_media, self.feature_columns)
+            except ValueError as e:
+                raise web.HTTPBadRequest(text=str(e))
+        self.batch_sizes.append(len(X))
+        if self.error_status is not None:
+            return web.Response(status=self.error_status, text="Prediction failed")
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            delay = self.latency_secs + self.per_row_secs * len(X)
+            if self.tail_fraction and self._rng.random() < self.tail_fraction:
+                delay += self.tail_latency_secs
+            if delay:
+                await asyncio.sleep(delay)
+        finally:
+            self.in_flight -= 1
+
+        classes, probabilities = self.model(X)
+        headers = {"X-Model-Version": self.model_version}
+        if request_media != JSON:
+            return web.Response(
+                body=encode_response(classes, probabilities, request_media), content_type=request_media, headers=headers,
+            )
+        return web.json_response({"predictions": [
+            {"class_": int(cls), "class_probabilities": proba.tolist()}
+            for cls, proba in zip(classes, probabilities)
+        ]}, headers=headers)
+
+    async def _start_site(self):
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_post("/predict", self._predict)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_site(), self._loop).result()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,61 @@
+INCREASE = "increase"
+DECREASE = "decrease"
+HOLD = "hold"
+
+
+class AdaptiveBatchController:
+    """AIMD tuning of the rows per prediction call and the calls in flight.
+
+    Each answered call within target_latency_ms grows the batch size by
+    batch_size_step and the concurrency by one per round of calls, up to the
+    max bounds. A slower call multiplies the batch size by decrease_factor; a
+    failed call (timeout, connection error, overload) multiplies both. Calls
+    started before the last decrease cannot decrease again, so one overload
+    seen by a whole round of in-flight calls shrinks the targets once, not
+    once per call, as with TCP congestion control.
+
+    Not thread-safe: one instance belongs to one DoFn instance and its event loop.
+    """
+
+    def __init__(self, min_batch_size=1, max_batch_size=50, min_concurrency=1, max_concurrency=8,
+                 target_latency_ms=500.0, batch_size_step=5, decrease_factor=0.5,
+                 initial_batch_size=None, initial_concurrency=None):
+        if not 1 <= min_batch_size <= max_batch_size:
+            raise ValueError(f"Need 1 <= min_batch_size <= max_batch_size, got {min_batch_size}, {max_batch_size}")
+        if not 1 <= min_concurrency <= max_concurrency:
+            raise ValueError(f"Need 1 <= min_concurrency <= max_concurrency, got {min_concurrency}, {max_concurrency}")
+        if not 0 < decrease_factor < 1:
+            raise ValueError(f"decrease_factor must be in (0, 1), got {decrease_factor}")
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency_ms = target_latency_ms
+        self.batch_size_step = batch_size_step
+        self.decrease_factor = decrease_factor
+        self._batch_size = float(initial_batch_size or max_batch_size)
+        self._concurrency = float(initial_concurrency or min_concurrency)
+        # Bumped on every decrease; calls carry the generation they started in
+        self.generation = 0
+
+    @property
+    def batch_size(self):
+        return int(self._batch_size)
+
+    @property
+    def concurrency(self):
+        return int(self._concurrency)
+
+    def record(self, generation, latency_ms, failed=False):
+        """Adjust the targets for a call started in generation; returns INCREASE, DECREASE or HOLD."""
+        if failed or latency_ms > self.target_latency_ms:
+            if generation != self.generation:
+                return HOLD
+            self.generation += 1
+            self._batch_size = max(self._batch_size * self.decrease_factor, self.min_batch_size)
+            if failed:
+                self._concurrency = max(self._concurrency * self.decrease_factor, self.min_concurrency)
+            return DECREASE
+        self._batch_size = min(self._batch_size + self.batch_size_step, self.max_batch_size)
+        self._concurrency = min(self._concurrency + 1 / self.concurrency, self.max_concurrency)
+        return INCREASE
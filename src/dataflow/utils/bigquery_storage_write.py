@@ -0,0 +1,361 @@
+import logging
+import random
+import time
+from concurrent import futures
+from datetime import datetime, timezone
+from typing import Any, Tuple
+
+import apache_beam as beam
+from apache_beam.coders import StrUtf8Coder, VarIntCoder
+from apache_beam.transforms.userstate import ReadModifyWriteStateSpec
+from apache_beam.transforms.util import BatchElements
+from google.api_core import exceptions
+from google.api_core.future import polling
+from google.cloud.bigquery_storage_v1 import BigQueryWriteClient, types, writer
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+
+from dataflow.models.row_schemas import to_dict, to_row
+from dataflow.utils.dead_letter import build_dead_letter
+
+logger = logging.getLogger(__name__)
+
+STREAMING_INSERTS = "streaming_inserts"
+STORAGE_WRITE_AT_LEAST_ONCE = "storage_write_at_least_once"
+STORAGE_WRITE_EXACTLY_ONCE = "storage_write_exactly_once"
+WRITE_METHODS = (STREAMING_INSERTS, STORAGE_WRITE_AT_LEAST_ONCE, STORAGE_WRITE_EXACTLY_ONCE)
+
+_PROTO_TYPES = {
+    "STRING": descriptor_pb2.FieldDescriptorProto.TYPE_STRING,
+    "FLOAT": descriptor_pb2.FieldDescriptorProto.TYPE_DOUBLE,
+    "FLOAT64": descriptor_pb2.FieldDescriptorProto.TYPE_DOUBLE,
+    "INTEGER": descriptor_pb2.FieldDescriptorProto.TYPE_INT64,
+    "INT64": descriptor_pb2.FieldDescriptorProto.TYPE_INT64,
+    "BOOLEAN": descriptor_pb2.FieldDescriptorProto.TYPE_BOOL,
+    "BOOL": descriptor_pb2.FieldDescriptorProto.TYPE_BOOL,
+    # Microseconds since the epoch, as the Storage Write API expects
+    "TIMESTAMP": descriptor_pb2.FieldDescriptorProto.TYPE_INT64,
+}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# AppendRowsFuture.result() polls for its answer, by default after 1s at the earliest
+_APPEND_POLLING = polling.DEFAULT_POLLING.with_delay(initial=0.001, maximum=0.05, multiplier=2).with_timeout(120)
+
+
+def table_path(table):
+    """projects/P/datasets/D/tables/T for a PROJECT:DATASET.TABLE spec."""
+    project, dataset_table = table.split(":", 1)
+    dataset, table_id = dataset_table.split(".", 1)
+    return f"projects/{project}/datasets/{dataset}/tables/{table_id}"
+
+
+def row_message_class(descriptor):
+    """A protobuf message class for a self-contained DescriptorProto."""
+    file_proto = descriptor_pb2.FileDescriptorProto(name=f"{descriptor.name}.proto", syntax="proto2")
+    file_proto.message_type.add().CopyFrom(descriptor)
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    return message_factory.GetMessageClass(pool.FindMessageTypeByName(descriptor.name))
+
+
+def _timestamp_micros(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        delta = value - _EPOCH
+        return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    # Epoch seconds, as streaming inserts accept
+    return int(float(value) * 1_000_000)
+
+
+class ProtoRowEncoder:
+    """Serialize dict rows for a BigQuery schema as the proto2 rows AppendRows takes.
+
+    STRING, FLOAT, INTEGER, BOOLEAN and TIMESTAMP columns, NULLABLE,
+    REQUIRED or REPEATED. TIMESTAMP values may be ISO-8601 strings,
+    datetimes or epoch seconds. encode() raises ValueError for a row BigQuery
+    would refuse (a missing REQUIRED column or a value of the wrong type), so
+    the caller can dead-letter it without a round trip.
+    """
+
+    def __init__(self, schema, message_name="Row"):
+        self.fields = schema["fields"]
+        self.descriptor = descriptor_pb2.DescriptorProto(name=message_name)
+        for number, field in enumerate(self.fields, start=1):
+            bq_type = field["type"].upper()
+            if bq_type not in _PROTO_TYPES:
+                raise ValueError(f"Unsupported BigQuery type {bq_type} for column {field['name']}")
+            mode = field.get("mode", "NULLABLE").upper()
+            self.descriptor.field.add(
+                name=field["name"], number=number, type=_PROTO_TYPES[bq_type],
+                label=(descriptor_pb2.FieldDescriptorProto.LABEL_REPEATED if mode == "REPEATED"
+                       else descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL),
+            )
+        self._message_class = row_message_class(self.descriptor)
+
+    def __getstate__(self):
+        # Message classes do not pickle; unpickling rebuilds the class from the schema
+        return {"fields": self.fields, "message_name": self.descriptor.name}
+
+    def __setstate__(self, state):
+        self.__init__({"fields": state["fields"]}, state["message_name"])
+
+    def encode(self, row):
+        message = self._message_class()
+        for field in self.fields:
+            name = field["name"]
+            value = row.get(name)
+            mode = field.get("mode", "NULLABLE").upper()
+            if value is None or (mode == "REPEATED" and not value):
+                if mode == "REQUIRED":
+                    raise ValueError(f"Missing value for REQUIRED column {name}")
+                continue
+            is_timestamp = field["type"].upper() == "TIMESTAMP"
+            try:
+                if mode == "REPEATED":
+                    getattr(message, name).extend(_timestamp_micros(v) if is_timestamp else v for v in value)
+                else:
+                    setattr(message, name, _timestamp_micros(value) if is_timestamp else value)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Bad value for {field['type']} column {name}: {value!r} ({e})") from e
+        return message.SerializeToString()
+
+
+class OffsetAlreadyExists(Exception):
+    """An exactly-once append whose offset the stream already holds: a replay of a written batch."""
+
+
+class _AppendRowsFn(beam.DoFn):
+    """Append batches of rows through the Storage Write API; emits dead letters.
+
+    Rows that do not encode, and rows AppendRows reports row errors for, are
+    dead-lettered and the rest of the batch is appended again (a request
+    with row errors writes nothing). Transient errors are retried
+    MAX_RETRIES times with backoff, then raised so the runner retries the
+    bundle.
+    """
+
+    MAX_RETRIES = 3
+    RETRY_BACKOFF_SECS = 0.5
+    TRANSIENT_ERRORS = (
+        exceptions.ServiceUnavailable, exceptions.DeadlineExceeded, exceptions.InternalServerError,
+        exceptions.Aborted, exceptions.ResourceExhausted, futures.TimeoutError,
+    )
+
+    def __init__(self, table, schema, pipeline, client_factory=None):
+        self.table = table
+        self.pipeline = pipeline
+        self.client_factory = client_factory
+        self.encoder = ProtoRowEncoder(schema)
+        self.rows_written = beam.metrics.Metrics.counter("WriteToBigQueryStorage", "rows_written")
+        self.rows_already_written = beam.metrics.Metrics.counter("WriteToBigQueryStorage", "rows_already_written")
+        self.rows_dead_lettered = beam.metrics.Metrics.counter("WriteToBigQueryStorage", "rows_dead_lettered")
+        self.append_retry = beam.metrics.Metrics.counter("WriteToBigQueryStorage", "append_retry")
+        self.streams_created = beam.metrics.Metrics.counter("WriteToBigQueryStorage", "streams_created")
+        self.append_latency = beam.metrics.Metrics.distribution("WriteToBigQueryStorage", "append_latency_ms")
+        self.batch_size = beam.metrics.Metrics.distribution("WriteToBigQueryStorage", "batch_size")
+
+    def setup(self):
+        self._client = self.client_factory() if self.client_factory else BigQueryWriteClient()
+        self._table_path = table_path(self.table)
+        # Stream name -> AppendRowsStream, one open connection per stream
+        self._connections = {}
+
+    def teardown(self):
+        for connection in self._connections.values():
+            connection.close()
+        self._connections = {}
+
+    def _create_stream(self):
+        stream = self._client.create_write_stream(
+            parent=self._table_path,
+            write_stream=types.WriteStream(type_=types.WriteStream.Type.COMMITTED),
+        )
+        self.streams_created.inc()
+        return stream.name
+
+    def _connection(self, stream):
+        connection = self._connections.get(stream)
+        if connection is None:
+            template = types.AppendRowsRequest(
+                write_stream=stream,
+                proto_rows=types.AppendRowsRequest.ProtoData(
+                    writer_schema=types.ProtoSchema(proto_descriptor=self.encoder.descriptor),
+                ),
+            )
+            connection = self._connections[stream] = writer.AppendRowsStream(self._client, template)
+        return connection
+
+    def _close_connection(self, stream):
+        connection = self._connections.pop(stream, None)
+        if connection is not None:
+            connection.close()
+
+    def _append(self, stream, serialized_rows, offset):
+        """Row errors as {index: message} for one AppendRows request; {} once written."""
+        request = types.AppendRowsRequest(
+            write_stream=stream,
+            proto_rows=types.AppendRowsRequest.ProtoData(rows=types.ProtoRows(serialized_rows=serialized_rows)),
+        )
+        if offset is not None:
+            request.offset = offset
+        for attempt in range(self.MAX_RETRIES + 1):
+            start = time.monotonic()
+            try:
+                self._connection(stream).send(request).result(polling=_APPEND_POLLING)
+                self.append_latency.update(int((time.monotonic() - start) * 1000))
+                return {}
+            except exceptions.AlreadyExists as e:
+                raise OffsetAlreadyExists(str(e)) from e
+            except exceptions.InvalidArgument as e:
+                row_errors = getattr(getattr(e, "response", None), "row_errors", None)
+                if not row_errors:
+                    raise
+                return {error.index: error.message for error in row_errors}
+            except self.TRANSIENT_ERRORS as e:
+                # The connection may be broken; the next attempt opens a new one
+                self._close_connection(stream)
+                if attempt == self.MAX_RETRIES:
+                    raise
+                self.append_retry.inc()
+                backoff = self.RETRY_BACKOFF_SECS * 2 ** attempt
+                logger.warning(f"AppendRows to {stream} failed: {e}. Retrying in {backoff}s...")
+                time.sleep(backoff)
+
+    def _write(self, stream, rows, offset=None):
+        """(rows written, dead letters) for appending rows to stream at offset."""
+        self.batch_size.update(len(rows))
+        dead_letters = []
+        encoded = []
+        for row in map(to_dict, rows):
+            try:
+                encoded.append((row, self.encoder.encode(row)))
+            except ValueError as e:
+                dead_letters.append(self._dead_letter(row, "encode_error", e))
+        while encoded:
+            try:
+                row_errors = self._append(stream, [data for _, data in encoded], offset)
+            except OffsetAlreadyExists:
+                self.rows_already_written.inc(len(encoded))
+                break
+            if not row_errors:
+                self.rows_written.inc(len(encoded))
+                break
+            dead_letters.extend(self._dead_letter(encoded[i][0], "row_error", message)
+                                for i, message in row_errors.items())
+            encoded = [e for i, e in enumerate(encoded) if i not in row_errors]
+        if dead_letters:
+            self.rows_dead_lettered.inc(len(dead_letters))
+            logger.warning(f"{len(dead_letters)} rows refused by {self.table}: {dead_letters[0]['error_message']}")
+        return len(encoded), dead_letters
+
+    def _dead_letter(self, row, error_type, error_message):
+        return build_dead_letter(
+            pipeline=self.pipeline, stage="write_bigquery", error_type=error_type,
+            error_message=error_message, entity_id=row.get("entity_id"), original_message=row,
+        )
+
+
+class _AppendToDefaultStream(_AppendRowsFn):
+    """At-least-once: every batch goes to the table's _default stream, without offsets."""
+
+    def process(self, batch):
+        _, dead_letters = self._write(f"{self._table_path}/streams/_default", batch)
+        yield from dead_letters
+
+
+class _AppendAtOffsets(_AppendRowsFn):
+    """Exactly-once: one committed stream per shard, appended at offsets kept in Beam state.
+
+    The batch, stream and offset are checkpointed together, so a replayed
+    bundle appends the same rows at the same offset and BigQuery answers
+    ALREADY_EXISTS instead of writing them twice. A stream BigQuery no
+    longer accepts appends at that offset for (OUT_OF_RANGE, NOT_FOUND) is
+    replaced by a new one.
+    """
+
+    STREAM = ReadModifyWriteStateSpec("stream", StrUtf8Coder())
+    OFFSET = ReadModifyWriteStateSpec("offset", VarIntCoder())
+
+    def process(self, element, stream_state=beam.DoFn.StateParam(STREAM), offset_state=beam.DoFn.StateParam(OFFSET)):
+        _, rows = element
+        rows = list(rows)
+        stream = stream_state.read()
+        offset = offset_state.read() or 0
+        for _ in range(2):
+            if stream is None:
+                stream, offset = self._create_stream(), 0
+                stream_state.write(stream)
+            try:
+                written, dead_letters = self._write(stream, rows, offset)
+                break
+            except (exceptions.OutOfRange, exceptions.NotFound) as e:
+                logger.warning(f"Replacing write stream {stream}: {e}")
+                self._close_connection(stream)
+                stream = None
+        else:
+            raise RuntimeError(f"No write stream for {self.table} accepted the batch")
+        offset_state.write(offset + written)
+        yield from dead_letters
+
+
+class WriteToBigQueryStorage(beam.PTransform):
+    """Write dict rows to a BigQuery table with the Storage Write API.
+
+    at-least-once (exactly_once=False): rows are batched with BatchElements
+    and appended to the table's _default stream; a retried bundle may write
+    its rows again. exactly-once: rows are spread over num_shards keys,
+    grouped with GroupIntoBatches, and appended at offsets tracked in Beam
+    state on one committed stream per shard.
+
+    Rows BigQuery refuses come out as dead letters (stage "write_bigquery",
+    error_type "encode_error" or "row_error") instead of failing the job.
+    client_factory returns the BigQueryWriteClient, for pointing the sink at
+    a fake in tests. With a row_type (see dataflow.models.row_schemas), rows
+    are buffered and shuffled as those schema rows, encoded by RowCoder,
+    instead of as dicts.
+    """
+
+    def __init__(self, table, schema, pipeline, exactly_once=False, batch_size=500,
+                 max_batch_duration_secs=1.0, num_shards=8, client_factory=None, row_type=None):
+        super().__init__()
+        self.table = table
+        self.schema = schema
+        self.pipeline = pipeline
+        self.exactly_once = exactly_once
+        self.batch_size = batch_size
+        self.max_batch_duration_secs = max_batch_duration_secs
+        self.num_shards = num_shards
+        self.client_factory = client_factory
+        self.row_type = row_type
+
+    def expand(self, rows):
+        row_type = Any
+        if self.row_type is not None:
+            row_type = self.row_type
+            rows = rows | "To Schema Rows" >> beam.Map(to_row, row_type).with_output_types(row_type)
+        if not self.exactly_once:
+            return (
+                rows
+                | "Batch Rows" >> BatchElements(
+                    min_batch_size=1, max_batch_size=self.batch_size,
+                    max_batch_duration_secs=self.max_batch_duration_secs,
+                )
+                | "Append Rows" >> beam.ParDo(
+                    _AppendToDefaultStream(self.table, self.schema, self.pipeline, self.client_factory)
+                )
+            )
+        return (
+            rows
+            | "Shard Rows" >> beam.Map(
+                lambda row, n: (random.randrange(n), row), self.num_shards,
+            ).with_output_types(Tuple[int, row_type])
+            | "Group Into Batches" >> beam.GroupIntoBatches(
+                self.batch_size, max_buffering_duration_secs=self.max_batch_duration_secs,
+            )
+            | "Append Rows" >> beam.ParDo(
+                _AppendAtOffsets(self.table, self.schema, self.pipeline, self.client_factory)
+            )
+        )
@@ -0,0 +1,95 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """A call refused without being sent because the service's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Thread-safe closed/open/half-open breaker in front of a remote service.
+
+    Closed: calls go through, and failure_threshold consecutive failures open
+    the breaker. Open: calls are refused until reset_timeout_secs have
+    passed, then the breaker goes half-open. Half-open: up to
+    half_open_max_calls probe calls go through; a success closes the breaker,
+    a failure opens it again. A probe that never reports back frees its slot
+    after another reset_timeout_secs, so a lost probe cannot wedge the breaker.
+
+    One instance is shared by every DoFn instance in a worker process (via
+    apache_beam.utils.shared), so an outage seen by one thread stops the
+    others calling too. allow_request(), record_success() and record_failure()
+    return the state the breaker moved to, or None if it did not move, so the
+    caller can count transitions in its own metrics. A call whose outcome says
+    nothing about the service's health (the service refused the request
+    itself) reports release() instead, which only frees its probe slot.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout_secs=30.0, half_open_max_calls=1, clock=time.monotonic):
+        if failure_threshold < 1:
+            raise ValueError(f"failure_threshold must be >= 1, got {failure_threshold}")
+        if half_open_max_calls < 1:
+            raise ValueError(f"half_open_max_calls must be >= 1, got {half_open_max_calls}")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_secs = reset_timeout_secs
+        self.half_open_max_calls = half_open_max_calls
+        self.clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._changed_at = clock()
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow_request(self):
+        """(allowed, transition): whether a call may go out now, and the state this moved the breaker to."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True, None
+            waited = self.clock() - self._changed_at
+            if self._state == OPEN:
+                if waited < self.reset_timeout_secs:
+                    return False, None
+                self._move(HALF_OPEN)
+                self._probes = 1
+                return True, HALF_OPEN
+            if self._probes < self.half_open_max_calls or waited >= self.reset_timeout_secs:
+                self._probes += 1
+                self._changed_at = self.clock()
+                return True, None
+            return False, None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state == CLOSED:
+                return None
+            return self._move(CLOSED)
+
+    def release(self):
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                return self._move(OPEN)
+            self._failures += 1
+            if self._state == CLOSED and self._failures >= self.failure_threshold:
+                return self._move(OPEN)
+            return None
+
+    def _move(self, state):
+        self._state = state
+        self._changed_at = self.clock()
+        self._failures = 0
+        self._probes = 0
+        return state
@@ -56,8 +56,28 @@ def _safe_serialize(obj):
         return repr(obj)
 
 
-def write_dead_letters(pcollection, table, label_prefix=""):
+def write_dead_letters(pcollection, table, label_prefix="", method="streaming_inserts"):
+    """Write dead letters to table with streaming inserts or the Storage Write API.
+
+    method is one of bigquery_storage_write.WRITE_METHODS. With the Storage
+    Write API, dead letters the table itself refuses are logged and counted
+    (WriteToBigQueryStorage's rows_dead_lettered) and dropped.
+    """
+    # Imported here: bigquery_storage_write builds its dead letters with this module
+    from dataflow.utils.bigquery_storage_write import (
+        STORAGE_WRITE_EXACTLY_ONCE,
+        STREAMING_INSERTS,
+        WriteToBigQueryStorage,
+    )
+
     prefix = f"{label_prefix} " if label_prefix else ""
+    if method != STREAMING_INSERTS:
+        return pcollection | f"{prefix}Write Dead Letters" >> WriteToBigQueryStorage(
+            table=table,
+            schema=DEAD_LETTER_SCHEMA,
+            pipeline="dead_letters",
+            exactly_once=method == STORAGE_WRITE_EXACTLY_ONCE,
+        )
     return pcollection | f"{prefix}Write Dead Letters" >> WriteToBigQuery(
         table=table,
         schema=DEAD_LETTER_SCHEMA,
@@ -0,0 +1,45 @@
+import collections
+
+from apache_beam.metrics.metricbase import Counter, Distribution, Gauge
+
+
+class DeferredMetrics:
+    """Beam metric updates made off the bundle thread, replayed on it.
+
+    Beam attributes a metric update to the step whose bundle is running on
+    the calling thread, so updates from a DoFn's helper threads or background
+    event loop are silently dropped. wrap_all() swaps a DoFn's counters,
+    distributions and gauges for stand-ins that queue their updates, and
+    flush(), called from process() or finish_bundle(), applies them.
+    """
+
+    def __init__(self):
+        self._updates = collections.deque()
+
+    def wrap_all(self, dofn):
+        for name, value in list(vars(dofn).items()):
+            if isinstance(value, (Counter, Distribution, Gauge)):
+                setattr(dofn, name, _DeferredMetric(value, self._updates))
+
+    def flush(self):
+        while self._updates:
+            update, value = self._updates.popleft()
+            update(value)
+
+
+class _DeferredMetric:
+    def __init__(self, metric, updates):
+        self._metric = metric
+        self._updates = updates
+
+    def inc(self, n=1):
+        self._updates.append((self._metric.inc, n))
+
+    def dec(self, n=1):
+        self._updates.append((self._metric.inc, -n))
+
+    def update(self, value):
+        self._updates.append((self._metric.update, value))
+
+    def set(self, value):
+        self._updates.append((self._metric.set, value))
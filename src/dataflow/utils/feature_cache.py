@@ -0,0 +1,67 @@
+import threading
+import time
+from collections import OrderedDict
+
+HIT = "hit"
+NEGATIVE_HIT = "negative_hit"
+MISS = "miss"
+EXPIRED = "expired"
+
+
+class FeatureCache:
+    """Thread-safe, size-bounded LRU of entity_id -> feature dict with expiry.
+
+    Found features live for ttl_secs. Entities the online store had no
+    features for are remembered for negative_ttl_secs, which should be short:
+    the feature pipeline may write them at any moment. One instance is shared
+    by every DoFn instance in a worker process (via apache_beam.utils.shared),
+    so lookups and stores take a lock.
+    """
+
+    def __init__(self, max_entries, ttl_secs=60.0, negative_ttl_secs=5.0, clock=time.monotonic):
+        if max_entries < 1:
+            raise ValueError(f"max_entries must be >= 1, got {max_entries}")
+        self.max_entries = max_entries
+        self.ttl_secs = ttl_secs
+        self.negative_ttl_secs = negative_ttl_secs
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, entity_id):
+        """(status, features): HIT with a copy of the features, NEGATIVE_HIT, MISS or EXPIRED."""
+        with self._lock:
+            entry = self._entries.get(entity_id)
+            if entry is None:
+                return MISS, None
+            expires_at, features = entry
+            if expires_at <= self.clock():
+                del self._entries[entity_id]
+                return EXPIRED, None
+            self._entries.move_to_end(entity_id)
+        if features is None:
+            return NEGATIVE_HIT, None
+        return HIT, dict(features)
+
+    def store(self, entity_id, features):
+        """Cache found features; returns how many entries were evicted to make room."""
+        return self._put(entity_id, dict(features), self.ttl_secs)
+
+    def store_missing(self, entity_id):
+        """Remember that entity_id has no features; returns how many entries were evicted."""
+        if self.negative_ttl_secs <= 0:
+            return 0
+        return self._put(entity_id, None, self.negative_ttl_secs)
+
+    def _put(self, entity_id, features, ttl_secs):
+        with self._lock:
+            self._entries[entity_id] = (self.clock() + ttl_secs, features)
+            self._entries.move_to_end(entity_id)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        return evicted
@@ -0,0 +1,55 @@
+import asyncio
+import collections
+
+import numpy as np
+
+
+class LatencyWindow:
+    """The last max_samples call latencies, for a percentile-based hedge delay.
+
+    Not thread-safe: one instance belongs to one DoFn instance and its event loop.
+    """
+
+    def __init__(self, max_samples=500, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = collections.deque(maxlen=max_samples)
+
+    def record(self, latency_ms):
+        self._samples.append(latency_ms)
+
+    def percentile(self, q):
+        """The q-th percentile of the recorded latencies, or None below min_samples."""
+        if len(self._samples) < self.min_samples:
+            return None
+        return float(np.percentile(self._samples, q))
+
+
+async def hedged(call, delay_secs, on_hedge=None):
+    """(result, hedge_won) for the coroutine function call, duplicated if slower than delay_secs.
+
+    The first call's result is used if it settles within delay_secs, or if
+    delay_secs is None. Otherwise call() is started a second time, after
+    calling on_hedge(), and whichever copy succeeds first wins; the other is
+    cancelled. Only if both fail is the first copy's error raised.
+    """
+    primary = asyncio.ensure_future(call())
+    if delay_secs is None:
+        return await primary, False
+    done, _ = await asyncio.wait([primary], timeout=delay_secs)
+    if done:
+        return primary.result(), False
+
+    if on_hedge is not None:
+        on_hedge()
+    hedge = asyncio.ensure_future(call())
+    pending = {primary, hedge}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in (primary, hedge):
+                if task in done and task.exception() is None:
+                    return task.result(), task is hedge
+        raise primary.exception()
+    finally:
+        for task in pending:
+            task.cancel()
@@ -1,30 +1,67 @@
+import asyncio
+import heapq
 import time
 import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import apache_beam as beam
+from apache_beam.coders import PickleCoder
+from apache_beam.transforms.timeutil import TimeDomain
+from apache_beam.transforms.userstate import BagStateSpec, TimerSpec, on_timer
+from apache_beam.utils.shared import Shared
+from apache_beam.utils.timestamp import Timestamp
 from google.cloud.aiplatform_v1 import FeatureOnlineStoreServiceClient
 from google.cloud.aiplatform_v1.types import (
     FetchFeatureValuesRequest,
     FeatureViewDataKey,
 )
 
+from dataflow.models.row_schemas import to_dict
 from dataflow.utils.dead_letter import DEAD_LETTER_TAG, build_dead_letter
+from dataflow.utils.feature_cache import EXPIRED, HIT, NEGATIVE_HIT, FeatureCache
 
 logger = logging.getLogger(__name__)
 
+# Output tag for elements whose features were missing, with defer_missing=True
+MISSING_FEATURES_TAG = "missing_features"
+
 
 class FetchFeaturesFromOnlineStore(beam.DoFn):
     """Fetch feature values from the Feature Store online store by entity_id.
 
-    Processes batched elements (from BatchElements) and fetches each entity_id
-    sequentially using the sync client.
+    Processes batched elements (from BatchElements). With max_concurrency=1
+    each entity_id is fetched sequentially using the sync client. Higher
+    values fetch up to max_concurrency entities at a time on a thread pool
+    sharing the client; an entity waiting out its retry backoff is
+    rescheduled rather than sleeping, so it holds up neither the pool nor
+    the other entities in the batch.
+
+    cache_max_entries > 0 puts a worker-local FeatureCache in front of the
+    store, shared by every instance of this DoFn in the worker process.
+    Features are served from it for up to cache_ttl_secs; entities found
+    without features are dead-lettered straight from it for
+    cache_negative_ttl_secs.
+
+    With defer_missing=True an entity found without features is emitted
+    under MISSING_FEATURES_TAG straight away instead of being retried in
+    process(), for RetryMissingFeatures to re-fetch on a timer. Fetch errors
+    are still retried here.
+
+    Stages that drive the fetch themselves use the per-element API:
+    serve_from_cache(batch), then fetch(element), or fetch_async(element,
+    executor) from an event loop, for each element left. Each returns what
+    process() emits for that element.
 
     v1 (GA) is used for reads — fetch_feature_values is a stable API.
     v1beta1 is only needed for writes (feature_view_direct_write).
     """
 
     def __init__(self, project_id, region, online_store_id, feature_view_id,
-                 feature_columns, max_retries=1, initial_backoff_secs=0.5):
+                 feature_columns, max_retries=1, initial_backoff_secs=0.5, max_concurrency=1,
+                 cache_max_entries=0, cache_ttl_secs=60.0, cache_negative_ttl_secs=5.0,
+                 defer_missing=False):
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be >= 1, got {max_concurrency}")
         self.project_id = project_id
         self.region = region
         self.online_store_id = online_store_id
@@ -32,92 +69,326 @@ class FetchFeaturesFromOnlineStore(beam.DoFn):
         self.feature_columns = set(feature_columns)
         self.max_retries = max_retries
         self.initial_backoff_secs = initial_backoff_secs
+        self.max_concurrency = max_concurrency
+        self.cache_max_entries = cache_max_entries
+        self.cache_ttl_secs = cache_ttl_secs
+        self.cache_negative_ttl_secs = cache_negative_ttl_secs
+        self._shared_cache = Shared() if cache_max_entries > 0 else None
+        self.defer_missing = defer_missing
         self.fetch_latency = beam.metrics.Metrics.distribution("FetchFeaturesFromOnlineStore", "fetch_latency_ms")
         self.fetch_success = beam.metrics.Metrics.counter("FetchFeaturesFromOnlineStore", "fetch_success")
         self.fetch_failure = beam.metrics.Metrics.counter("FetchFeaturesFromOnlineStore", "fetch_failure")
         self.fetch_retry = beam.metrics.Metrics.counter("FetchFeaturesFromOnlineStore", "fetch_retry")
         self.fetch_missing = beam.metrics.Metrics.counter("FetchFeaturesFromOnlineStore", "fetch_missing_features")
+        self.fetch_deferred = beam.metrics.Metrics.counter("FetchFeaturesFromOnlineStore", "fetch_deferred")
+        self.cache_hit = beam.metrics.Metrics.counter("FetchFeaturesFromOnlineStore", "feature_cache_hit")
+        self.cache_negative_hit = beam.metrics.Metrics.counter("FetchFeaturesFromOnlineStore", "feature_cache_negative_hit")
+        self.cache_miss = beam.metrics.Metrics.counter("FetchFeaturesFromOnlineStore", "feature_cache_miss")
+        self.cache_expired = beam.metrics.Metrics.counter("FetchFeaturesFromOnlineStore", "feature_cache_expired")
+        self.cache_evicted = beam.metrics.Metrics.counter("FetchFeaturesFromOnlineStore", "feature_cache_evicted")
 
     def setup(self):
-        self._client = FeatureOnlineStoreServiceClient(
-            client_options={"api_endpoint": f"{self.region}-aiplatform.googleapis.com"}
-        )
+        self._client = self._create_client()
         self._feature_view_name = (
             f"projects/{self.project_id}/locations/{self.region}"
             f"/featureOnlineStores/{self.online_store_id}"
             f"/featureViews/{self.feature_view_id}"
         )
+        self._pool = ThreadPoolExecutor(self.max_concurrency) if self.max_concurrency > 1 else None
+        self._cache = self._shared_cache.acquire(self._create_cache) if self._shared_cache else None
+
+    def _create_cache(self):
+        return FeatureCache(self.cache_max_entries, self.cache_ttl_secs, self.cache_negative_ttl_secs)
+
+    def _create_client(self):
+        return FeatureOnlineStoreServiceClient(
+            client_options={"api_endpoint": f"{self.region}-aiplatform.googleapis.com"}
+        )
+
+    def teardown(self):
+        if getattr(self, "_pool", None) is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
 
     def process(self, batch):
+        served, batch = self.serve_from_cache(batch)
+        yield from served
+        if self._pool is None:
+            for element in batch:
+                yield self.fetch(element)
+        else:
+            yield from self._fetch_concurrently(batch)
+
+    def serve_from_cache(self, batch):
+        """(results for cached entities, elements still to fetch); everything is to fetch without a cache."""
+        if self._cache is None:
+            return [], list(batch)
+        served, to_fetch = [], []
         for element in batch:
-            result = self._fetch_one(element)
-            if result is not None:
-                yield result
+            status, features = self._cache.lookup(element["entity_id"])
+            if status == HIT:
+                self.cache_hit.inc()
+                element.update(features)
+                served.append(element)
+            elif status == NEGATIVE_HIT:
+                self.cache_negative_hit.inc()
+                if self.defer_missing:
+                    self.fetch_deferred.inc()
+                    served.append(beam.pvalue.TaggedOutput(MISSING_FEATURES_TAG, element))
+                    continue
+                self.fetch_missing.inc()
+                served.append(beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
+                    pipeline="inference", stage="fetch", error_type="missing_features",
+                    error_message="Missing features (cached negative lookup)",
+                    entity_id=element["entity_id"], retry_count=0,
+                )))
+            else:
+                if status == EXPIRED:
+                    self.cache_expired.inc()
+                self.cache_miss.inc()
+                to_fetch.append(element)
+        return served, to_fetch
 
-    def _fetch_one(self, element):
-        entity_id = element["entity_id"]
+    def fetch(self, element):
+        """Fetch element's features through its retries: the enriched element or a TaggedOutput."""
         start = time.monotonic()
-        retry_count = 0
         for attempt in range(self.max_retries + 1):
-            try:
-                response = self._client.fetch_feature_values(
-                    request=FetchFeatureValuesRequest(
-                        feature_view=self._feature_view_name,
-                        data_key=FeatureViewDataKey(key=entity_id),
-                    )
+            result, backoff = self._handle_attempt(element, attempt, start, *self._attempt(element))
+            if backoff is None:
+                return result
+            time.sleep(backoff)
+
+    async def fetch_async(self, element, executor=None):
+        """fetch() from an event loop: each lookup runs on executor and backoffs are awaited."""
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            outcome = await loop.run_in_executor(executor, self._attempt, element)
+            result, backoff = self._handle_attempt(element, attempt, start, *outcome)
+            if backoff is None:
+                return result
+            await asyncio.sleep(backoff)
+
+    def _attempt(self, element):
+        """(features, None) from one lookup of element, or (None, error)."""
+        try:
+            return self._request(element["entity_id"]), None
+        except Exception as e:
+            return None, e
+
+    def _fetch_concurrently(self, batch):
+        """Yield each element's result as soon as its fetch settles.
+
+        Attempts run on the pool; retries wait in a heap until their backoff
+        has passed. Metrics and logging stay on the bundle's thread.
+        """
+        start = time.monotonic()
+        in_flight = {}
+        retries = []
+
+        def submit(index, attempt):
+            future = self._pool.submit(self._request, batch[index]["entity_id"])
+            in_flight[future] = (index, attempt)
+
+        for index in range(len(batch)):
+            submit(index, 0)
+
+        while in_flight or retries:
+            now = time.monotonic()
+            while retries and retries[0][0] <= now:
+                _, index, attempt = heapq.heappop(retries)
+                submit(index, attempt)
+            timeout = max(retries[0][0] - now, 0) if retries else None
+            done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, attempt = in_flight.pop(future)
+                error = future.exception()
+                features = None if error is not None else future.result()
+                result, backoff = self._handle_attempt(batch[index], attempt, start, features, error)
+                if backoff is None:
+                    if result is not None:
+                        yield result
+                else:
+                    heapq.heappush(retries, (time.monotonic() + backoff, index, attempt + 1))
+
+    def _request(self, entity_id):
+        """The configured feature columns present for entity_id in the online store."""
+        response = self._client.fetch_feature_values(
+            request=FetchFeatureValuesRequest(
+                feature_view=self._feature_view_name,
+                data_key=FeatureViewDataKey(key=entity_id),
+            )
+        )
+        return {
+            pair.name: pair.value.double_value
+            for pair in response.key_values.features
+            if pair.name in self.feature_columns
+        }
+
+    def _handle_attempt(self, element, attempt, start, features, error):
+        """Settle one fetch attempt: (result, None), or (None, backoff_secs) to try again.
+
+        result is the enriched element or a dead-letter TaggedOutput.
+        """
+        entity_id = element["entity_id"]
+        retry_count = attempt
+        if error is None and len(features) == len(self.feature_columns):
+            elapsed_ms = int((time.monotonic() - start) * 1000)
+            self.fetch_latency.update(elapsed_ms)
+            self.fetch_success.inc()
+            element.update(features)
+            if self._cache is not None:
+                self.cache_evicted.inc(self._cache.store(entity_id, features))
+            return element, None
+
+        if error is None and self.defer_missing:
+            self.fetch_deferred.inc()
+            if self._cache is not None:
+                self.cache_evicted.inc(self._cache.store_missing(entity_id))
+            return beam.pvalue.TaggedOutput(MISSING_FEATURES_TAG, element), None
+
+        if attempt < self.max_retries:
+            self.fetch_retry.inc()
+            backoff = self.initial_backoff_secs * (2 ** attempt)
+            if error is None:
+                logger.info(
+                    f"Missing features for entity_id={entity_id}, "
+                    f"retrying in {backoff}s"
+                )
+            else:
+                logger.warning(
+                    f"Feature fetch failed for entity_id={entity_id}, "
+                    f"retrying in {backoff}s: {error}"
                 )
+            return None, backoff
+
+        if error is None:
+            self.fetch_missing.inc()
+            if self._cache is not None:
+                self.cache_evicted.inc(self._cache.store_missing(entity_id))
+            missing = self.feature_columns - set(features.keys())
+            logger.warning(
+                f"Missing features for entity_id={entity_id} "
+                f"after {self.max_retries} retries: {missing}"
+            )
+            return beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
+                pipeline="inference", stage="fetch", error_type="missing_features",
+                error_message=f"Missing features: {missing}",
+                entity_id=entity_id, retry_count=retry_count,
+            )), None
+
+        self.fetch_failure.inc()
+        logger.error(
+            f"Feature fetch failed for entity_id={entity_id} "
+            f"after {self.max_retries} retries: {error}"
+        )
+        return beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
+            pipeline="inference", stage="fetch", error_type="fetch_error",
+            error_message=error, entity_id=entity_id, retry_count=retry_count,
+        )), None
 
-                features = {}
-                for pair in response.key_values.features:
-                    if pair.name in self.feature_columns:
-                        features[pair.name] = pair.value.double_value
 
-                if len(features) == len(self.feature_columns):
-                    elapsed_ms = int((time.monotonic() - start) * 1000)
-                    self.fetch_latency.update(elapsed_ms)
+class RetryMissingFeatures(FetchFeaturesFromOnlineStore):
+    """Re-fetch entities whose features were missing, on processing-time timers.
+
+    Takes (entity_id, element) pairs built from FetchFeaturesFromOnlineStore's
+    MISSING_FEATURES_TAG output, the elements dicts or schema rows. Elements
+    wait in per-key state while a timer runs, so the bundle that deferred
+    them is not held up. Each element keeps its own schedule: a firing
+    re-fetches the key once for the elements that are due, and those still
+    missing wait again, with the backoff doubling from initial_backoff_secs
+    up to max_backoff_secs. An element whose next wait would end more than
+    retry_horizon_secs after it was first deferred is dead-lettered instead.
+    """
+
+    PENDING = BagStateSpec("pending", PickleCoder())
+    RETRY_TIMER = TimerSpec("retry", TimeDomain.REAL_TIME)
+
+    def __init__(self, project_id, region, online_store_id, feature_view_id, feature_columns,
+                 retry_horizon_secs=60.0, initial_backoff_secs=0.5, max_backoff_secs=30.0):
+        super().__init__(
+            project_id, region, online_store_id, feature_view_id, feature_columns,
+            max_retries=0, initial_backoff_secs=initial_backoff_secs,
+        )
+        self.retry_horizon_secs = retry_horizon_secs
+        self.max_backoff_secs = max_backoff_secs
+        self.retry_attempt = beam.metrics.Metrics.counter("RetryMissingFeatures", "retry_attempt")
+        self.retry_recovered = beam.metrics.Metrics.counter("RetryMissingFeatures", "retry_recovered")
+        self.retry_expired = beam.metrics.Metrics.counter("RetryMissingFeatures", "retry_expired")
+        self.retries_to_recover = beam.metrics.Metrics.distribution("RetryMissingFeatures", "retries_to_recover")
+
+    def _backoff(self, retries):
+        return min(self.initial_backoff_secs * (2 ** retries), self.max_backoff_secs)
+
+    def process(self, keyed_element, pending=beam.DoFn.StateParam(PENDING),
+                retry_timer=beam.DoFn.TimerParam(RETRY_TIMER)):
+        element = to_dict(keyed_element[1])
+        if self.retry_horizon_secs < self._backoff(0):
+            yield self._expired(element, retries=0, error=None)
+            return
+        now = Timestamp.now()
+        due = now + self._backoff(0)
+        # The key's timer is set for its earliest due element
+        waiting = list(pending.read())
+        if not waiting or due < min(entry_due for _, _, _, entry_due in waiting):
+            retry_timer.set(due)
+        pending.add((element, 0, now, due))
+
+    @on_timer(RETRY_TIMER)
+    def retry(self, fired_at=beam.DoFn.TimestampParam, pending=beam.DoFn.StateParam(PENDING),
+              retry_timer=beam.DoFn.TimerParam(RETRY_TIMER)):
+        # Never before the time the timer was set for, though a test clock may fire it early
+        now = max(fired_at, Timestamp.now())
+        waiting = list(pending.read())
+        pending.clear()
+        due = [entry for entry in waiting if entry[3] <= now]
+        waiting = [entry for entry in waiting if entry[3] > now]
+
+        if due:
+            # The elements all carry the key's entity_id, so one fetch serves them all
+            self.retry_attempt.inc()
+            try:
+                features, error = self._request(due[0][0]["entity_id"]), None
+            except Exception as e:
+                features, error = {}, e
+            recovered = error is None and len(features) == len(self.feature_columns)
+            for element, retries, first_pending, _ in due:
+                retries += 1
+                if recovered:
+                    self.retry_recovered.inc()
+                    self.retries_to_recover.update(retries)
                     self.fetch_success.inc()
                     element.update(features)
-                    return element
-
-                if attempt < self.max_retries:
-                    retry_count += 1
-                    self.fetch_retry.inc()
-                    backoff = self.initial_backoff_secs * (2 ** attempt)
-                    logger.info(
-                        f"Missing features for entity_id={entity_id}, "
-                        f"retrying in {backoff}s"
-                    )
-                    time.sleep(backoff)
-                else:
-                    self.fetch_missing.inc()
-                    missing = self.feature_columns - set(features.keys())
-                    logger.warning(
-                        f"Missing features for entity_id={entity_id} "
-                        f"after {self.max_retries} retries: {missing}"
-                    )
-                    return beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
-                        pipeline="inference", stage="fetch", error_type="missing_features",
-                        error_message=f"Missing features: {missing}",
-                        entity_id=entity_id, retry_count=retry_count,
-                    ))
+                    yield element
+                    continue
 
-            except Exception as e:
-                if attempt < self.max_retries:
-                    retry_count += 1
-                    self.fetch_retry.inc()
-                    backoff = self.initial_backoff_secs * (2 ** attempt)
-                    logger.warning(
-                        f"Feature fetch failed for entity_id={entity_id}, "
-                        f"retrying in {backoff}s: {e}"
-                    )
-                    time.sleep(backoff)
-                else:
-                    self.fetch_failure.inc()
-                    logger.error(
-                        f"Feature fetch failed for entity_id={entity_id} "
-                        f"after {self.max_retries} retries: {e}"
-                    )
-                    return beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
-                        pipeline="inference", stage="fetch", error_type="fetch_error",
-                        error_message=e, entity_id=entity_id, retry_count=retry_count,
-                    ))
+                backoff = self._backoff(retries)
+                if (now - first_pending) + backoff > self.retry_horizon_secs:
+                    yield self._expired(element, retries, error)
+                    continue
+                waiting.append((element, retries, first_pending, now + backoff))
+
+        for entry in waiting:
+            pending.add(entry)
+        if waiting:
+            retry_timer.set(min(entry_due for _, _, _, entry_due in waiting))
+
+    def _expired(self, element, retries, error):
+        entity_id = element["entity_id"]
+        self.retry_expired.inc()
+        if error is not None:
+            self.fetch_failure.inc()
+            logger.error(f"Feature fetch failed for entity_id={entity_id} after {retries} deferred retries: {error}")
+            return beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
+                pipeline="inference", stage="fetch", error_type="fetch_error",
+                error_message=error, entity_id=entity_id, retry_count=retries,
+            ))
+        self.fetch_missing.inc()
+        logger.warning(
+            f"Missing features for entity_id={entity_id} after {retries} deferred retries "
+            f"({self.retry_horizon_secs}s horizon)"
+        )
+        return beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, build_dead_letter(
+            pipeline="inference", stage="fetch", error_type="missing_features",
+            error_message=f"Missing features after {self.retry_horizon_secs}s retry horizon",
+            entity_id=entity_id, retry_count=retries,
+        ))
@@ -1,20 +1,201 @@
+import collections
+import heapq
+import itertools
 import logging
+import queue
+import random
+import threading
 import time
+from concurrent import futures
 
 import apache_beam as beam
+from apache_beam.coders import PickleCoder
+from apache_beam.transforms.timeutil import TimeDomain
+from apache_beam.transforms.userstate import ReadModifyWriteStateSpec, TimerSpec, on_timer
+from apache_beam.utils.timestamp import Timestamp
+from apache_beam.utils.windowed_value import WindowedValue
 from google.cloud.aiplatform_v1beta1 import FeatureOnlineStoreServiceClient
-from google.cloud.aiplatform_v1beta1.types import (
-    FeatureViewDirectWriteRequest,
-    FeatureViewDataKey,
-    FeatureValue,
-)
+from google.cloud.aiplatform_v1beta1.types import FeatureViewDirectWriteRequest
+from google.rpc import code_pb2
+
+from dataflow.utils.dead_letter import DEAD_LETTER_TAG, build_dead_letter
+from dataflow.utils.deferred_metrics import DeferredMetrics
 
 logger = logging.getLogger(__name__)
 
-# Aliases for deeply nested proto types to keep _build_entry readable
-DataKeyAndFeatureValues = FeatureViewDirectWriteRequest.DataKeyAndFeatureValues
-Feature = DataKeyAndFeatureValues.Feature
-FeatureValueAndTimestamp = Feature.FeatureValueAndTimestamp
+# Ends a DirectWriteStream's request iterator, half-closing the stream
+_CLOSE = object()
+# How often a send() blocked on a full request queue checks whether the stream has closed
+_SEND_POLL_SECS = 0.5
+
+# Per-key statuses worth writing the key again for
+RETRYABLE_CODES = frozenset({
+    code_pb2.UNAVAILABLE, code_pb2.DEADLINE_EXCEEDED, code_pb2.RESOURCE_EXHAUSTED, code_pb2.ABORTED,
+    code_pb2.INTERNAL,
+})
+
+
+def _code_name(code):
+    try:
+        return code_pb2.Code.Name(code)
+    except ValueError:
+        return str(code)
+
+
+class _BatchWrite:
+    """One attempt at writing some rows: its direct-write request and the outcome of each row."""
+
+    def __init__(self, rows, request, attempt=0):
+        self.rows = rows
+        self.request = request
+        self.attempt = attempt
+        # Row index -> (error_type, error message, retryable) for the rows whose write failed
+        self.errors = {}
+        self.unsettled = len(rows)
+        self.sent_at = None
+        self.future = futures.Future()
+
+
+class DirectWriteStream:
+    """One long-lived FeatureViewDirectWrite stream, with its responses matched back to rows.
+
+    send() puts a batch's request on a bounded queue that the stream's
+    request iterator drains. A reader thread settles rows as responses
+    arrive: the API answers every data key it was sent, listing failing keys
+    in their own non-OK responses, whose status is recorded per row. A key
+    is matched to the oldest unsettled row with that entity_id, so one
+    entity in several batches in flight settles in send order.
+    on_settled(write) is called, on the reader thread, once every row of a
+    batch is settled.
+
+    When the stream fails or the server ends it, every unsettled row gets
+    error_type "stream_error" (retryable) and the stream is closed; send()
+    then returns False and the caller opens a new stream. A send() blocked
+    on a full queue when that happens returns, its rows failed with the
+    others. abort() also cancels the RPC, so an unanswered stream and its
+    reader thread do not outlive it.
+    """
+
+    def __init__(self, client, max_queued, on_settled):
+        self._client = client
+        # Room for the close marker next to max_queued requests
+        self._requests = queue.Queue(maxsize=max_queued + 1)
+        self._on_settled = on_settled
+        # entity_id -> deque of (_BatchWrite, row index) awaiting a response
+        self._pending = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+        self.closed = False
+        # The RPC, once the client has returned it, and whether it is to be cancelled when it does
+        self._call = None
+        self._cancelled = False
+        self._reader = threading.Thread(target=self._read, name="direct-write-reader", daemon=True)
+        self._reader.start()
+
+    def send(self, write):
+        """Queue write's request on the stream; False if the stream has closed."""
+        with self._lock:
+            if self.closed:
+                return False
+            for index, row in enumerate(write.rows):
+                self._pending[row["entity_id"]].append((write, index))
+        write.sent_at = time.monotonic()
+        while True:
+            try:
+                self._requests.put(write.request, timeout=_SEND_POLL_SECS)
+                return True
+            except queue.Full:
+                # Nothing drains the queue of a closed stream; write's rows were failed as it closed
+                if self.closed:
+                    return True
+
+    def close(self, timeout=None):
+        """Half-close the stream, waiting up to timeout for answers to what is in flight."""
+        with self._lock:
+            self.closed = True
+        self._end_requests()
+        self._reader.join(timeout)
+        if self._reader.is_alive():
+            self.abort("Stream closed before the server answered")
+
+    def abort(self, error):
+        """Fail every unsettled row with error, close the stream and cancel its RPC."""
+        self._fail_pending(error)
+        with self._lock:
+            self._cancelled = True
+            call = self._call
+        if call is not None:
+            call.cancel()
+
+    def _read(self):
+        error = "Stream ended by the server"
+        try:
+            # The client only returns once the first response is in, hence on this thread. An abort before
+            # then cannot cancel the call: it ends the request iterator instead, and the call is cancelled here
+            call = self._client.feature_view_direct_write(requests=iter(self._requests.get, _CLOSE))
+            with self._lock:
+                self._call = call
+                cancelled = self._cancelled
+            if cancelled:
+                call.cancel()
+            for response in call:
+                self._settle(response)
+        except Exception as e:
+            error = e
+        self._fail_pending(error)
+
+    def _settle(self, response):
+        code = response.status.code
+        failed = code != code_pb2.OK
+        if failed:
+            error = ("write_error", f"{_code_name(code)}: {response.status.message}", code in RETRYABLE_CODES)
+        settled = []
+        with self._lock:
+            for write_response in response.write_responses:
+                key = write_response.data_key.key
+                waiting = self._pending.get(key)
+                if not waiting:
+                    logger.warning(f"Direct write response for {key}, which has no write in flight")
+                    continue
+                write, index = waiting.popleft()
+                if not waiting:
+                    del self._pending[key]
+                if failed:
+                    write.errors[index] = error
+                write.unsettled -= 1
+                if write.unsettled == 0:
+                    settled.append(write)
+        for write in settled:
+            self._on_settled(write)
+
+    def _fail_pending(self, error):
+        settled = []
+        with self._lock:
+            self.closed = True
+            pending, self._pending = self._pending, collections.defaultdict(collections.deque)
+            for waiting in pending.values():
+                for write, index in waiting:
+                    write.errors[index] = ("stream_error", str(error), True)
+                    write.unsettled -= 1
+                    if write.unsettled == 0:
+                        settled.append(write)
+        # Requests still queued belong to the rows just failed; drop them so the close marker fits
+        self._end_requests(discard_queued=True)
+        if pending:
+            logger.warning(f"Direct write stream failed with {sum(map(len, pending.values()))} rows unanswered: {error}")
+        for write in settled:
+            self._on_settled(write)
+
+    def _end_requests(self, discard_queued=False):
+        if discard_queued:
+            while True:
+                try:
+                    self._requests.get_nowait()
+                except queue.Empty:
+                    break
+        try:
+            self._requests.put_nowait(_CLOSE)
+        except queue.Full:
+            pass
 
 
 class WriteToOnlineStore(beam.DoFn):
@@ -22,69 +203,269 @@ class WriteToOnlineStore(beam.DoFn):
 
     Uses the v1beta1 feature_view_direct_write streaming RPC.
     Expects each batch element to be a dict with 'entity_id' and feature columns.
+
+    Each DoFn instance keeps one DirectWriteStream open across bundles and
+    up to max_in_flight_batches requests on it at once; process() blocks
+    only while that many are unanswered (backpressure_wait_ms). A batch's
+    rows are emitted, in its window and timestamp, once every key in it is
+    answered: written rows on the main output, rows whose write failed as
+    dead letters (stage "write_online_store"). If no batch is answered for
+    WRITE_TIMEOUT_SECS the stream is aborted, failing its unanswered rows
+    with "stream_error", and the next batch opens a new one.
+
+    Only the failed rows of a batch are written again: rows whose key came
+    back with a retryable status (UNAVAILABLE, DEADLINE_EXCEEDED, ...) or
+    was stranded on a failed stream, up to max_retries times, after a
+    backoff drawn uniformly from zero to initial_backoff_secs doubling per
+    retry (at most max_backoff_secs). Retries wait in a heap instead of
+    blocking process(), and finish_bundle waits them out. Rows refused with
+    any other status are dead-lettered straight away (rows_refused), rows
+    still failing after the last retry with their retry_count
+    (rows_retries_exhausted). rows_retried counts rows written again and
+    rows_recovered those a retry wrote.
+
+    client_factory returns the v1beta1 FeatureOnlineStoreServiceClient, for
+    pointing the DoFn at a fake in tests.
     """
 
-    def __init__(self, project_id, region, online_store_id, feature_view_id, feature_columns):
+    WRITE_TIMEOUT_SECS = 60
+
+    def __init__(self, project_id, region, online_store_id, feature_view_id, feature_columns,
+                 max_in_flight_batches=4, max_retries=3, initial_backoff_secs=0.2, max_backoff_secs=5.0,
+                 client_factory=None):
+        if max_in_flight_batches < 1:
+            raise ValueError(f"max_in_flight_batches must be >= 1, got {max_in_flight_batches}")
         self.project_id = project_id
         self.region = region
         self.online_store_id = online_store_id
         self.feature_view_id = feature_view_id
         self.feature_columns = feature_columns
+        self.max_in_flight_batches = max_in_flight_batches
+        self.max_retries = max_retries
+        self.initial_backoff_secs = initial_backoff_secs
+        self.max_backoff_secs = max_backoff_secs
+        self.client_factory = client_factory
         self.write_latency = beam.metrics.Metrics.distribution("WriteToOnlineStore", "write_latency_ms")
         self.write_success = beam.metrics.Metrics.counter("WriteToOnlineStore", "write_success")
         self.write_failure = beam.metrics.Metrics.counter("WriteToOnlineStore", "write_failure")
         self.rows_written = beam.metrics.Metrics.counter("WriteToOnlineStore", "rows_written")
+        self.rows_retried = beam.metrics.Metrics.counter("WriteToOnlineStore", "rows_retried")
+        self.rows_recovered = beam.metrics.Metrics.counter("WriteToOnlineStore", "rows_recovered")
+        self.rows_refused = beam.metrics.Metrics.counter("WriteToOnlineStore", "rows_refused")
+        self.rows_retries_exhausted = beam.metrics.Metrics.counter("WriteToOnlineStore", "rows_retries_exhausted")
+        self.rows_dead_lettered = beam.metrics.Metrics.counter("WriteToOnlineStore", "rows_dead_lettered")
+        self.streams_opened = beam.metrics.Metrics.counter("WriteToOnlineStore", "streams_opened")
+        self.in_flight_batches = beam.metrics.Metrics.distribution("WriteToOnlineStore", "in_flight_batches")
+        self.backpressure_wait = beam.metrics.Metrics.distribution("WriteToOnlineStore", "backpressure_wait_ms")
 
     def setup(self):
-        self._client = FeatureOnlineStoreServiceClient(
-            client_options={"api_endpoint": f"{self.region}-aiplatform.googleapis.com"}
-        )
+        if self.client_factory is not None:
+            self._client = self.client_factory()
+        else:
+            self._client = FeatureOnlineStoreServiceClient(
+                client_options={"api_endpoint": f"{self.region}-aiplatform.googleapis.com"}
+            )
         self._feature_view_name = (
             f"projects/{self.project_id}/locations/{self.region}"
             f"/featureOnlineStores/{self.online_store_id}"
             f"/featureViews/{self.feature_view_id}"
         )
+        self._stream = None
+        # Writes settle on the stream's reader thread; process() replays their metrics
+        self._deferred_metrics = DeferredMetrics()
+        self._deferred_metrics.wrap_all(self)
 
-    def _build_entry(self, row):
-        features = []
-        for col in self.feature_columns:
-            val = row.get(col)
-            if val is None:
-                continue
-            if isinstance(val, (int, float)):
-                fv = FeatureValue(double_value=float(val))
+    def teardown(self):
+        if self._stream is not None:
+            self._stream.close(timeout=self.WRITE_TIMEOUT_SECS)
+            self._stream = None
+
+    def _build_request(self, batch):
+        # Filled in on the underlying protobuf message: building the nested
+        # proto-plus wrappers cost ~85us a row, more than the write itself
+        request = FeatureViewDirectWriteRequest.pb()(feature_view=self._feature_view_name)
+        for row in batch:
+            entry = request.data_key_and_feature_values.add()
+            entry.data_key.key = row["entity_id"]
+            for col in self.feature_columns:
+                val = row.get(col)
+                if val is None:
+                    continue
+                value = entry.features.add(name=col).value_and_timestamp.value
+                if isinstance(val, (int, float)):
+                    value.double_value = float(val)
+                else:
+                    value.string_value = str(val)
+        return FeatureViewDirectWriteRequest.wrap(request)
+
+    def start_bundle(self):
+        # (_BatchWrite, timestamp, window) per write in flight, oldest first
+        self._in_flight = []
+        # (due monotonic time, sequence, rows, attempt, timestamp, window) per retry waiting out its backoff
+        self._retries = []
+        self._retry_sequence = itertools.count()
+
+    def process(self, batch, timestamp=beam.DoFn.TimestampParam, window=beam.DoFn.WindowParam):
+        if len(self._in_flight) >= self.max_in_flight_batches:
+            wait_start = time.monotonic()
+            self._wait()
+            self.backpressure_wait.update(int((time.monotonic() - wait_start) * 1000))
+        self._start_write(list(batch), 0, timestamp, window)
+        self.in_flight_batches.update(len(self._in_flight))
+        outputs = self._collect()
+        self._deferred_metrics.flush()
+        yield from outputs
+
+    def finish_bundle(self):
+        outputs = []
+        while self._in_flight or self._retries:
+            next_retry = self._retries[0][0] if self._retries else None
+            if self._in_flight:
+                self._wait(until=next_retry)
             else:
-                fv = FeatureValue(string_value=str(val))
-            features.append(
-                Feature(
-                    name=col,
-                    value_and_timestamp=FeatureValueAndTimestamp(value=fv),
-                )
+                time.sleep(max(0.0, next_retry - time.monotonic()))
+            outputs.extend(self._collect())
+        self._deferred_metrics.flush()
+        yield from outputs
+
+    def _start_write(self, rows, attempt, timestamp, window):
+        write = _BatchWrite(rows, self._build_request(rows), attempt)
+        self._send(write)
+        self._in_flight.append((write, timestamp, window))
+
+    def _collect(self):
+        """Outputs of the settled writes, whose retryable rows are scheduled; retries now due are sent."""
+        running, outputs = [], []
+        for write, timestamp, window in self._in_flight:
+            if not write.future.done():
+                running.append((write, timestamp, window))
+                continue
+            written, retry_rows, dead_letters = write.future.result()
+            outputs.extend(WindowedValue(row, timestamp, (window,)) for row in written)
+            outputs.extend(
+                beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, WindowedValue(dl, timestamp, (window,)))
+                for dl in dead_letters
             )
-        return DataKeyAndFeatureValues(
-            data_key=FeatureViewDataKey(key=row["entity_id"]),
-            features=features,
-        )
+            if retry_rows:
+                backoff = random.uniform(0, min(self.initial_backoff_secs * 2 ** write.attempt, self.max_backoff_secs))
+                heapq.heappush(self._retries, (
+                    time.monotonic() + backoff, next(self._retry_sequence), retry_rows, write.attempt + 1,
+                    timestamp, window,
+                ))
+        self._in_flight = running
+        while self._retries and self._retries[0][0] <= time.monotonic():
+            _, _, rows, attempt, timestamp, window = heapq.heappop(self._retries)
+            self._start_write(rows, attempt, timestamp, window)
+        return outputs
 
-    def process(self, batch):
-        entries = [self._build_entry(row) for row in batch]
-        request = FeatureViewDirectWriteRequest(
-            feature_view=self._feature_view_name,
-            data_key_and_feature_values=entries,
-        )
+    def _send(self, write):
+        # A stream can close between the check and the send; the second one is new
+        for _ in range(2):
+            if self._stream is None or self._stream.closed:
+                self._stream = DirectWriteStream(self._client, self.max_in_flight_batches, self._on_settled)
+                self.streams_opened.inc()
+            if self._stream.send(write):
+                return
+        error = ("stream_error", "No direct write stream accepted the batch", True)
+        write.errors = {i: error for i in range(len(write.rows))}
+        self._on_settled(write)
 
-        start = time.monotonic()
-        try:
-            responses = self._client.feature_view_direct_write(requests=iter([request]))
-            for resp in responses:
-                logger.info(f"Direct write response: {resp}")
-            elapsed_ms = int((time.monotonic() - start) * 1000)
-            self.write_latency.update(elapsed_ms)
-            self.write_success.inc()
-            self.rows_written.inc(len(entries))
-            logger.info(f"Wrote {len(entries)} rows to online store")
-        except Exception as e:
+    def _wait(self, until=None):
+        """Wait for a write in flight to settle, or for the monotonic time until.
+
+        Without until, the stream is aborted if nothing settles within
+        WRITE_TIMEOUT_SECS, which settles every write on it.
+        """
+        pending = [write.future for write, _, _ in self._in_flight]
+        timeout = self.WRITE_TIMEOUT_SECS
+        if until is not None:
+            remaining = max(0.0, until - time.monotonic())
+            timeout = min(remaining, self.WRITE_TIMEOUT_SECS)
+        done, _ = futures.wait(pending, timeout=timeout, return_when=futures.FIRST_COMPLETED)
+        if not done and until is None:
+            self._stream.abort(f"No direct write response within {self.WRITE_TIMEOUT_SECS}s")
+            futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+
+    def _on_settled(self, write):
+        """Split a settled write into written rows, rows to retry and dead letters (on the stream's reader thread)."""
+        latency_ms = int((time.monotonic() - write.sent_at) * 1000) if write.sent_at else 0
+        self.write_latency.update(latency_ms)
+        written, retry_rows, dead_letters = [], [], []
+        exhausted = 0
+        for index, row in enumerate(write.rows):
+            if index not in write.errors:
+                written.append(row)
+                continue
+            error_type, error_message, retryable = write.errors[index]
+            if retryable and write.attempt < self.max_retries:
+                retry_rows.append(row)
+                continue
+            exhausted += retryable
+            dead_letters.append(build_dead_letter(
+                pipeline="feature", stage="write_online_store", error_type=error_type,
+                error_message=error_message, entity_id=row["entity_id"], original_message=row,
+                retry_count=write.attempt,
+            ))
+        self.rows_written.inc(len(written))
+        if write.attempt:
+            self.rows_recovered.inc(len(written))
+        self.rows_retried.inc(len(retry_rows))
+        self.rows_retries_exhausted.inc(exhausted)
+        self.rows_refused.inc(len(dead_letters) - exhausted)
+        self.rows_dead_lettered.inc(len(dead_letters))
+        if write.errors:
             self.write_failure.inc()
-            logger.error(f"Online store write failed ({len(entries)} rows): {e}")
+            first_error = write.errors[min(write.errors)][1]
+            logger.warning(
+                f"Online store write attempt {write.attempt} failed for {len(write.errors)} of {len(write.rows)} rows, "
+                f"retrying {len(retry_rows)} and dead-lettering {len(dead_letters)}: {first_error}"
+            )
+        else:
+            self.write_success.inc()
+        write.future.set_result((written, retry_rows, dead_letters))
+
+
+class CoalesceLatestByKey(beam.DoFn):
+    """Keep only the latest row per key within window_secs of processing time.
+
+    Takes (entity_id, row) pairs, the rows dicts or schema rows, and emits
+    the rows as they came. The first row for a key starts a
+    processing-time timer window_secs out; rows for the key arriving before
+    it fires replace the held row if their timestamp_field is not older,
+    and when it fires the held row is emitted and the key starts afresh.
+    Every row that is replaced or arrives out of date counts as
+    rows_coalesced, so the online store write skips it; rows_emitted counts
+    the rows let through. A row is held back at most window_secs.
+    """
+
+    LATEST = ReadModifyWriteStateSpec("latest", PickleCoder())
+    FLUSH_TIMER = TimerSpec("flush", TimeDomain.REAL_TIME)
+
+    def __init__(self, window_secs, timestamp_field="feature_timestamp"):
+        self.window_secs = window_secs
+        self.timestamp_field = timestamp_field
+        self.rows_coalesced = beam.metrics.Metrics.counter("CoalesceLatestByKey", "rows_coalesced")
+        self.rows_emitted = beam.metrics.Metrics.counter("CoalesceLatestByKey", "rows_emitted")
+
+    def process(self, keyed_row, latest=beam.DoFn.StateParam(LATEST),
+                flush_timer=beam.DoFn.TimerParam(FLUSH_TIMER)):
+        _, row = keyed_row
+        held = latest.read()
+        if held is None:
+            flush_timer.set(Timestamp.now() + self.window_secs)
+            latest.write(row)
+            return
+        self.rows_coalesced.inc()
+        if self._timestamp(row) >= self._timestamp(held):
+            latest.write(row)
+
+    def _timestamp(self, row):
+        return row[self.timestamp_field] if isinstance(row, dict) else getattr(row, self.timestamp_field)
 
-        yield from batch
+    @on_timer(FLUSH_TIMER)
+    def flush(self, latest=beam.DoFn.StateParam(LATEST)):
+        held = latest.read()
+        latest.clear()
+        if held is not None:
+            self.rows_emitted.inc()
+            yield held
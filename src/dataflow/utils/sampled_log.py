@@ -0,0 +1,42 @@
+import threading
+import time
+
+
+class SampledLog:
+    """Per-row logging at a bounded rate: one row in every sample_every, plus a periodic count.
+
+    log(row) logs the 1st, (sample_every + 1)th, ... row it is given in
+    full, and at most every summary_interval_secs a line with how many rows
+    were seen since the last one. sample_every=0 logs no rows, only the
+    summaries; sample_every=1 logs every row, as the pipelines used to.
+    Thread-safe, so DoFns whose calls finish on a background event loop can
+    share one instance between threads.
+    """
+
+    def __init__(self, logger, name, sample_every=1000, summary_interval_secs=60.0, clock=time.monotonic):
+        self.logger = logger
+        self.name = name
+        self.sample_every = sample_every
+        self.summary_interval_secs = summary_interval_secs
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._seen = 0
+        self._since_summary = 0
+        self._summary_at = clock()
+
+    def log(self, row):
+        with self._lock:
+            sampled = self.sample_every > 0 and self._seen % self.sample_every == 0
+            self._seen += 1
+            self._since_summary += 1
+            summary = None
+            now = self._clock()
+            if now - self._summary_at >= self.summary_interval_secs:
+                summary = (self._since_summary, now - self._summary_at, self._seen)
+                self._since_summary = 0
+                self._summary_at = now
+        if sampled:
+            self.logger.info(f"{self.name} (1 in {self.sample_every}) - {row}")
+        if summary is not None:
+            count, elapsed, total = summary
+            self.logger.info(f"{self.name}: {count} rows in the last {elapsed:.0f}s ({total} in total)")
@@ -0,0 +1,161 @@
+"""Compiled inference for sklearn tree-ensemble classifiers.
+
+compile_model() flattens every fitted tree of a DecisionTreeClassifier,
+RandomForestClassifier or ExtraTreesClassifier into packed NumPy node arrays
+(feature, threshold, children, value), and CompiledTreeEnsemble walks all
+trees for a whole batch at once, one tree level per step. That replaces
+sklearn's per-estimator Python dispatch (a joblib task per tree for forests),
+which dominates latency at the batch sizes the streaming pipeline sends.
+Past a few hundred rows sklearn's compiled per-tree loops win again; see
+benchmarks/bench_compiled_trees.py for the crossover on a given model.
+
+Outputs match the source estimator's predict_proba bit for bit: inputs are
+cast to float32 and compared against the float64 thresholds exactly as
+sklearn does, and per-tree probabilities are accumulated in tree order.
+
+Used by the FastAPI server (MODEL_BACKEND=compiled) and the batch
+inference component (backend="compiled").
+"""
+
+import numpy as np
+
+_LEAF = -1
+
+# Rows scored per traversal pass; keeps the (rows x trees) index arrays cache-resident
+CHUNK_ROWS = 1024
+
+# Largest table batch scoring runs compiled: near the crossover with sklearn on the
+# 100-tree forest in bench_compiled_trees.py (about 0.3x sklearn's speed at 5000 rows)
+BATCH_MAX_ROWS = 500
+
+
+class CompiledTreeEnsemble:
+    """Packed-array tree ensemble exposing the sklearn classifier predict API.
+
+    Node i of the packed ensemble tests X[:, feature[i]] <= threshold[i] and
+    moves to children[2 * i + 1] (left) or children[2 * i] (right). Leaves
+    point to themselves, so max_depth steps settle every tree. value holds
+    each node's normalised class distribution.
+    """
+
+    def __init__(self, feature, threshold, children, value, roots, classes,
+                 max_depth, n_features, missing_left=None, feature_names=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features)
+        self.missing_left = missing_left
+        if feature_names is not None:
+            self.feature_names_in_ = feature_names
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def predict_proba(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"X has shape {X.shape}, expected (n_samples, {self.n_features_in_})"
+            )
+        if len(X) <= CHUNK_ROWS:
+            return self._predict_chunk(X)
+        return np.concatenate([
+            self._predict_chunk(X[i:i + CHUNK_ROWS]) for i in range(0, len(X), CHUNK_ROWS)
+        ])
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def _predict_chunk(self, X):
+        n_samples = X.shape[0]
+        flat_X = X.ravel()
+        row_offsets = (np.arange(n_samples, dtype=np.int32) * self.n_features_in_)[:, None]
+        nodes = np.broadcast_to(self.roots, (n_samples, self.n_trees)).copy()
+
+        for _ in range(self.max_depth):
+            values = flat_X[row_offsets + self.feature[nodes]]
+            go_left = values <= self.threshold[nodes]
+            if self.missing_left is not None:
+                go_left |= np.isnan(values) & self.missing_left[nodes]
+            nodes = self.children[2 * nodes + go_left]
+
+        # Accumulate in tree order, as RandomForestClassifier.predict_proba does
+        proba = np.zeros((n_samples, self.value.shape[1]))
+        for t in range(self.n_trees):
+            proba += self.value[nodes[:, t]]
+        if self.n_trees > 1:
+            proba /= self.n_trees
+        return proba
+
+
+def _tree_arrays(tree, offset, n_classes):
+    """Packed node arrays for one sklearn Tree, with node ids shifted by offset."""
+    is_leaf = tree.children_left == _LEAF
+    own_ids = np.arange(offset, offset + tree.node_count)
+
+    feature = np.where(is_leaf, 0, tree.feature).astype(np.int32)
+    threshold = np.where(is_leaf, 0.0, tree.threshold)
+    left = np.where(is_leaf, own_ids, tree.children_left + offset)
+    right = np.where(is_leaf, own_ids, tree.children_right + offset)
+    children = np.stack([right, left], axis=1).ravel().astype(np.int32)
+
+    missing = getattr(tree, "missing_go_to_left", None)
+    missing_left = None if missing is None else (~is_leaf & missing.astype(bool))
+
+    # Same normalisation DecisionTreeClassifier.predict_proba applies to leaf values
+    value = tree.value[:, 0, :n_classes].astype(np.float64)
+    normalizer = value.sum(axis=1)[:, np.newaxis]
+    normalizer[normalizer == 0.0] = 1.0
+    value = value / normalizer
+
+    return feature, threshold, children, missing_left, value
+
+
+def compile_model(estimator):
+    """Flatten a fitted sklearn tree classifier into a CompiledTreeEnsemble.
+
+    Raises TypeError for estimators this engine cannot reproduce exactly.
+    """
+    from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+    from sklearn.tree import DecisionTreeClassifier
+
+    if isinstance(estimator, DecisionTreeClassifier):
+        trees = [estimator]
+    elif isinstance(estimator, (RandomForestClassifier, ExtraTreesClassifier)):
+        trees = list(estimator.estimators_)
+    else:
+        raise TypeError(f"Cannot compile {type(estimator).__name__}; expected a sklearn tree classifier")
+
+    if getattr(estimator, "n_outputs_", 1) != 1:
+        raise TypeError("Multi-output tree classifiers are not supported")
+
+    n_classes = int(estimator.n_classes_)
+    parts = []
+    roots = []
+    offset = 0
+    for tree_estimator in trees:
+        tree = tree_estimator.tree_
+        roots.append(offset)
+        parts.append(_tree_arrays(tree, offset, n_classes))
+        offset += tree.node_count
+
+    feature, threshold, children, missing_left, value = zip(*parts)
+    has_missing = all(m is not None for m in missing_left) and any(m.any() for m in missing_left)
+
+    return CompiledTreeEnsemble(
+        feature=np.concatenate(feature),
+        threshold=np.concatenate(threshold),
+        children=np.concatenate(children),
+        value=np.concatenate(value),
+        roots=np.asarray(roots, dtype=np.int32),
+        classes=np.asarray(estimator.classes_),
+        max_depth=max(t.tree_.max_depth for t in trees),
+        n_features=estimator.n_features_in_,
+        missing_left=np.concatenate(missing_left) if has_missing else None,
+        feature_names=getattr(estimator, "feature_names_in_", None),
+    )
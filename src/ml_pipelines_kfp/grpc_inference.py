@@ -0,0 +1,83 @@
+"""gRPC inference service: method names and message encoding.
+
+The service is registered with grpc generic handlers rather than protoc
+generated stubs; messages are msgpack maps carried as raw bytes, built from
+the same pack_features / pack_predictions layout as the application/msgpack
+/predict bodies:
+
+/iris.inference.v1.Inference/Predict            (unary)
+/iris.inference.v1.Inference/PredictStream      (bidirectional stream)
+
+    request:  {"request_id": int, "model_version": str | None,
+               "columns": [...], "features": ARRAY}
+    response: {"request_id": int, "model_version": str,
+               "predictions": ARRAY, "class_probabilities": ARRAY}
+              or {"request_id": int, "error": str, "code": str}
+
+On the stream, responses arrive in completion order and are matched to
+requests by request_id; a failed request gets an error message and leaves
+the stream open. Unary failures are returned as gRPC status codes.
+
+Shared by the FastAPI container's gRPC server (imported flat as
+grpc_inference) and the Dataflow gRPC client (ml_pipelines_kfp.grpc_inference).
+"""
+
+import msgpack
+
+try:
+    from wire_format import pack_features, pack_predictions, unpack_predictions
+except ImportError:  # imported as ml_pipelines_kfp.grpc_inference outside the FastAPI container
+    from ml_pipelines_kfp.wire_format import pack_features, pack_predictions, unpack_predictions
+
+SERVICE = "iris.inference.v1.Inference"
+PREDICT_METHOD = f"/{SERVICE}/Predict"
+PREDICT_STREAM_METHOD = f"/{SERVICE}/PredictStream"
+
+# Error codes carried in stream error messages; unary calls use the grpc.StatusCode of the same name
+INVALID_ARGUMENT = "INVALID_ARGUMENT"
+NOT_FOUND = "NOT_FOUND"
+UNAVAILABLE = "UNAVAILABLE"
+INTERNAL = "INTERNAL"
+
+
+def encode_predict_request(X, columns, request_id=0, model_version=None):
+    message = pack_features(X, columns)
+    message["request_id"] = request_id
+    message["model_version"] = model_version
+    return msgpack.packb(message)
+
+
+def decode_predict_request(body):
+    """Raw request map; unpack_features() decodes its features once the model (and so its columns) is known.
+
+    Raises ValueError for bodies that are not a msgpack map.
+    """
+    try:
+        message = msgpack.unpackb(body)
+    except Exception as e:
+        raise ValueError(f"Malformed request message: {e!r}")
+    if not isinstance(message, dict):
+        raise ValueError("Request message must be a map")
+    return message
+
+
+def encode_predict_response(request_id, model_version, predictions, probabilities):
+    message = pack_predictions(predictions, probabilities)
+    message["request_id"] = request_id
+    message["model_version"] = model_version
+    return msgpack.packb(message)
+
+
+def encode_error(request_id, code, detail):
+    return msgpack.packb({"request_id": request_id, "error": detail, "code": code})
+
+
+def decode_predict_response(body):
+    """Response map with "predictions" and "class_probabilities" unpacked to arrays.
+
+    Error messages are returned as-is, with "error" and "code" keys.
+    """
+    message = msgpack.unpackb(body)
+    if "error" not in message:
+        message["predictions"], message["class_probabilities"] = unpack_predictions(message)
+    return message
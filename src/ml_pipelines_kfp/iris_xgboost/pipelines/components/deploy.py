@@ -25,6 +25,8 @@ def deploy_blessed_model_to_fastapi(
     import requests
     import time
     from ml_pipelines_kfp.log import get_logger
+    from ml_pipelines_kfp.compiled_trees import compile_model
+    from ml_pipelines_kfp.serving_artifact import serving_artifact_path, write_serving_artifact
 
     logger = get_logger(__name__)
 
@@ -104,6 +106,21 @@ def deploy_blessed_model_to_fastapi(
     logger.info(f"Copying model to deployment location: gs://{bucket_name}/{deployment_model_path}")
     deployment_blob.upload_from_filename(local_model_path)
 
+    # Memory-mappable serving artifact for MODEL_BACKEND=compiled; drop a stale one
+    # if this model cannot be compiled so the server falls back to model.joblib
+    serving_blob = bucket.blob(serving_artifact_path(deployment_model_path))
+    try:
+        compiled = compile_model(joblib.load(local_model_path))
+    except TypeError as e:
+        logger.info(f"Skipping serving artifact: {e}")
+        if serving_blob.exists():
+            serving_blob.delete()
+    else:
+        local_serving_path = serving_artifact_path(local_model_path)
+        write_serving_artifact(compiled, local_serving_path)
+        logger.info(f"Uploading serving artifact to gs://{bucket_name}/{serving_blob.name}")
+        serving_blob.upload_from_filename(local_serving_path)
+
     model_gcs_path = f"gs://{bucket_name}/{deployment_model_path}"
 
     logger.info(f"Deploying to Cloud Run service: {service_name}")
@@ -0,0 +1,111 @@
+"""Local on-disk cache for model artifacts downloaded from GCS.
+
+Entries are keyed by the blob's generation and MD5, so a restart on a warm
+instance (or a second worker process) reuses the file already on disk, and
+re-uploading the model under the same path is picked up as a new entry.
+Only the keep_generations most recent entries per blob are kept on disk,
+plus any entry whose file is still being served.
+"""
+
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+
+from google.api_core.exceptions import NotFound
+from google.cloud import storage
+
+from log import get_logger
+
+logger = get_logger(__name__)
+
+
+def parse_gcs_uri(gcs_uri):
+    if not gcs_uri.startswith("gs://"):
+        raise ValueError(f"Expected GCS path starting with gs://, got: {gcs_uri}")
+    bucket_name, _, blob_path = gcs_uri[len("gs://"):].partition("/")
+    return bucket_name, blob_path
+
+
+def _file_md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """Download-once cache: fetch(gcs_uri) -> (local_path, cache_hit).
+
+    in_use, if given, returns the local paths still being served; their
+    entries are never evicted, since process workers may load them lazily.
+    """
+
+    def __init__(self, cache_dir, client=None, keep_generations=1, in_use=None):
+        self.cache_dir = cache_dir
+        self.keep_generations = keep_generations
+        self.in_use = in_use
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = storage.Client()
+        return self._client
+
+    def latest_generation(self, gcs_uri):
+        """Current generation of gcs_uri, or None if the blob does not exist."""
+        bucket_name, blob_path = parse_gcs_uri(gcs_uri)
+        blob = self.client.bucket(bucket_name).blob(blob_path)
+        try:
+            blob.reload()
+        except NotFound:
+            return None
+        return blob.generation
+
+    def fetch(self, gcs_uri, generation=None):
+        """Return a local copy of gcs_uri (at generation, else the latest).
+
+        Raises FileNotFoundError if the blob does not exist.
+        """
+        bucket_name, blob_path = parse_gcs_uri(gcs_uri)
+        blob = self.client.bucket(bucket_name).blob(blob_path, generation=generation)
+        try:
+            blob.reload()
+        except NotFound:
+            raise FileNotFoundError(f"Model artifact not found at {gcs_uri}")
+
+        md5_hex = base64.b64decode(blob.md5_hash).hex() if blob.md5_hash else "nomd5"
+        blob_dir = os.path.join(self.cache_dir, bucket_name, blob_path)
+        entry_dir = os.path.join(blob_dir, f"{blob.generation}-{md5_hex}")
+        local_path = os.path.join(entry_dir, os.path.basename(blob_path))
+
+        if os.path.exists(local_path):
+            logger.info(f"Artifact cache hit for {gcs_uri} (generation {blob.generation})")
+            return local_path, True
+
+        os.makedirs(entry_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=entry_dir, suffix=".part")
+        os.close(fd)
+        try:
+            logger.info(f"Downloading {gcs_uri} (generation {blob.generation}) to {local_path}")
+            blob.download_to_filename(tmp_path)
+            if blob.md5_hash and _file_md5(tmp_path) != md5_hex:
+                raise ValueError(f"MD5 mismatch downloading {gcs_uri}")
+            os.replace(tmp_path, local_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self._evict_old_generations(blob_dir)
+        return local_path, False
+
+    def _evict_old_generations(self, blob_dir):
+        entries = [os.path.join(blob_dir, name) for name in os.listdir(blob_dir)]
+        entries = sorted((p for p in entries if os.path.isdir(p)), key=os.path.getmtime, reverse=True)
+        in_use = {os.path.dirname(path) for path in self.in_use()} if self.in_use is not None else set()
+        for path in entries[self.keep_generations:]:
+            if path not in in_use:
+                shutil.rmtree(path, ignore_errors=True)
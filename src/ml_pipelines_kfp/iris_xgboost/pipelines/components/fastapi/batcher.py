@@ -0,0 +1,121 @@
+"""In-process adaptive micro-batcher for model inference.
+
+Concurrent requests enqueue their feature matrices; a single worker task
+merges whatever is queued into one vectorised model call and splits the
+results back out to each caller's future.
+
+The wait is adaptive: the max_wait_ms budget counts from when the oldest
+queued request arrived, so requests that already queued up behind a running
+model call are flushed straight away, and an idle server only ever waits
+max_wait_ms for company.
+"""
+
+import asyncio
+import time
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Merge concurrent predict calls into batches of up to max_batch_size rows.
+
+    predict_fn is a coroutine function taking an (n, n_features) array and
+    returning (predictions, probabilities) aligned with its rows. Extra
+    positional arguments given to submit() are passed through to predict_fn;
+    only requests with the same extra arguments are merged. on_flush, if
+    given, is called per merged batch with (batch_rows, queue_depth, wait_times).
+    """
+
+    def __init__(self, predict_fn, max_batch_size=256, max_wait_ms=2.0, on_flush=None):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be >= 1, got {max_batch_size}")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_secs = max(max_wait_ms, 0) / 1000
+        self.on_flush = on_flush
+        self._queue = None
+        self._worker = None
+        self._carry = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, X, *args):
+        """Queue X for the next merged batch and wait for its slice of the results."""
+        if self._worker is None:
+            raise RuntimeError("MicroBatcher.start() has not been called")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((X, future, time.perf_counter(), args))
+        return await future
+
+    async def _run(self):
+        while True:
+            items = await self._collect()
+            await self._flush(items)
+
+    async def _collect(self):
+        first = self._carry or await self._queue.get()
+        self._carry = None
+        items = [first]
+        rows = len(first[0])
+        deadline = first[2] + self.max_wait_secs
+
+        while rows < self.max_batch_size:
+            if not self._queue.empty():
+                item = self._queue.get_nowait()
+            else:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            if rows + len(item[0]) > self.max_batch_size or item[3] != first[3]:
+                # Keep requests whole and unmixed; the odd one out starts the next batch
+                self._carry = item
+                break
+            items.append(item)
+            rows += len(item[0])
+
+        return items
+
+    async def _flush(self, items):
+        queue_depth = len(items) + self._queue.qsize() + (self._carry is not None)
+        now = time.perf_counter()
+        wait_times = [now - enqueued_at for _, _, enqueued_at, _ in items]
+
+        X = items[0][0] if len(items) == 1 else np.concatenate([x for x, _, _, _ in items])
+        if self.on_flush is not None:
+            self.on_flush(len(X), queue_depth, wait_times)
+
+        try:
+            predictions, probabilities = await self.predict_fn(X, *items[0][3])
+        except Exception as e:
+            for _, future, _, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for x, future, _, _ in items:
+            end = offset + len(x)
+            if not future.done():
+                future.set_result((predictions[offset:end], probabilities[offset:end]))
+            offset = end
@@ -0,0 +1,48 @@
+"""Columnar request decoding for the /predict:columnar fast path.
+
+Accepts either column arrays keyed by feature name or a 2-D matrix under
+"instances", and turns them straight into a contiguous float32 matrix
+without building per-row Pydantic objects or a DataFrame.
+"""
+
+import numpy as np
+
+from models.instance import Instance
+
+FEATURE_COLUMNS = list(Instance.model_fields)
+
+
+def to_feature_matrix(payload, feature_columns=FEATURE_COLUMNS):
+    """Convert a columnar JSON payload into an (n_rows, n_features) float32 array.
+
+    Raises ValueError when the payload shape does not match feature_columns.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object")
+
+    try:
+        if "instances" in payload:
+            X = np.asarray(payload["instances"], dtype=np.float32)
+            if X.ndim != 2 or X.shape[1] != len(feature_columns):
+                raise ValueError(
+                    f"Expected a 2-D matrix with {len(feature_columns)} columns, "
+                    f"got shape {X.shape}"
+                )
+        else:
+            missing = [col for col in feature_columns if col not in payload]
+            if missing:
+                raise ValueError(f"Missing feature columns: {missing}")
+            columns = [np.asarray(payload[col], dtype=np.float32) for col in feature_columns]
+            lengths = {col.shape for col in columns}
+            if len(lengths) != 1 or columns[0].ndim != 1:
+                raise ValueError(f"Feature columns must be 1-D arrays of equal length, got {lengths}")
+            X = np.column_stack(columns)
+    except TypeError as e:
+        raise ValueError(f"Non-numeric feature values: {e}") from e
+
+    if X.shape[0] == 0:
+        raise ValueError("Empty batch")
+    # float32 conversion silently maps JSON null to NaN
+    if np.isnan(X).any():
+        raise ValueError("Null feature values")
+    return np.ascontiguousarray(X)
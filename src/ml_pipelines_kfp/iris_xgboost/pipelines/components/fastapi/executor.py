@@ -0,0 +1,156 @@
+"""Where model inference runs relative to the uvicorn event loop.
+
+inline   - on the event loop (blocks health checks and other requests while it runs)
+thread   - in a thread pool; sklearn's tree traversal releases the GIL, so
+           threads scale up to the container's CPU limit
+process  - in a process pool whose workers each hold a preloaded copy of the model
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from model_adapter import SKLEARN, load_adapter
+
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+EXECUTOR_MODES = (INLINE, THREAD, PROCESS)
+
+
+def cpu_limit():
+    """CPUs this container may use: the cgroup quota (Cloud Run's CPU limit), else the affinity mask."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, int(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, quota // period)
+    except (OSError, ValueError):
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Per-process model cache for PROCESS mode, keyed by (artifact path, backend).
+# Hot reloads add entries; the oldest are dropped past _max_worker_models.
+_worker_adapters = {}
+_max_worker_models = 4
+# Shared by the pool's workers; warm_all() holds each worker on it so every worker takes one call
+_worker_barrier = None
+WARM_ALL_TIMEOUT_S = 60
+
+
+def _init_worker(model_path, backend, max_models, barrier):
+    global _max_worker_models, _worker_barrier
+    _max_worker_models = max_models
+    _worker_barrier = barrier
+    _load_worker_model(model_path, backend)
+
+
+def _load_worker_model(model_path, backend=SKLEARN):
+    _worker_adapters[(model_path, backend)] = load_adapter(model_path, backend)
+    while len(_worker_adapters) > _max_worker_models:
+        del _worker_adapters[next(iter(_worker_adapters))]
+
+
+def _predict_in_worker(model_path, backend, X):
+    adapter = _worker_adapters.get((model_path, backend))
+    if adapter is None:
+        _load_worker_model(model_path, backend)
+        adapter = _worker_adapters[(model_path, backend)]
+    return adapter.predict(X)
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def _warm_in_worker(model_path, backend, X):
+    _predict_in_worker(model_path, backend, X)
+    _worker_barrier.wait(WARM_ALL_TIMEOUT_S)
+    return os.getpid()
+
+
+class InferenceExecutor:
+    """Run ModelAdapter.predict inline, in a thread pool, or in a process pool."""
+
+    def __init__(self, mode=THREAD, workers=None):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode {mode!r}, expected one of {EXECUTOR_MODES}")
+        self.mode = mode
+        self.workers = workers or cpu_limit()
+        self._pool = None
+
+    def start(self, model_path=None, backend=SKLEARN, max_models=4):
+        """Create the pool; PROCESS mode loads model_path in every worker before returning.
+
+        PROCESS workers keep up to max_models models loaded, so versions still
+        served are not reloaded from their path.
+        """
+        if self.mode == THREAD:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        elif self.mode == PROCESS:
+            if model_path is None:
+                raise ValueError("PROCESS executor needs the model path to preload in workers")
+            # spawn, not fork: the parent already runs OTel exporter and asyncio threads
+            context = multiprocessing.get_context("spawn")
+            self._barrier = context.Barrier(self.workers)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(model_path, backend, max_models, self._barrier),
+            )
+            # Workers spawn on demand; force them all up so the first requests don't pay model loads
+            for future in [self._pool.submit(_worker_ready) for _ in range(self.workers)]:
+                future.result()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def warm_all(self, adapter, X):
+        """Score X with adapter once on every worker, so each has loaded it; returns their pids.
+
+        In PROCESS mode each worker waits on a shared barrier after its call
+        until all have made one, which keeps any worker from taking two.
+        Raises threading.BrokenBarrierError if they do not all get there
+        within WARM_ALL_TIMEOUT_S. Not for concurrent use. Other modes share
+        one model: one call.
+        """
+        if self.mode != PROCESS:
+            await self.run(adapter, X)
+            return [os.getpid()]
+        loop = asyncio.get_running_loop()
+        calls = [
+            loop.run_in_executor(self._pool, _warm_in_worker, adapter.source_path, adapter.backend, X)
+            for _ in range(self.workers)
+        ]
+        try:
+            return await asyncio.gather(*calls)
+        except BaseException:
+            self._barrier.reset()
+            raise
+
+    async def run(self, adapter, X):
+        if self.mode == INLINE:
+            return adapter.predict(X)
+        loop = asyncio.get_running_loop()
+        if self.mode == THREAD:
+            return await loop.run_in_executor(self._pool, adapter.predict, X)
+        return await loop.run_in_executor(
+            self._pool, _predict_in_worker, adapter.source_path, adapter.backend, X
+        )
@@ -1,13 +1,13 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import joblib
-import pandas as pd
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
 import numpy as np
 from typing import List, Dict, Optional
 import os
 import time
+import warnings
 import uvicorn
-from google.cloud import storage
 
 from opentelemetry import metrics
 from opentelemetry.sdk.metrics import MeterProvider
@@ -19,11 +19,25 @@ from opentelemetry.exporter.cloud_monitoring import CloudMonitoringMetricsExport
 
 from models.instance import Instance
 from models.prediction import Prediction
+from columnar import FEATURE_COLUMNS, to_feature_matrix
+from batcher import MicroBatcher
+from model_adapter import load_adapter
+from executor import InferenceExecutor
+from artifact_cache import ArtifactCache
+from model_registry import GcsModelSource, LocalDirectorySource, LocalFileSource, ModelRegistry
+from serving_artifact import serving_artifact_path
+from prediction_cache import PredictionCache
+from grpc_service import InferenceServicer, create_server
+from wire_format import ARROW, BINARY_MEDIA_TYPES, JSON, MSGPACK, decode_request, encode_response, media_type
 from log import get_logger
 
 logger = get_logger(__name__)
 logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
 
+# Feature matrices are built in the model's feature_names_in_ order, so sklearn's
+# per-call "X does not have valid feature names" warning is just log noise here.
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
 # --- OTel metrics setup (environment-aware exporter) ---
 resource = Resource.create({"service.name": "fastapi-inference"})
 otel_endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
@@ -57,9 +71,34 @@ batch_size_hist = meter.create_histogram(
 )
 model_load_duration = meter.create_histogram(
     name="fastapi.model.load_duration",
-    description="Time taken to load the model at startup",
+    description="Time taken to load a model version, by phase",
+    unit="s",
+)
+batcher_queue_depth = meter.create_histogram(
+    name="fastapi.batcher.queue_depth",
+    description="Requests waiting in the micro-batch queue when a batch is flushed",
+)
+batcher_batch_size = meter.create_histogram(
+    name="fastapi.batcher.merged_batch_size",
+    description="Rows per merged model call from the micro-batcher",
+)
+batcher_wait_time = meter.create_histogram(
+    name="fastapi.batcher.wait_time",
+    description="Time a request spent queued in the micro-batcher",
     unit="s",
 )
+prediction_cache_hits = meter.create_counter(
+    name="fastapi.prediction_cache.hits",
+    description="Rows answered from the prediction cache",
+)
+prediction_cache_misses = meter.create_counter(
+    name="fastapi.prediction_cache.misses",
+    description="Rows not found in the prediction cache",
+)
+prediction_cache_evictions = meter.create_counter(
+    name="fastapi.prediction_cache.evictions",
+    description="Prediction cache entries dropped, by reason (capacity, expired, model_change)",
+)
 
 app = FastAPI(
     title="ML Model Inference API",
@@ -69,9 +108,78 @@ app = FastAPI(
 
 FastAPIInstrumentor.instrument_app(app)
 
-model = None
+registry = None
+batcher = None
+grpc_server = None
 
 MODEL_FILENAME = "model.joblib"
+MODEL_VERSION_HEADER = "X-Model-Version"
+
+# Micro-batching merges concurrent /predict calls into one model call.
+# Off by default: it trades up to MICRO_BATCH_MAX_WAIT_MS of latency for throughput.
+MICRO_BATCH_ENABLED = os.getenv("MICRO_BATCH_ENABLED", "false").lower() == "true"
+MICRO_BATCH_MAX_BATCH_SIZE = int(os.getenv("MICRO_BATCH_MAX_BATCH_SIZE", "256"))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "2"))
+
+# Where model inference runs: "inline" (event loop), "thread" or "process" pool.
+# INFERENCE_WORKERS defaults to the container's CPU limit.
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0")) or None
+
+executor = InferenceExecutor(INFERENCE_EXECUTOR, INFERENCE_WORKERS)
+
+# Model engine: "sklearn" or "compiled" (packed-array trees, see compiled_trees.py).
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "sklearn")
+
+# Hot reload: poll the model location every MODEL_POLL_INTERVAL_S and keep the last
+# MODEL_MAX_VERSIONS versions loaded for pinned requests. Off by default: on Cloud Run, CPU
+# outside requests is throttled unless CPU is always allocated, so polls may not run on time. MODEL_WATCH_DIR watches a local
+# directory of version subdirectories instead of MODEL_GCS_PATH / MODEL_PATH.
+MODEL_POLL_INTERVAL_S = float(os.getenv("MODEL_POLL_INTERVAL_S", "0"))
+MODEL_MAX_VERSIONS = int(os.getenv("MODEL_MAX_VERSIONS", "2"))
+MODEL_WATCH_DIR = os.getenv("MODEL_WATCH_DIR")
+MODEL_WARMUP_ROWS = int(os.getenv("MODEL_WARMUP_ROWS", "64"))
+
+
+def _served_paths():
+    return {v["path"] for v in registry.list_versions()} if registry is not None else set()
+
+
+# GCS artifacts are cached here keyed by generation/MD5, so warm restarts skip the download.
+# Files of loaded versions are never evicted: PROCESS workers may load them lazily by path.
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "/tmp/model_cache")
+artifact_cache = ArtifactCache(MODEL_CACHE_DIR, keep_generations=MODEL_MAX_VERSIONS, in_use=_served_paths)
+
+# Per-row prediction cache keyed by model version + features rounded to PREDICTION_CACHE_DECIMALS.
+# Off by default. The default rounding only folds float noise; 1 decimal matches pubsub_producer.py
+# traffic exactly but answers unrounded inputs with their rounded neighbour's prediction.
+PREDICTION_CACHE_ENABLED = os.getenv("PREDICTION_CACHE_ENABLED", "false").lower() == "true"
+PREDICTION_CACHE_MAX_ENTRIES = int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", "100000"))
+PREDICTION_CACHE_TTL_S = float(os.getenv("PREDICTION_CACHE_TTL_S", "300"))
+PREDICTION_CACHE_DECIMALS = int(os.getenv("PREDICTION_CACHE_DECIMALS", "6"))
+
+
+def _record_cache_lookup(hits, misses):
+    prediction_cache_hits.add(hits)
+    prediction_cache_misses.add(misses)
+
+
+def _record_cache_eviction(count, reason):
+    prediction_cache_evictions.add(count, {"reason": reason})
+
+
+prediction_cache = PredictionCache(
+    max_entries=PREDICTION_CACHE_MAX_ENTRIES,
+    ttl_s=PREDICTION_CACHE_TTL_S,
+    decimals=PREDICTION_CACHE_DECIMALS,
+    on_lookup=_record_cache_lookup,
+    on_evict=_record_cache_eviction,
+) if PREDICTION_CACHE_ENABLED else None
+
+# gRPC Predict / PredictStream on GRPC_PORT alongside HTTP (0 disables); see grpc_service.py.
+# GRPC_STREAM_MAX_IN_FLIGHT bounds the requests scored concurrently per stream.
+GRPC_PORT = int(os.getenv("GRPC_PORT", "0"))
+GRPC_STREAM_MAX_IN_FLIGHT = int(os.getenv("GRPC_STREAM_MAX_IN_FLIGHT", "8"))
 
 
 class PredictionRequest(BaseModel):
@@ -86,89 +194,278 @@ class HealthResponse(BaseModel):
     status: str
     model_type: str
     model_loaded: bool
+    model_version: Optional[str] = None
+
+
+def _model_source(model_gcs_path, model_path):
+    """Where the registry looks for new model versions.
+
+    With MODEL_BACKEND=compiled a model.serving next to model.joblib is preferred.
+    """
+    def candidates(path):
+        if MODEL_BACKEND == "compiled":
+            return [serving_artifact_path(path), path]
+        return [path]
+
+    if MODEL_WATCH_DIR:
+        return LocalDirectorySource(MODEL_WATCH_DIR, candidates(MODEL_FILENAME))
+    if model_gcs_path:
+        if not model_gcs_path.endswith(".joblib"):
+            model_gcs_path = model_gcs_path.rstrip("/") + f"/{MODEL_FILENAME}"
+        return GcsModelSource(candidates(model_gcs_path), artifact_cache)
+    return LocalFileSource(candidates(model_path))
+
+
+def _record_load(entry):
+    fetch_attributes = {"phase": "fetch"}
+    if entry.cache_hit is not None:
+        fetch_attributes["cache"] = "hit" if entry.cache_hit else "miss"
+    model_load_duration.record(entry.load_timings["fetch"], fetch_attributes)
+    model_load_duration.record(entry.load_timings["deserialize"], {"phase": "deserialize"})
+    model_load_duration.record(entry.load_timings["warmup"], {"phase": "warmup"})
+    logger.info(
+        f"Model version {entry.version} loaded from {entry.path} "
+        f"(fetch {entry.load_timings['fetch']:.3f}s, deserialize {entry.load_timings['deserialize']:.3f}s, "
+        f"warmup {entry.load_timings['warmup']:.3f}s)"
+    )
+    logger.info(f"Model type: {type(entry.adapter.estimator)}, inference mode: {entry.adapter.mode}, "
+                f"backend: {entry.adapter.backend}")
 
 
-def download_model_from_gcs(gcs_path: str, local_path: str):
-    if not gcs_path.startswith("gs://"):
-        raise ValueError(f"Expected GCS path starting with gs://, got: {gcs_path}")
-
-    path_parts = gcs_path.replace("gs://", "").split("/")
-    bucket_name = path_parts[0]
-    blob_path = "/".join(path_parts[1:])
+def _on_model_loaded(entry):
+    _record_load(entry)
+    if prediction_cache is not None:
+        prediction_cache.retain_versions(v["version"] for v in registry.list_versions())
 
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(blob_path)
 
-    logger.info(f"Downloading model from {gcs_path} to {local_path}")
-    blob.download_to_filename(local_path)
-    logger.info("Model downloaded successfully")
+async def _warm_up(entry):
+    """Score a synthetic batch so the first real request doesn't pay lazy initialisation."""
+    n_features = getattr(entry.adapter.estimator, "n_features_in_", len(FEATURE_COLUMNS))
+    X = np.ones((MODEL_WARMUP_ROWS, n_features), dtype=np.float32)
+    # On every PROCESS worker, so each has loaded the new version before it is published
+    await executor.warm_all(entry.adapter, X)
 
 
 @app.on_event("startup")
 async def load_model():
-    global model
+    global registry
 
     model_gcs_path = os.getenv("MODEL_GCS_PATH") or os.getenv("AIP_STORAGE_URI")
     model_path = os.getenv("MODEL_PATH", "/app/model_artifacts/model.joblib")
 
-    start = time.perf_counter()
     try:
-        if model_gcs_path:
-            if not model_gcs_path.endswith(".joblib"):
-                model_gcs_path = model_gcs_path.rstrip("/") + f"/{MODEL_FILENAME}"
-            os.makedirs(os.path.dirname(model_path), exist_ok=True)
-            download_model_from_gcs(model_gcs_path, model_path)
-
-        if os.path.exists(model_path):
-            model = joblib.load(model_path)
-            duration = time.perf_counter() - start
-            model_load_duration.record(duration)
-            logger.info(f"Model loaded from {model_path} in {duration:.2f}s")
-            logger.info(f"Model type: {type(model)}")
-        else:
-            raise FileNotFoundError(f"Model file not found at {model_path}")
+        start = time.perf_counter()
+        # PROCESS workers preload the first version in their initializer, so the
+        # pool starts after it is loaded and warm-up applies from the next version on
+        registry = ModelRegistry(
+            _model_source(model_gcs_path, model_path),
+            loader=lambda path: load_adapter(path, MODEL_BACKEND),
+            max_versions=MODEL_MAX_VERSIONS,
+        )
+        entry = await registry.refresh()
+        loaded = time.perf_counter()
+        # Room in each PROCESS worker for every served version plus one warming up
+        executor.start(entry.path, entry.adapter.backend, max_models=MODEL_MAX_VERSIONS + 1)
+        started = time.perf_counter()
+        registry.warmup = _warm_up
+
+        _record_load(entry)
+        model_load_duration.record(started - loaded, {"phase": "executor_start"})
+        model_load_duration.record(started - start, {"phase": "total"})
+        logger.info(f"Inference executor: {executor.mode} ({executor.workers} workers), "
+                    f"startup took {started - start:.2f}s")
+
+        if MODEL_POLL_INTERVAL_S > 0:
+            registry.start_watching(MODEL_POLL_INTERVAL_S, on_loaded=_on_model_loaded)
+            logger.info(f"Watching for new model versions every {MODEL_POLL_INTERVAL_S}s")
 
     except Exception as e:
         logger.error(f"Failed to load model: {e}")
         raise RuntimeError(f"Model loading failed: {e}")
 
 
+def _record_flush(batch_rows, queue_depth, wait_times):
+    batcher_batch_size.record(batch_rows)
+    batcher_queue_depth.record(queue_depth)
+    for wait in wait_times:
+        batcher_wait_time.record(wait)
+
+
+@app.on_event("startup")
+async def start_batcher():
+    global batcher
+
+    if MICRO_BATCH_ENABLED:
+        batcher = MicroBatcher(
+            _model_call,
+            max_batch_size=MICRO_BATCH_MAX_BATCH_SIZE,
+            max_wait_ms=MICRO_BATCH_MAX_WAIT_MS,
+            on_flush=_record_flush,
+        )
+        batcher.start()
+        logger.info(
+            f"Micro-batching enabled (max_batch_size={MICRO_BATCH_MAX_BATCH_SIZE}, "
+            f"max_wait_ms={MICRO_BATCH_MAX_WAIT_MS})"
+        )
+
+
+def _record_grpc_result(n_rows, status):
+    predictions_total.add(n_rows, {"status": status, "transport": "grpc"})
+    if status == "success":
+        batch_size_hist.record(n_rows, {"transport": "grpc"})
+
+
+@app.on_event("startup")
+async def start_grpc_server():
+    global grpc_server
+
+    if GRPC_PORT:
+        servicer = InferenceServicer(
+            get_registry=lambda: registry,
+            feature_columns=_feature_columns,
+            predict=_predict_array,
+            on_result=_record_grpc_result,
+            max_in_flight=GRPC_STREAM_MAX_IN_FLIGHT,
+        )
+        grpc_server, port = create_server(servicer, f"[::]:{GRPC_PORT}")
+        await grpc_server.start()
+        logger.info(f"gRPC inference service listening on port {port}")
+
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    if grpc_server is not None:
+        await grpc_server.stop(grace=5)
+    if registry is not None:
+        await registry.stop_watching()
+    if batcher is not None:
+        await batcher.stop()
+    executor.shutdown()
+
+
+async def _model_call(X, entry):
+    start = time.perf_counter()
+    predictions, probabilities = await executor.run(entry.adapter, X)
+    prediction_latency.record(time.perf_counter() - start)
+    return predictions, probabilities
+
+
+async def _score(X, entry):
+    if batcher is not None:
+        return await batcher.submit(X, entry)
+    return await _model_call(X, entry)
+
+
+async def _predict_array(X, entry):
+    """Score a feature matrix, through the prediction cache and micro-batcher when enabled."""
+    if prediction_cache is not None:
+        return await prediction_cache.predict_through(entry.version, X, lambda missing: _score(missing, entry))
+    return await _score(X, entry)
+
+
+def _resolve_version(http_request):
+    """The ModelVersion for this request: pinned via X-Model-Version, else the current one.
+
+    Resolved once per request; a reload during the request does not affect it.
+    """
+    if registry is None or registry.current is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    pinned = http_request.headers.get(MODEL_VERSION_HEADER)
+    try:
+        return registry.get(pinned)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Model version {pinned} is not loaded")
+
+
 @app.get("/", response_model=Dict[str, str])
 async def root():
     return {
         "message": "ML Model Inference API",
         "health_check": "/health/live",
         "prediction": "/predict",
+        "columnar_prediction": "/predict:columnar",
+        "models": "/models",
     }
 
 
 @app.get("/health/live", response_model=HealthResponse)
 async def health_check():
-    if model is None:
+    if registry is None or registry.current is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
 
+    current = registry.current
     return HealthResponse(
-        status="healthy", model_type=str(type(model)), model_loaded=True
+        status="healthy",
+        model_type=str(type(current.adapter.estimator)),
+        model_loaded=True,
+        model_version=current.version,
     )
 
 
-@app.post("/predict", response_model=PredictionResponse)
-async def predict(request: PredictionRequest):
-    if model is None:
+@app.get("/models")
+async def list_models():
+    """Loaded model versions, newest first; pin one with the X-Model-Version header."""
+    if registry is None or registry.current is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
 
+    return {"current": registry.current.version, "versions": registry.list_versions()}
+
+
+@app.post(
+    "/predict",
+    response_model=PredictionResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                JSON: {"schema": PredictionRequest.model_json_schema()},
+                MSGPACK: {},
+                ARROW: {},
+            },
+        }
+    },
+)
+async def predict(http_request: Request, response: Response):
+    """Vertex-style JSON by default; msgpack and Arrow IPC are negotiated per request.
+
+    Content-Type picks the request encoding and Accept the response encoding
+    (defaulting to the request's). See wire_format.py for the binary layouts.
+    """
+    entry = _resolve_version(http_request)
+    content_type = http_request.headers.get("content-type")
+    request_media = media_type(content_type) or (None if content_type else JSON)
+    if request_media is None:
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Type {content_type}")
+    response_media = media_type(http_request.headers.get("accept")) or request_media
+
+    body = await http_request.body()
+    columns = _feature_columns(entry)
+    if request_media == JSON:
+        try:
+            instances = PredictionRequest.model_validate_json(body).instances
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        X = np.array([[getattr(i, col) for col in columns] for i in instances], dtype=np.float32)
+    else:
+        try:
+            X = decode_request(body, request_media, columns)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid {request_media} payload: {e}")
+
     try:
-        start = time.perf_counter()
-        df = pd.DataFrame(i.model_dump() for i in request.instances)
-        predictions = model.predict(df)
-        probabilities = model.predict_proba(df)
-        duration = time.perf_counter() - start
+        predictions, probabilities = await _predict_array(X, entry)
 
-        prediction_latency.record(duration)
         predictions_total.add(len(predictions), {"status": "success"})
-        batch_size_hist.record(len(request.instances))
+        batch_size_hist.record(len(X))
 
+        if response_media in BINARY_MEDIA_TYPES:
+            return Response(
+                content=encode_response(predictions, probabilities, response_media),
+                media_type=response_media,
+                headers={MODEL_VERSION_HEADER: entry.version},
+            )
+
+        response.headers[MODEL_VERSION_HEADER] = entry.version
         results = [
             Prediction(
                 class_=int(pred),
@@ -185,6 +482,47 @@ async def predict(request: PredictionRequest):
         raise HTTPException(status_code=400, detail=f"Prediction failed: {str(e)}")
 
 
+def _feature_columns(entry):
+    """Column order the model was fitted with, falling back to the Instance schema."""
+    names = getattr(entry.adapter.estimator, "feature_names_in_", None)
+    return list(names) if names is not None else FEATURE_COLUMNS
+
+
+@app.post("/predict:columnar")
+async def predict_columnar(request: Request):
+    """Columnar fast path: column arrays or a 2-D matrix in, arrays out.
+
+    Skips per-row Pydantic validation and DataFrame construction. Accepts
+    {"sepal_length_cm": [...], ...} or {"instances": [[...], ...]} and returns
+    {"predictions": [...], "class_probabilities": [[...], ...]}.
+    """
+    entry = _resolve_version(request)
+
+    try:
+        X = to_feature_matrix(await request.json(), _feature_columns(entry))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid columnar payload: {e}")
+
+    try:
+        predictions, probabilities = await _predict_array(X, entry)
+
+        predictions_total.add(len(predictions), {"status": "success"})
+        batch_size_hist.record(len(X))
+
+        return JSONResponse(
+            {
+                "predictions": np.asarray(predictions).astype(np.int64).tolist(),
+                "class_probabilities": probabilities.tolist(),
+            },
+            headers={MODEL_VERSION_HEADER: entry.version},
+        )
+
+    except Exception as e:
+        predictions_total.add(1, {"status": "error"})
+        logger.error(f"Columnar prediction error: {e}")
+        raise HTTPException(status_code=400, detail=f"Prediction failed: {str(e)}")
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8080))
     uvicorn.run(app, host="0.0.0.0", port=port)
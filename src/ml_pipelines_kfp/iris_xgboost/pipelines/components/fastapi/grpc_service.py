@@ -0,0 +1,162 @@
+"""gRPC front end to the FastAPI container's model registry.
+
+Serves grpc_inference's Predict (unary batch) and PredictStream
+(bidirectional) methods from the uvicorn process, so both transports score
+with the same loaded ModelVersion, executor, micro-batcher and OTel metrics.
+PredictStream lets a Dataflow worker keep one long-lived stream open: up to
+max_in_flight requests per stream are scored concurrently and answered in
+completion order; once that many are in flight, the servicer stops reading
+and gRPC flow control pushes back on the client.
+"""
+
+import asyncio
+
+import grpc
+
+from grpc_inference import (
+    INTERNAL,
+    INVALID_ARGUMENT,
+    NOT_FOUND,
+    SERVICE,
+    UNAVAILABLE,
+    decode_predict_request,
+    encode_error,
+    encode_predict_response,
+)
+from wire_format import unpack_features
+from log import get_logger
+
+logger = get_logger(__name__)
+
+# Large enough for a few thousand rows per message in either direction
+MAX_MESSAGE_BYTES = 32 * 1024 * 1024
+
+_STATUS_CODES = {
+    INVALID_ARGUMENT: grpc.StatusCode.INVALID_ARGUMENT,
+    NOT_FOUND: grpc.StatusCode.NOT_FOUND,
+    UNAVAILABLE: grpc.StatusCode.UNAVAILABLE,
+    INTERNAL: grpc.StatusCode.INTERNAL,
+}
+
+
+class PredictionError(Exception):
+    def __init__(self, request_id, code, detail):
+        super().__init__(detail)
+        self.request_id = request_id
+        self.code = code
+        self.detail = detail
+
+
+class InferenceServicer:
+    """Handlers for the Predict and PredictStream methods.
+
+    get_registry() returns the ModelRegistry (or None before startup),
+    feature_columns(entry) a version's column order, and predict(X, entry)
+    awaits (predictions, probabilities). on_result(n_rows, status), if
+    given, records metrics for each request.
+    """
+
+    def __init__(self, get_registry, feature_columns, predict, on_result=None, max_in_flight=8):
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be >= 1, got {max_in_flight}")
+        self.get_registry = get_registry
+        self.feature_columns = feature_columns
+        self.predict_fn = predict
+        self.on_result = on_result
+        self.max_in_flight = max_in_flight
+
+    def _resolve(self, request_id, model_version):
+        registry = self.get_registry()
+        if registry is None or registry.current is None:
+            raise PredictionError(request_id, UNAVAILABLE, "Model not loaded")
+        try:
+            return registry.get(model_version)
+        except KeyError:
+            raise PredictionError(request_id, NOT_FOUND, f"Model version {model_version} is not loaded")
+
+    async def _score(self, body):
+        try:
+            message = decode_predict_request(body)
+        except ValueError as e:
+            raise PredictionError(0, INVALID_ARGUMENT, str(e))
+        request_id = message.get("request_id", 0)
+        entry = self._resolve(request_id, message.get("model_version"))
+        try:
+            X = unpack_features(message, self.feature_columns(entry))
+        except ValueError as e:
+            raise PredictionError(request_id, INVALID_ARGUMENT, f"Invalid features: {e}")
+
+        try:
+            predictions, probabilities = await self.predict_fn(X, entry)
+        except Exception as e:
+            if self.on_result is not None:
+                self.on_result(1, "error")
+            logger.error(f"gRPC prediction error: {e}")
+            raise PredictionError(request_id, INTERNAL, f"Prediction failed: {e}")
+        if self.on_result is not None:
+            self.on_result(len(predictions), "success")
+        return encode_predict_response(request_id, entry.version, predictions, probabilities)
+
+    async def predict(self, body, context):
+        try:
+            return await self._score(body)
+        except PredictionError as e:
+            await context.abort(_STATUS_CODES[e.code], e.detail)
+
+    async def predict_stream(self, request_iterator, context):
+        responses = asyncio.Queue()
+        slots = asyncio.Semaphore(self.max_in_flight)
+        tasks = set()
+
+        async def handle(body):
+            try:
+                responses.put_nowait(await self._score(body))
+            except PredictionError as e:
+                responses.put_nowait(encode_error(e.request_id, e.code, e.detail))
+            finally:
+                slots.release()
+
+        async def read_requests():
+            try:
+                async for body in request_iterator:
+                    await slots.acquire()
+                    task = asyncio.create_task(handle(body))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                if tasks:
+                    await asyncio.wait(list(tasks))
+            finally:
+                responses.put_nowait(None)
+
+        reader = asyncio.create_task(read_requests())
+        try:
+            while True:
+                response = await responses.get()
+                if response is None:
+                    break
+                yield response
+        finally:
+            reader.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+
+def create_server(servicer, address):
+    """A grpc.aio server for servicer listening on address; returns (server, bound_port).
+
+    address is anything add_insecure_port accepts, e.g. "[::]:50051" or
+    "unix:///tmp/inference.sock". Call server.start() to begin serving.
+    """
+    options = [
+        ("grpc.max_receive_message_length", MAX_MESSAGE_BYTES),
+        ("grpc.max_send_message_length", MAX_MESSAGE_BYTES),
+    ]
+    server = grpc.aio.server(options=options)
+    # No (de)serializers: the handlers exchange raw msgpack bytes (see grpc_inference.py)
+    handler = grpc.method_handlers_generic_handler(SERVICE, {
+        "Predict": grpc.unary_unary_rpc_method_handler(servicer.predict),
+        "PredictStream": grpc.stream_stream_rpc_method_handler(servicer.predict_stream),
+    })
+    server.add_generic_rpc_handlers((handler,))
+    port = server.add_insecure_port(address)
+    return server, port
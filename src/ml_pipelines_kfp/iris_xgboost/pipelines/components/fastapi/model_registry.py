@@ -0,0 +1,196 @@
+"""In-process model registry with background hot reload.
+
+A source reports the latest artifact version (a GCS object generation, a
+versioned subdirectory, or a local file's mtime). ModelRegistry.refresh()
+fetches, loads and warms a new version off the event loop and only then
+publishes it, by rebinding a single attribute. Request handlers resolve a
+ModelVersion once and keep using that object, so a request in flight is
+never served by a half-loaded model and is unaffected by later swaps. The
+last max_versions versions stay loaded so requests can pin one.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from log import get_logger
+
+logger = get_logger(__name__)
+
+
+class GcsModelSource:
+    """Watch GCS objects by generation; candidates are tried in preference order."""
+
+    def __init__(self, gcs_uris, cache):
+        self.gcs_uris = list(gcs_uris)
+        self.cache = cache
+
+    def latest(self):
+        for uri in self.gcs_uris:
+            generation = self.cache.latest_generation(uri)
+            if generation is not None:
+                return str(generation), (uri, generation)
+        return None, None
+
+    def fetch(self, locator):
+        uri, generation = locator
+        return self.cache.fetch(uri, generation)
+
+
+class LocalDirectorySource:
+    """Watch a directory of version subdirectories (<root>/<version>/<filename>).
+
+    The most recently modified subdirectory holding one of filenames wins;
+    filenames are tried in preference order within it.
+    """
+
+    def __init__(self, root, filenames):
+        self.root = root
+        self.filenames = list(filenames)
+
+    def latest(self):
+        if not os.path.isdir(self.root):
+            return None, None
+        candidates = []
+        for version in os.listdir(self.root):
+            for filename in self.filenames:
+                path = os.path.join(self.root, version, filename)
+                if os.path.isfile(path):
+                    candidates.append((os.path.getmtime(path), version, path))
+                    break
+        if not candidates:
+            return None, None
+        _, version, path = max(candidates)
+        return version, path
+
+    def fetch(self, locator):
+        return locator, None
+
+
+class LocalFileSource:
+    """Watch local files by modification time; candidates are tried in preference order."""
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+
+    def latest(self):
+        for path in self.paths:
+            if os.path.isfile(path):
+                return str(os.stat(path).st_mtime_ns), path
+        return None, None
+
+    def fetch(self, locator):
+        return locator, None
+
+
+@dataclass
+class ModelVersion:
+    version: str
+    adapter: object
+    path: str
+    loaded_at: float
+    cache_hit: Optional[bool] = None
+    load_timings: Dict[str, float] = field(default_factory=dict)
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "backend": self.adapter.backend,
+            "model_type": type(self.adapter.estimator).__name__,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ModelRegistry:
+    """Loaded model versions plus the one unpinned requests are served by.
+
+    loader(path) builds a ModelAdapter; warmup, if given, is a coroutine
+    function awaited with the new ModelVersion before it is published.
+    """
+
+    def __init__(self, source, loader, warmup=None, max_versions=2):
+        if max_versions < 1:
+            raise ValueError(f"max_versions must be >= 1, got {max_versions}")
+        self.source = source
+        self.loader = loader
+        self.warmup = warmup
+        self.max_versions = max_versions
+        self.current = None
+        self._versions = OrderedDict()
+        self._refresh_lock = asyncio.Lock()
+        self._watcher = None
+
+    def get(self, version=None):
+        """The pinned version, else the current one; raises KeyError for unknown versions."""
+        if version is None:
+            if self.current is None:
+                raise KeyError("No model version loaded")
+            return self.current
+        return self._versions[version]
+
+    def list_versions(self):
+        return [entry.describe() for entry in reversed(self._versions.values())]
+
+    async def refresh(self):
+        """Load the source's latest version if it is new; returns the new ModelVersion or None."""
+        async with self._refresh_lock:
+            version, locator = await asyncio.to_thread(self.source.latest)
+            if version is None:
+                if self.current is None:
+                    raise FileNotFoundError("No model artifact found at the configured source")
+                return None
+            if version in self._versions:
+                return None
+
+            start = time.perf_counter()
+            path, cache_hit = await asyncio.to_thread(self.source.fetch, locator)
+            fetched = time.perf_counter()
+            adapter = await asyncio.to_thread(self.loader, path)
+            deserialized = time.perf_counter()
+
+            entry = ModelVersion(version, adapter, path, loaded_at=time.time(), cache_hit=cache_hit)
+            if self.warmup is not None:
+                await self.warmup(entry)
+            warmed = time.perf_counter()
+            entry.load_timings = {
+                "fetch": fetched - start,
+                "deserialize": deserialized - fetched,
+                "warmup": warmed - deserialized,
+            }
+
+            self._versions[version] = entry
+            self.current = entry
+            while len(self._versions) > self.max_versions:
+                evicted, _ = self._versions.popitem(last=False)
+                logger.info(f"Unloaded model version {evicted}")
+            logger.info(f"Serving model version {version} from {path}")
+            return entry
+
+    def start_watching(self, interval_s, on_loaded=None):
+        self._watcher = asyncio.get_running_loop().create_task(self._watch(interval_s, on_loaded))
+
+    async def stop_watching(self):
+        if self._watcher is None:
+            return
+        self._watcher.cancel()
+        try:
+            await self._watcher
+        except asyncio.CancelledError:
+            pass
+        self._watcher = None
+
+    async def _watch(self, interval_s, on_loaded):
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                entry = await self.refresh()
+            except Exception as e:
+                # Keep serving the current version; the next poll retries
+                logger.error(f"Model refresh failed: {e}")
+                continue
+            if entry is not None and on_loaded is not None:
+                on_loaded(entry)
@@ -0,0 +1,124 @@
+"""Bounded LRU/TTL cache of per-row predictions.
+
+Streaming traffic repeats a small set of feature vectors (pubsub_producer.py
+rounds every feature to one decimal), so most rows have been scored before.
+Entries are keyed by the model version plus the row's features rounded to
+`decimals`, so a new model version never reads another version's results,
+and retain_versions() drops the entries of versions no longer loaded.
+predict_through() scores a batch with the cached rows filled in and only the
+distinct missing rows sent to the model, in a single call.
+
+Used from the event loop only; it does no locking.
+"""
+
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+CAPACITY = "capacity"
+EXPIRED = "expired"
+MODEL_CHANGE = "model_change"
+
+
+class PredictionCache:
+    """Map (model version, quantised row) -> (prediction, class probabilities).
+
+    At most max_entries rows are kept, least recently used evicted first;
+    entries older than ttl_s are treated as misses (ttl_s <= 0 disables
+    expiry). on_lookup(hits, misses) and on_evict(count, reason), if given,
+    are called for metrics.
+    """
+
+    def __init__(self, max_entries=100_000, ttl_s=300.0, decimals=6,
+                 on_lookup=None, on_evict=None, clock=time.monotonic):
+        if max_entries < 1:
+            raise ValueError(f"max_entries must be >= 1, got {max_entries}")
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.decimals = decimals
+        self.on_lookup = on_lookup
+        self.on_evict = on_evict
+        self.clock = clock
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _keys(self, version, X):
+        rounded = np.ascontiguousarray(np.round(np.asarray(X, dtype=np.float64), self.decimals))
+        # -0.0 and 0.0 round to different bytes; fold them together
+        rounded += 0.0
+        return [(version, row.tobytes()) for row in rounded]
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= now:
+            del self._entries[key]
+            self._evicted(1, EXPIRED)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put(self, key, value, now):
+        expires_at = now + self.ttl_s if self.ttl_s > 0 else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        evicted = 0
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        if evicted:
+            self._evicted(evicted, CAPACITY)
+
+    def _evicted(self, count, reason):
+        if self.on_evict is not None:
+            self.on_evict(count, reason)
+
+    def retain_versions(self, versions):
+        """Drop every entry whose model version is not in versions."""
+        versions = set(versions)
+        stale = [key for key in self._entries if key[0] not in versions]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self._evicted(len(stale), MODEL_CHANGE)
+
+    async def predict_through(self, version, X, predict):
+        """(predictions, probabilities) for X, calling predict(X_missing) once for the uncached rows.
+
+        Rows repeated within X are scored once. predict is a coroutine
+        function with the (predictions, probabilities) contract of the
+        model executor.
+        """
+        now = self.clock()
+        keys = self._keys(version, X)
+        cached = [self._get(key, now) for key in keys]
+
+        # First row index of each distinct missing key
+        missing = {}
+        for i, (key, value) in enumerate(zip(keys, cached)):
+            if value is None and key not in missing:
+                missing[key] = i
+        if self.on_lookup is not None:
+            misses = sum(value is None for value in cached)
+            self.on_lookup(len(keys) - misses, misses)
+
+        if missing:
+            rows = list(missing.values())
+            miss_predictions, miss_probabilities = await predict(np.asarray(X)[rows])
+            now = self.clock()
+            for key, prediction, probabilities in zip(missing, miss_predictions, miss_probabilities):
+                value = (prediction, np.array(probabilities))
+                self._put(key, value, now)
+                missing[key] = value
+            if len(missing) == len(keys):
+                return miss_predictions, miss_probabilities
+            cached = [value if value is not None else missing[key] for key, value in zip(keys, cached)]
+
+        predictions = np.array([value[0] for value in cached])
+        probabilities = np.stack([value[1] for value in cached])
+        return predictions, probabilities
@@ -10,6 +10,7 @@ def inference_model(
     bq_feature_table: str,
     bq_table_predictions: str,
     model: Input[Model],
+    backend: str = "sklearn",
 ):
     import joblib
     from google.cloud import bigquery
@@ -37,6 +38,18 @@ def inference_model(
     df_cols = df[feature_cols]
 
     inf_model = joblib.load(model.path + "/model.joblib")
+    if backend == "compiled":
+        from ml_pipelines_kfp.compiled_trees import BATCH_MAX_ROWS, compile_model
+
+        if len(df_cols) > BATCH_MAX_ROWS:
+            # sklearn's per-tree loops are faster on tables this size
+            logger.info(f"Scoring {len(df_cols)} rows with sklearn; compiled engine is used up to {BATCH_MAX_ROWS}")
+        else:
+            try:
+                inf_model = compile_model(inf_model)
+                logger.info(f"Scoring with compiled tree engine ({inf_model.n_trees} trees)")
+            except TypeError as e:
+                logger.warning(f"Compiled backend unavailable, scoring with sklearn: {e}")
     inf_pred = inf_model.predict(df_cols)
 
     predictions_df = df.copy()
@@ -36,6 +36,7 @@ def pipeline(
     bq_dataset: str,
     bq_feature_table: str,
     bq_table_predictions: str,
+    inference_backend: str = "sklearn",
 ):
 
     # Import components
@@ -57,6 +58,7 @@ def pipeline(
             bq_dataset=bq_dataset,
             bq_feature_table=bq_feature_table,
             bq_table_predictions=bq_table_predictions,
+            backend=inference_backend,
         )
         .set_display_name("Inference Model")
         .after(get_model_op)
@@ -78,6 +80,12 @@ if __name__ == "__main__":
     parser.add_argument("--bq-dataset", default=BQ_DATASET)
     parser.add_argument("--bq-feature-table", default=BQ_FEATURE_TABLE)
     parser.add_argument("--bq-table-predictions", default=BQ_TABLE_PREDICTIONS)
+    parser.add_argument("--inference-backend", default="sklearn", choices=["sklearn", "compiled"],
+                        help="Model engine for batch scoring; 'compiled' flattens tree "
+                             "ensembles into packed arrays (see ml_pipelines_kfp/compiled_trees.py) "
+                             "and pays off for small feature tables. Tables over "
+                             "compiled_trees.BATCH_MAX_ROWS (500) rows and unsupported models "
+                             "are scored with sklearn")
     parser.add_argument("--accelerator-type", default="",
                         help="GPU type to attach to the inference step "
                              "(e.g., NVIDIA_TESLA_T4, NVIDIA_L4). "
@@ -119,6 +127,7 @@ if __name__ == "__main__":
             "bq_dataset": cli.bq_dataset,
             "bq_feature_table": cli.bq_feature_table,
             "bq_table_predictions": cli.bq_table_predictions,
+            "inference_backend": cli.inference_backend,
             "location": cli.region,
             "project_id": cli.project_id,
         },
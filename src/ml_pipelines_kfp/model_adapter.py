@@ -0,0 +1,103 @@
+"""Inference adapter: one predict call producing both classes and probabilities.
+
+Tree ensembles, gradient boosting and logistic regression implement
+predict() as an argmax over predict_proba(), so calling both evaluates every
+tree in the ensemble twice. ModelAdapter inspects the loaded estimator once
+and, for those estimators only, derives the class from the probabilities via
+classes_ instead of a second pass.
+
+With backend="compiled", supported tree classifiers are flattened by
+compiled_trees.compile_model and served from packed arrays instead, or
+mapped straight from a pre-built serving artifact (model.serving).
+"""
+
+import joblib
+import numpy as np
+
+try:
+    from compiled_trees import CompiledTreeEnsemble, compile_model
+    from log import get_logger
+    from serving_artifact import SERVING_SUFFIX, load_serving_artifact
+except ImportError:  # imported as ml_pipelines_kfp.model_adapter outside the FastAPI container
+    from ml_pipelines_kfp.compiled_trees import CompiledTreeEnsemble, compile_model
+    from ml_pipelines_kfp.log import get_logger
+    from ml_pipelines_kfp.serving_artifact import SERVING_SUFFIX, load_serving_artifact
+
+logger = get_logger(__name__)
+
+# How ModelAdapter.predict produces (classes, probabilities)
+PROBA_ARGMAX = "proba_argmax"
+SEPARATE_CALLS = "separate_calls"
+PREDICT_ONLY = "predict_only"
+
+# Which engine evaluates the estimator
+SKLEARN = "sklearn"
+COMPILED = "compiled"
+BACKENDS = (SKLEARN, COMPILED)
+
+# (package, class name) of estimators whose predict() is the argmax of their predict_proba(), matched
+# anywhere in the estimator's MRO. Others, such as SVC(probability=True) whose Platt-scaled probabilities
+# can disagree with its decision function, or calibrated and threshold-tuned wrappers, keep two calls.
+_PROBA_ARGMAX_ESTIMATORS = {
+    ("sklearn", "BaseDecisionTree"),
+    ("sklearn", "ForestClassifier"),
+    ("sklearn", "GradientBoostingClassifier"),
+    ("sklearn", "HistGradientBoostingClassifier"),
+    ("sklearn", "LogisticRegression"),
+    ("xgboost", "XGBClassifier"),
+}
+
+
+class ModelAdapter:
+    """Uniform predict(X) -> (classes, probabilities) over a loaded estimator."""
+
+    def __init__(self, estimator, source_path=None, backend=SKLEARN):
+        self.estimator = estimator
+        self.source_path = source_path
+        self.backend = backend
+        self.mode = self._detect_mode(estimator)
+        self.classes = np.asarray(estimator.classes_) if self.mode == PROBA_ARGMAX else None
+
+    @staticmethod
+    def _detect_mode(estimator):
+        if not hasattr(estimator, "predict_proba"):
+            return PREDICT_ONLY
+        classes = getattr(estimator, "classes_", None)
+        # Multi-output classifiers expose a list of class arrays per output
+        if classes is None or np.ndim(classes) != 1:
+            return SEPARATE_CALLS
+        if isinstance(estimator, CompiledTreeEnsemble) or any(
+            (cls.__module__.split(".")[0], cls.__name__) in _PROBA_ARGMAX_ESTIMATORS
+            for cls in type(estimator).__mro__
+        ):
+            return PROBA_ARGMAX
+        return SEPARATE_CALLS
+
+    def predict(self, X):
+        if self.mode == PROBA_ARGMAX:
+            probabilities = self.estimator.predict_proba(X)
+            return self.classes.take(np.argmax(probabilities, axis=1)), probabilities
+        if self.mode == SEPARATE_CALLS:
+            return self.estimator.predict(X), self.estimator.predict_proba(X)
+        predictions = self.estimator.predict(X)
+        return predictions, np.empty((len(predictions), 0))
+
+
+def load_adapter(model_path, backend=SKLEARN):
+    """Load a joblib model or serving artifact and wrap it in a ModelAdapter.
+
+    backend="compiled" falls back to sklearn, with a warning, for estimators
+    compile_model does not support.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend {backend!r}, expected one of {BACKENDS}")
+    if model_path.endswith(SERVING_SUFFIX):
+        return ModelAdapter(load_serving_artifact(model_path), source_path=model_path, backend=COMPILED)
+    estimator = joblib.load(model_path)
+    if backend == COMPILED:
+        try:
+            estimator = compile_model(estimator)
+        except TypeError as e:
+            logger.warning(f"Compiled backend unavailable, serving with sklearn: {e}")
+            backend = SKLEARN
+    return ModelAdapter(estimator, source_path=model_path, backend=backend)
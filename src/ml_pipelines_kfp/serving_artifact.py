@@ -0,0 +1,127 @@
+"""Page-aligned, memory-mappable serving artifact for compiled tree ensembles.
+
+model.joblib is a pickle: loading it deserialises and copies every tree. The
+serving artifact stores the CompiledTreeEnsemble arrays uncompressed, each at
+a page-aligned offset, so load_serving_artifact() maps the file read-only and
+builds the ensemble from zero-copy views. Pages are faulted in on first use
+and shared between processes mapping the same file (INFERENCE_EXECUTOR=process).
+
+Layout:
+    MAGIC | uint64 header length | JSON header | padding to PAGE_SIZE
+    array 0 | padding to PAGE_SIZE | array 1 | ...
+
+The header records each array's dtype, shape and offset plus the scalar
+model metadata. The deploy component writes model.serving next to
+model.joblib; the FastAPI server loads it when MODEL_BACKEND=compiled.
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+try:
+    from compiled_trees import CompiledTreeEnsemble
+except ImportError:  # imported as ml_pipelines_kfp.serving_artifact outside the FastAPI container
+    from ml_pipelines_kfp.compiled_trees import CompiledTreeEnsemble
+
+MAGIC = b"MLSERVE1"
+FORMAT_VERSION = 1
+PAGE_SIZE = 4096
+SERVING_SUFFIX = ".serving"
+
+_ARRAYS = ("feature", "threshold", "children", "value", "roots", "missing_left")
+_LENGTH = struct.Struct("<Q")
+
+
+def serving_artifact_path(model_path):
+    """model.joblib -> model.serving; works for local paths and gs:// URIs."""
+    return os.path.splitext(model_path)[0] + SERVING_SUFFIX
+
+
+def _align(offset):
+    return -(-offset // PAGE_SIZE) * PAGE_SIZE
+
+
+def write_serving_artifact(ensemble, path):
+    """Write a CompiledTreeEnsemble to path (atomically, via a temp file)."""
+    arrays = {
+        name: np.ascontiguousarray(getattr(ensemble, name))
+        for name in _ARRAYS
+        if getattr(ensemble, name) is not None
+    }
+    feature_names = getattr(ensemble, "feature_names_in_", None)
+    header = {
+        "format_version": FORMAT_VERSION,
+        "max_depth": ensemble.max_depth,
+        "n_features": ensemble.n_features_in_,
+        "classes": ensemble.classes_.tolist(),
+        "classes_dtype": ensemble.classes_.dtype.str,
+        "feature_names": None if feature_names is None else [str(f) for f in feature_names],
+        "arrays": {},
+    }
+
+    # Offsets depend on the header size, so lay out against a generous header budget
+    header_budget = PAGE_SIZE
+    while True:
+        offset = header_budget
+        for name, array in arrays.items():
+            header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset = _align(offset + array.nbytes)
+        encoded = json.dumps(header).encode()
+        if len(MAGIC) + _LENGTH.size + len(encoded) <= header_budget:
+            break
+        header_budget = _align(len(MAGIC) + _LENGTH.size + len(encoded))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(encoded)))
+        f.write(encoded)
+        for name, array in arrays.items():
+            f.seek(header["arrays"][name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a serving artifact")
+        (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+        header = json.loads(f.read(length))
+    if header["format_version"] != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported serving artifact version {header['format_version']}, expected {FORMAT_VERSION}"
+        )
+    return header
+
+
+def load_serving_artifact(path):
+    """Map a serving artifact read-only and return a CompiledTreeEnsemble over it."""
+    header = read_header(path)
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays = {
+        name: np.frombuffer(
+            buffer,
+            dtype=np.dtype(spec["dtype"]),
+            count=int(np.prod(spec["shape"])),
+            offset=spec["offset"],
+        ).reshape(spec["shape"])
+        for name, spec in header["arrays"].items()
+    }
+    feature_names = header["feature_names"]
+    return CompiledTreeEnsemble(
+        feature=arrays["feature"],
+        threshold=arrays["threshold"],
+        children=arrays["children"],
+        value=arrays["value"],
+        roots=arrays["roots"],
+        classes=np.asarray(header["classes"], dtype=np.dtype(header["classes_dtype"])),
+        max_depth=header["max_depth"],
+        n_features=header["n_features"],
+        missing_left=arrays.get("missing_left"),
+        feature_names=None if feature_names is None else np.asarray(feature_names, dtype=object),
+    )
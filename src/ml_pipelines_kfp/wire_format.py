@@ -0,0 +1,179 @@
+"""Binary encodings for /predict request and response bodies.
+
+JSON spends most of a float feature batch's bytes and CPU on number
+formatting and parsing, on both the Dataflow client and the FastAPI server.
+Two binary alternatives, chosen with Content-Type / Accept:
+
+application/msgpack
+    request:  {"columns": [...], "features": ARRAY}
+    response: {"predictions": ARRAY, "class_probabilities": ARRAY}
+    where ARRAY is {"dtype": "<f4", "shape": [n, k], "data": <raw bytes>}
+
+application/vnd.apache.arrow.stream
+    request:  one record batch, a float32 column per feature
+    response: one record batch with an int64 "prediction" column and a
+              fixed-size-list<float64> "class_probabilities" column
+
+The msgpack maps are built by pack_features / pack_predictions, which the
+gRPC messages in grpc_inference.py reuse. Shared by the FastAPI server
+(imported flat as wire_format) and the Dataflow inference client
+(ml_pipelines_kfp.wire_format).
+"""
+
+import msgpack
+import numpy as np
+import pyarrow as pa
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+BINARY_MEDIA_TYPES = (MSGPACK, ARROW)
+
+# Client-facing names, e.g. the Dataflow pipeline's --wire_format flag
+WIRE_FORMATS = {"json": JSON, "msgpack": MSGPACK, "arrow": ARROW}
+
+_ALIASES = {"application/x-msgpack": MSGPACK, "application/vnd.msgpack": MSGPACK}
+
+
+def media_type(header_value):
+    """Normalise a Content-Type / Accept value to one of JSON, MSGPACK, ARROW, or None."""
+    for part in (header_value or "").split(","):
+        value = part.split(";")[0].strip().lower()
+        value = _ALIASES.get(value, value)
+        if value in (JSON, MSGPACK, ARROW):
+            return value
+    return None
+
+
+def _pack_array(array):
+    array = np.ascontiguousarray(array)
+    return {"dtype": array.dtype.str, "shape": list(array.shape), "data": array.tobytes()}
+
+
+def _unpack_array(packed):
+    dtype = np.dtype(packed["dtype"])
+    if dtype.hasobject:
+        raise ValueError("Object arrays are not accepted")
+    return np.frombuffer(packed["data"], dtype=dtype).reshape(packed["shape"])
+
+
+def pack_features(X, columns):
+    """msgpack-ready map for an (n, n_features) feature matrix whose columns are named by columns."""
+    return {"columns": list(columns), "features": _pack_array(np.asarray(X, dtype=np.float32))}
+
+
+def unpack_features(payload, feature_columns):
+    """Inverse of pack_features, validated and reordered to feature_columns.
+
+    Raises ValueError for malformed payloads, missing columns or null values.
+    """
+    try:
+        X = _unpack_array(payload["features"])
+        columns = list(payload["columns"])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Malformed features payload: {e!r}")
+    if X.ndim != 2 or X.shape[1] != len(columns):
+        raise ValueError(f"features shape {X.shape} does not match {len(columns)} columns")
+    missing = [name for name in feature_columns if name not in columns]
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+    if columns != list(feature_columns):
+        X = X[:, [columns.index(name) for name in feature_columns]]
+    return _validated(np.ascontiguousarray(X, dtype=np.float32))
+
+
+def pack_predictions(predictions, probabilities):
+    return {
+        "predictions": _pack_array(np.asarray(predictions).astype(np.int64)),
+        "class_probabilities": _pack_array(np.asarray(probabilities, dtype=np.float64)),
+    }
+
+
+def unpack_predictions(payload):
+    return _unpack_array(payload["predictions"]), _unpack_array(payload["class_probabilities"])
+
+
+def _validated(X):
+    if len(X) == 0:
+        raise ValueError("Empty batch")
+    if np.isnan(X).any():
+        raise ValueError("Null feature values")
+    return X
+
+
+def encode_request(X, columns, media):
+    """Encode an (n, n_features) feature matrix whose columns are named by columns."""
+    X = np.asarray(X, dtype=np.float32)
+    if media == MSGPACK:
+        return msgpack.packb(pack_features(X, columns))
+    if media == ARROW:
+        batch = pa.RecordBatch.from_arrays([pa.array(X[:, i]) for i in range(X.shape[1])], names=list(columns))
+        return _write_arrow(batch)
+    raise ValueError(f"Unsupported media type {media!r}")
+
+
+def decode_request(body, media, feature_columns):
+    """Decode a request body into a float32 matrix in feature_columns order.
+
+    Raises ValueError for malformed bodies, missing columns or null values.
+    """
+    if media == MSGPACK:
+        return unpack_features(msgpack.unpackb(body), feature_columns)
+    if media == ARROW:
+        return _validated(_decode_arrow_features(body, feature_columns))
+    raise ValueError(f"Unsupported media type {media!r}")
+
+
+def _decode_arrow_features(body, feature_columns):
+    batch = _read_arrow(body)
+    missing = [name for name in feature_columns if batch.schema.get_field_index(name) < 0]
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+    X = np.empty((batch.num_rows, len(feature_columns)), dtype=np.float32)
+    for i, name in enumerate(feature_columns):
+        column = batch.column(batch.schema.get_field_index(name))
+        if column.null_count:
+            raise ValueError("Null feature values")
+        X[:, i] = column.to_numpy(zero_copy_only=False)
+    return X
+
+
+def encode_response(predictions, probabilities, media):
+    predictions = np.asarray(predictions).astype(np.int64)
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    if media == MSGPACK:
+        return msgpack.packb(pack_predictions(predictions, probabilities))
+    if media == ARROW:
+        n_classes = probabilities.shape[1] if probabilities.ndim == 2 else 0
+        probas = pa.FixedSizeListArray.from_arrays(pa.array(probabilities.ravel()), n_classes)
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(predictions), probas], names=["prediction", "class_probabilities"]
+        )
+        return _write_arrow(batch)
+    raise ValueError(f"Unsupported media type {media!r}")
+
+
+def decode_response(body, media):
+    """Decode a response body into (predictions, probabilities) arrays."""
+    if media == MSGPACK:
+        return unpack_predictions(msgpack.unpackb(body))
+    if media == ARROW:
+        batch = _read_arrow(body)
+        probas = batch.column(1)
+        probabilities = probas.flatten().to_numpy().reshape(batch.num_rows, probas.type.list_size)
+        return batch.column(0).to_numpy(), probabilities
+    raise ValueError(f"Unsupported media type {media!r}")
+
+
+def _write_arrow(batch):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def _read_arrow(body):
+    table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    if table.num_rows == 0:
+        raise ValueError("Empty batch")
+    return table.combine_chunks().to_batches()[0]
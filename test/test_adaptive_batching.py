@@ -0,0 +1,58 @@
+"""Tests for AIMD tuning of prediction batch size and concurrency."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataflow.iris_inference_pipeline import FEATURE_COLUMNS, BatchCallFastAPIService  # noqa: E402
+from dataflow.testing.fake_prediction_service import FakePredictionService  # noqa: E402
+from dataflow.utils.adaptive_batching import DECREASE, HOLD, AdaptiveBatchController  # noqa: E402
+
+
+def test_batch_size_settles_where_latency_meets_the_target():
+    controller = AdaptiveBatchController(max_batch_size=200, target_latency_ms=100, batch_size_step=5)
+    sizes = []
+    for _ in range(200):
+        # A service taking 10ms plus 2ms per row meets the target up to 45 rows
+        controller.record(controller.generation, 10 + 2 * controller.batch_size)
+        sizes.append(controller.batch_size)
+
+    assert max(sizes[-50:]) <= 50
+    assert min(sizes[-50:]) >= 20
+    assert controller.concurrency == controller.max_concurrency
+
+
+def test_a_round_of_failures_decreases_once_and_respects_the_bounds():
+    controller = AdaptiveBatchController(
+        min_batch_size=4, max_batch_size=64, min_concurrency=2, max_concurrency=8, initial_concurrency=8,
+    )
+    generation = controller.generation
+    decisions = [controller.record(generation, 10, failed=True) for _ in range(8)]
+    assert decisions == [DECREASE] + [HOLD] * 7
+    assert (controller.batch_size, controller.concurrency) == (32, 4)
+
+    for _ in range(10):
+        controller.record(controller.generation, 10, failed=True)
+    assert (controller.batch_size, controller.concurrency) == (4, 2)
+
+
+def test_calls_shrink_against_a_service_slowing_with_batch_size():
+    elements = [
+        {"entity_id": f"e{i}", **{col: float(i % 7) for col in FEATURE_COLUMNS}}
+        for i in range(1200)
+    ]
+    # 5ms plus 1ms per row: calls above ~35 rows miss the 40ms target
+    with FakePredictionService(FEATURE_COLUMNS, latency_secs=0.005, per_row_secs=0.001) as service:
+        controller = AdaptiveBatchController(max_batch_size=200, max_concurrency=4, target_latency_ms=40)
+        dofn = BatchCallFastAPIService(service.url, controller=controller)
+        dofn.setup()
+        try:
+            rows = [row for start in range(0, len(elements), 200) for row in dofn.process(elements[start:start + 200])]
+        finally:
+            dofn.teardown()
+
+    assert sorted(row["entity_id"] for row in rows) == sorted(e["entity_id"] for e in elements)
+    assert service.batch_sizes[0] == 200
+    assert max(service.batch_sizes[-10:]) <= 60
+    assert controller.concurrency > 1
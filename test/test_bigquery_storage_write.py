@@ -0,0 +1,95 @@
+"""Tests for the Storage Write API sink against a fake BigQueryWrite service."""
+
+import functools
+import sys
+from collections import Counter
+from pathlib import Path
+
+import apache_beam as beam
+import pytest
+from apache_beam.testing.util import assert_that, equal_to
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataflow.iris_feature_pipeline import FEATURE_TABLE_SCHEMA  # noqa: E402
+from dataflow.testing.fake_bigquery_write import FakeBigQueryWrite, bigquery_write_client  # noqa: E402
+from dataflow.utils.bigquery_storage_write import (  # noqa: E402
+    ProtoRowEncoder,
+    WriteToBigQueryStorage,
+    _AppendAtOffsets,
+    table_path,
+)
+
+TABLE = "project:dataset.iris_features"
+
+
+def _feature_row(i):
+    return {
+        "sepal_length_cm": 5.1, "sepal_width_cm": 3.5, "petal_length_cm": 1.4, "petal_width_cm": 0.2,
+        "species": None if i % 2 else "setosa", "source": "streaming", "entity_id": f"{i}_streaming",
+        "feature_timestamp": "2026-01-01T00:00:00+00:00",
+    }
+
+
+@pytest.mark.parametrize("exactly_once", [False, True])
+def test_rows_are_appended_and_refused_rows_dead_lettered(exactly_once):
+    rows = [_feature_row(i) for i in range(40)]
+    # Refused before the append: a missing REQUIRED column and a value of the wrong type
+    rows[4]["source"] = None
+    rows[6]["sepal_length_cm"] = "not a float"
+    # Refused by the table: the fake requires species, which odd rows lack and the schema leaves NULLABLE
+    refused = {i: "row_error" for i in range(1, 40, 2)}
+    refused.update({4: "encode_error", 6: "encode_error"})
+
+    with FakeBigQueryWrite(required_columns=["species"]) as fake:
+        with beam.Pipeline() as pipeline:
+            dead_letters = (
+                pipeline
+                | beam.Create(rows)
+                | WriteToBigQueryStorage(
+                    TABLE, FEATURE_TABLE_SCHEMA, pipeline="feature", exactly_once=exactly_once, batch_size=8,
+                    num_shards=3, client_factory=functools.partial(bigquery_write_client, fake.target),
+                )
+            )
+            assert_that(
+                dead_letters | beam.Map(lambda dl: (dl["entity_id"], dl["stage"], dl["error_type"])),
+                equal_to([(f"{i}_streaming", "write_bigquery", error_type) for i, error_type in refused.items()]),
+            )
+
+    written = fake.rows(table_path(TABLE))
+    assert sorted(row["entity_id"] for row in written) == sorted(
+        f"{i}_streaming" for i in range(40) if i not in refused
+    )
+    assert written[0]["feature_timestamp"] == 1767225600000000
+    if exactly_once:
+        # Offsets on each committed stream run on without gaps
+        for stream in {stream for stream, _, _ in fake.appends}:
+            offsets = [(offset, len(batch)) for s, offset, batch in fake.appends if s == stream]
+            assert [offset for offset, _ in offsets] == [sum(n for _, n in offsets[:k]) for k in range(len(offsets))]
+    else:
+        assert Counter(stream.rsplit("/", 1)[1] for stream, _, _ in fake.appends) == {"_default": len(fake.appends)}
+
+
+def test_a_replayed_batch_is_not_written_twice():
+    rows = [_feature_row(i) for i in range(0, 10, 2)]
+    with FakeBigQueryWrite() as fake:
+        dofn = _AppendAtOffsets(TABLE, FEATURE_TABLE_SCHEMA, "feature", functools.partial(bigquery_write_client, fake.target))
+        dofn.setup()
+        try:
+            stream = dofn._create_stream()
+            assert dofn._write(stream, rows, 0) == (5, [])
+            # The bundle failed before its state was committed; the retry appends at the same offset
+            assert dofn._write(stream, rows, 0) == (5, [])
+            assert dofn._write(stream, rows[:2], 5) == (2, [])
+        finally:
+            dofn.teardown()
+    assert [(offset, len(batch)) for _, offset, batch in fake.appends] == [(0, 5), (5, 2)]
+
+
+def test_encoder_rejects_rows_bigquery_would_refuse():
+    encoder = ProtoRowEncoder(FEATURE_TABLE_SCHEMA)
+    assert encoder.encode(_feature_row(0))
+    with pytest.raises(ValueError, match="REQUIRED column entity_id"):
+        encoder.encode({**_feature_row(0), "entity_id": None})
+    with pytest.raises(ValueError, match="FLOAT column petal_width_cm"):
+        encoder.encode({**_feature_row(0), "petal_width_cm": "wide"})
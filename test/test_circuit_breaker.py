@@ -0,0 +1,144 @@
+"""Tests for the prediction client's circuit breaker and hedged requests."""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import apache_beam as beam
+from apache_beam.metrics.metric import MetricsFilter
+from apache_beam.testing.util import assert_that, equal_to
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataflow.iris_inference_pipeline import FEATURE_COLUMNS, BatchCallFastAPIService  # noqa: E402
+from dataflow.testing.fake_prediction_service import FakePredictionService  # noqa: E402
+from dataflow.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker  # noqa: E402
+from dataflow.utils.dead_letter import DEAD_LETTER_TAG  # noqa: E402
+from dataflow.utils.hedging import hedged  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_probes_and_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout_secs=10, clock=clock)
+
+    assert [breaker.record_failure() for _ in range(3)] == [None, None, OPEN]
+    assert breaker.allow_request() == (False, None)
+
+    clock.now = 10
+    assert breaker.allow_request() == (True, HALF_OPEN)
+    # One probe at a time
+    assert breaker.allow_request() == (False, None)
+    assert breaker.record_failure() == OPEN
+
+    clock.now = 20
+    assert breaker.allow_request() == (True, HALF_OPEN)
+    assert breaker.record_success() == CLOSED
+    assert breaker.allow_request() == (True, None)
+    # Successes reset the consecutive failure count
+    breaker.record_failure()
+    breaker.record_success()
+    assert [breaker.record_failure() for _ in range(2)] == [None, None]
+    assert breaker.state == CLOSED
+
+    # A released probe frees its slot without closing the breaker
+    assert breaker.record_failure() == OPEN
+    clock.now = 30
+    assert breaker.allow_request() == (True, HALF_OPEN)
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request() == (True, None)
+
+
+def test_open_breaker_dead_letters_batches_without_retrying():
+    batches = [
+        [{"entity_id": f"b{b}e{i}", **{col: 1.0 for col in FEATURE_COLUMNS}} for i in range(5)]
+        for b in range(4)
+    ]
+    # Nothing listens on port 1, so every call fails with a connection error
+    dofn = BatchCallFastAPIService("http://127.0.0.1:1", circuit_breaker_failure_threshold=1)
+
+    pipeline = beam.Pipeline()
+    results = (
+        pipeline
+        | beam.Create(batches, reshuffle=False)
+        | beam.ParDo(dofn).with_outputs(DEAD_LETTER_TAG, main="predictions")
+    )
+    assert_that(
+        results[DEAD_LETTER_TAG] | beam.Map(lambda dl: dl["error_type"]),
+        equal_to(["connection"] * 5 + ["circuit_open"] * 15),
+    )
+    start = time.monotonic()
+    result = pipeline.run()
+    result.wait_until_finish()
+
+    # No backoff sleeps: the first failure opened the breaker
+    assert time.monotonic() - start < 5
+    counters = {
+        name: sum(c.committed for c in result.metrics().query(MetricsFilter().with_name(name))["counters"])
+        for name in ["circuit_opened", "circuit_rejected", "prediction_retry"]
+    }
+    assert counters == {"circuit_opened": 1, "circuit_rejected": 15, "prediction_retry": 0}
+
+
+def test_refused_batches_are_dead_lettered_without_tripping_the_breaker():
+    batches = [
+        [{"entity_id": f"b{b}e{i}", **{col: 1.0 for col in FEATURE_COLUMNS}} for i in range(5)]
+        for b in range(4)
+    ]
+    with FakePredictionService(FEATURE_COLUMNS, error_status=400) as service:
+        dofn = BatchCallFastAPIService(service.url, circuit_breaker_failure_threshold=1)
+        pipeline = beam.Pipeline()
+        results = (
+            pipeline
+            | beam.Create(batches, reshuffle=False)
+            | beam.ParDo(dofn).with_outputs(DEAD_LETTER_TAG, main="predictions")
+        )
+        assert_that(
+            results[DEAD_LETTER_TAG] | beam.Map(lambda dl: dl["error_type"]),
+            equal_to(["client_error"] * 20),
+        )
+        result = pipeline.run()
+        result.wait_until_finish()
+
+    # Each batch was sent once and every one reached the service: the breaker stayed closed
+    assert service.requests == len(batches)
+    counters = {
+        name: sum(c.committed for c in result.metrics().query(MetricsFilter().with_name(name))["counters"])
+        for name in ["circuit_opened", "circuit_rejected", "prediction_retry"]
+    }
+    assert counters == {"circuit_opened": 0, "circuit_rejected": 0, "prediction_retry": 0}
+
+
+def test_hedge_wins_over_a_slow_call_and_falls_back_on_failure():
+    async def run(delays, fail_first=False):
+        calls = []
+
+        async def call():
+            n = len(calls)
+            calls.append(n)
+            await asyncio.sleep(delays[n])
+            if fail_first and n == 0:
+                raise ConnectionError("first copy failed")
+            return n
+
+        hedges = []
+        result = await hedged(call, 0.02, on_hedge=lambda: hedges.append(True))
+        return result, len(hedges)
+
+    # Fast enough: no duplicate is sent
+    assert asyncio.run(run([0.001])) == ((0, False), 0)
+    # The duplicate answers before the slow original
+    assert asyncio.run(run([1.0, 0.001])) == ((1, True), 1)
+    # The original answers first after the duplicate went out
+    assert asyncio.run(run([0.03, 1.0])) == ((0, False), 1)
+    # A failed copy does not fail the call while the other can still answer
+    assert asyncio.run(run([0.03, 0.06], fail_first=True)) == ((1, True), 1)
@@ -0,0 +1,85 @@
+"""Tests for the /predict:columnar endpoint of the FastAPI server, through TestClient."""
+
+import logging
+import os
+import sys
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.datasets import load_iris
+from sklearn.ensemble import RandomForestClassifier
+
+# The server exports its metrics to Cloud Monitoring; the exporter comes with the serving image
+pytest.importorskip("opentelemetry.exporter.cloud_monitoring")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "src"))
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp"))
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp/iris_xgboost"))
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp/iris_xgboost/pipelines/components/fastapi"))
+
+COLUMNS = ["sepal_length_cm", "sepal_width_cm", "petal_length_cm", "petal_width_cm"]
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    X, y = load_iris(return_X_y=True)
+    model_path = tmp_path_factory.mktemp("model") / "model.joblib"
+    joblib.dump(RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y), model_path)
+
+    # Read by fastapi_server at import
+    os.environ["MODEL_PATH"] = str(model_path)
+    os.environ.pop("MODEL_GCS_PATH", None)
+    os.environ.pop("AIP_STORAGE_URI", None)
+    # Nothing listens there; metric exports just fail quietly
+    os.environ.setdefault("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317")
+    logging.getLogger("opentelemetry").setLevel(logging.CRITICAL)
+    import fastapi_server
+
+    with TestClient(fastapi_server.app) as test_client:
+        yield test_client
+
+
+def _rows():
+    rng = np.random.default_rng(0)
+    return np.round(rng.uniform([4.0, 2.0, 1.0, 0.1], [8.0, 4.5, 7.0, 2.5], size=(20, 4)), 1).tolist()
+
+
+def _row_predictions(client, rows):
+    response = client.post("/predict", json={"instances": [dict(zip(COLUMNS, row)) for row in rows]})
+    assert response.status_code == 200
+    predictions = response.json()["predictions"]
+    return [p["class_"] for p in predictions], [p["class_probabilities"] for p in predictions]
+
+
+def test_column_and_matrix_payloads_match_predict(client):
+    rows = _rows()
+    expected_classes, expected_probabilities = _row_predictions(client, rows)
+
+    columns = {col: [row[i] for row in rows] for i, col in enumerate(COLUMNS)}
+    for payload in [columns, {"instances": rows}]:
+        response = client.post("/predict:columnar", json=payload)
+        assert response.status_code == 200
+        assert response.headers["X-Model-Version"]
+        body = response.json()
+        assert body["predictions"] == expected_classes
+        np.testing.assert_allclose(body["class_probabilities"], expected_probabilities)
+
+
+@pytest.mark.parametrize("payload, message", [
+    ({**{col: [1.0, 2.0] for col in COLUMNS}, "petal_width_cm": [1.0]}, "equal length"),
+    ({col: [1.0] for col in COLUMNS[:3]}, "Missing feature columns: ['petal_width_cm']"),
+    ({**{col: [1.0] for col in COLUMNS[1:]}, "sepal_len": [1.0]}, "Missing feature columns: ['sepal_length_cm']"),
+    ({**{col: [1.0] for col in COLUMNS}, "sepal_length_cm": ["wide"]}, "Invalid columnar payload"),
+    ({"instances": [[1.0, 2.0, "x", 4.0]]}, "Invalid columnar payload"),
+    ({"instances": [[1.0, 2.0, 3.0]]}, "Expected a 2-D matrix with 4 columns"),
+    ({col: [None] for col in COLUMNS}, "Null feature values"),
+])
+def test_malformed_payloads_are_rejected(client, payload, message):
+    response = client.post("/predict:columnar", json=payload)
+    assert response.status_code == 400
+    assert message in response.json()["detail"]
@@ -0,0 +1,84 @@
+"""Parity tests: the compiled tree engine reproduces sklearn predict_proba exactly."""
+
+import sys
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.tree import DecisionTreeClassifier
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp"))
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp/iris_xgboost/pipelines/components/fastapi"))
+
+from compiled_trees import compile_model  # noqa: E402
+from model_adapter import COMPILED, SKLEARN, load_adapter  # noqa: E402
+
+FEATURES = ["sepal_length_cm", "sepal_width_cm", "petal_length_cm", "petal_width_cm"]
+
+
+@pytest.fixture(scope="module")
+def iris_split():
+    df = pd.read_csv(REPO_ROOT / "src/ml_pipelines_kfp/iris_xgboost/data/iris.csv")
+    df.columns = FEATURES + ["species"]
+    df["species"] = df["species"].replace({"Versicolor": 0, "Virginica": 1, "Setosa": 2}).astype(int)
+    return train_test_split(df.drop("species", axis=1), df["species"], test_size=0.2, random_state=42)
+
+
+def _score_rows(X_test):
+    rng = np.random.default_rng(0)
+    random_rows = np.round(rng.uniform([4.0, 2.0, 1.0, 0.1], [8.0, 4.5, 7.0, 2.5], size=(3000, 4)), 1)
+    return [X_test.to_numpy(dtype=np.float32), random_rows.astype(np.float32)]
+
+
+@pytest.mark.parametrize(
+    "estimator",
+    [
+        DecisionTreeClassifier(),
+        RandomForestClassifier(random_state=0),
+        ExtraTreesClassifier(n_estimators=50, random_state=0),
+    ],
+    ids=lambda e: type(e).__name__,
+)
+def test_compiled_matches_sklearn(iris_split, estimator):
+    X_train, X_test, y_train, _ = iris_split
+    model = estimator.fit(X_train, y_train)
+    compiled = compile_model(model)
+
+    np.testing.assert_array_equal(compiled.classes_, model.classes_)
+    for X in _score_rows(X_test):
+        np.testing.assert_array_equal(compiled.predict_proba(X), model.predict_proba(X))
+        np.testing.assert_array_equal(compiled.predict(X), model.predict(X))
+
+
+def test_unsupported_estimator_rejected(iris_split):
+    X_train, _, y_train, _ = iris_split
+    with pytest.raises(TypeError):
+        compile_model(LogisticRegression(max_iter=500).fit(X_train, y_train))
+
+
+def test_load_adapter_compiled_backend(iris_split, tmp_path):
+    X_train, X_test, y_train, _ = iris_split
+    model = RandomForestClassifier(n_estimators=20, random_state=0).fit(X_train, y_train)
+    path = tmp_path / "model.joblib"
+    joblib.dump(model, path)
+
+    adapter = load_adapter(str(path), COMPILED)
+    predictions, probabilities = adapter.predict(X_test.to_numpy(dtype=np.float32))
+
+    assert adapter.backend == COMPILED
+    np.testing.assert_array_equal(predictions, model.predict(X_test))
+    np.testing.assert_array_equal(probabilities, model.predict_proba(X_test))
+
+
+def test_load_adapter_falls_back_to_sklearn(iris_split, tmp_path):
+    X_train, _, y_train, _ = iris_split
+    path = tmp_path / "model.joblib"
+    joblib.dump(LogisticRegression(max_iter=500).fit(X_train, y_train), path)
+
+    assert load_adapter(str(path), COMPILED).backend == SKLEARN
@@ -0,0 +1,66 @@
+"""DirectRunner test for the fused feature fetch and prediction stage."""
+
+import sys
+from pathlib import Path
+
+import apache_beam as beam
+from apache_beam.testing.util import assert_that, equal_to
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataflow.iris_inference_pipeline import (  # noqa: E402
+    FEATURE_COLUMNS,
+    BatchCallFastAPIService,
+    FetchAndPredict,
+)
+from dataflow.testing.fake_online_store import FakeOnlineStore, online_store_client  # noqa: E402
+from dataflow.testing.fake_prediction_service import FakePredictionService  # noqa: E402
+from dataflow.utils.dead_letter import DEAD_LETTER_TAG  # noqa: E402
+from dataflow.utils.online_store_reader import FetchFeaturesFromOnlineStore  # noqa: E402
+
+
+class FakeStoreFetch(FetchFeaturesFromOnlineStore):
+    def __init__(self, target, **kwargs):
+        super().__init__("project", "region", "store", "view", FEATURE_COLUMNS, **kwargs)
+        self.target = target
+
+    def _create_client(self):
+        return online_store_client(self.target)
+
+
+def _features(i):
+    return {col: float(i + j) for j, col in enumerate(FEATURE_COLUMNS)}
+
+
+def test_fetched_subset_of_each_batch_is_predicted_in_one_call():
+    features = {f"e{i}": _features(i) for i in range(7)}
+    batches = [
+        [{"entity_id": e} for e in ["e0", "e1", "gone", "e2"]],
+        [{"entity_id": e} for e in ["e3", "e4", "e5", "e6"]],
+    ]
+
+    with FakeOnlineStore(features) as store, FakePredictionService(FEATURE_COLUMNS, latency_secs=0.05) as service:
+        fused = FetchAndPredict(
+            FakeStoreFetch(store.target, max_retries=0, max_concurrency=4),
+            BatchCallFastAPIService(service.url),
+            max_pending_batches=1,
+        )
+        with beam.Pipeline() as pipeline:
+            results = (
+                pipeline
+                | beam.Create(batches, reshuffle=False)
+                | beam.ParDo(fused).with_outputs(DEAD_LETTER_TAG, main="predictions")
+            )
+            assert_that(
+                results.predictions | beam.Map(lambda row: (row["entity_id"], row["prediction"])),
+                # The fake service predicts int(first feature) % 3
+                equal_to([(f"e{i}", str(i % 3)) for i in range(7)]),
+            )
+            assert_that(
+                results[DEAD_LETTER_TAG] | beam.Map(lambda d: (d["entity_id"], d["stage"], d["error_type"])),
+                equal_to([("gone", "fetch", "missing_features")]),
+                label="CheckDeadLetters",
+            )
+
+    # One /predict call per input batch, carrying only the entities that had features
+    assert sorted(service.batch_sizes) == [3, 4]
@@ -0,0 +1,167 @@
+"""Tests for the gRPC inference service and the Dataflow gRPC client, over a local Unix socket."""
+
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+import grpc
+import joblib
+import numpy as np
+import pytest
+from sklearn.datasets import load_iris
+from sklearn.tree import DecisionTreeClassifier
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "src"))
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp"))
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp/iris_xgboost/pipelines/components/fastapi"))
+
+from grpc_inference import (  # noqa: E402
+    PREDICT_METHOD,
+    PREDICT_STREAM_METHOD,
+    decode_predict_response,
+    encode_predict_request,
+)
+from grpc_service import InferenceServicer, create_server  # noqa: E402
+from model_adapter import load_adapter  # noqa: E402
+from model_registry import LocalDirectorySource, ModelRegistry  # noqa: E402
+
+COLUMNS = ["sepal_length_cm", "sepal_width_cm", "petal_length_cm", "petal_width_cm"]
+
+
+class InProcessServer:
+    """gRPC server on its own event loop thread, listening on a Unix socket."""
+
+    def __init__(self, model_dir, socket_path, max_in_flight=4):
+        self.address = f"unix://{socket_path}"
+        self.loop = asyncio.new_event_loop()
+        self.results = []
+        self.registry = ModelRegistry(LocalDirectorySource(str(model_dir), ["model.joblib"]), loader=load_adapter)
+        self.servicer = InferenceServicer(
+            get_registry=lambda: self.registry,
+            feature_columns=lambda entry: COLUMNS,
+            predict=lambda X, entry: asyncio.to_thread(entry.adapter.predict, X),
+            on_result=lambda n, status: self.results.append((n, status)),
+            max_in_flight=max_in_flight,
+        )
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout=30)
+
+    def __enter__(self):
+        self._thread.start()
+        self.run(self.registry.refresh())
+        self.server, _ = self.run(self._create())
+        self.run(self.server.start())
+        return self
+
+    async def _create(self):
+        return create_server(self.servicer, self.address)
+
+    def __exit__(self, *exc):
+        self.run(self.server.stop(grace=None))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+def _publish(root, version, depth):
+    X, y = load_iris(return_X_y=True)
+    path = root / version / "model.joblib"
+    path.parent.mkdir(parents=True)
+    joblib.dump(DecisionTreeClassifier(max_depth=depth, random_state=0).fit(X, y), path)
+    return path
+
+
+@pytest.fixture
+def server(tmp_path):
+    _publish(tmp_path / "models", "v1", depth=3)
+    with InProcessServer(tmp_path / "models", tmp_path / "inference.sock") as running:
+        yield running
+
+
+def _rows(n, seed=0):
+    return np.random.default_rng(seed).uniform(0, 7, size=(n, 4)).astype(np.float32)
+
+
+def test_unary_predict_matches_model_and_records_metrics(server):
+    X = _rows(25)
+    with grpc.insecure_channel(server.address) as channel:
+        body = channel.unary_unary(PREDICT_METHOD)(encode_predict_request(X, COLUMNS, request_id=7))
+
+    message = decode_predict_response(body)
+    expected_classes, expected_probas = server.registry.current.adapter.predict(X)
+    assert message["request_id"] == 7
+    assert message["model_version"] == "v1"
+    np.testing.assert_array_equal(message["predictions"], expected_classes)
+    np.testing.assert_allclose(message["class_probabilities"], expected_probas)
+    assert server.results == [(25, "success")]
+
+
+def test_unary_errors_map_to_status_codes(server):
+    X = _rows(3)
+    with grpc.insecure_channel(server.address) as channel:
+        predict = channel.unary_unary(PREDICT_METHOD)
+        with pytest.raises(grpc.RpcError) as unknown_version:
+            predict(encode_predict_request(X, COLUMNS, model_version="v9"))
+        with pytest.raises(grpc.RpcError) as missing_column:
+            predict(encode_predict_request(X[:, :3], COLUMNS[:3]))
+
+    assert unknown_version.value.code() == grpc.StatusCode.NOT_FOUND
+    assert missing_column.value.code() == grpc.StatusCode.INVALID_ARGUMENT
+
+
+def test_stream_answers_every_request_and_survives_bad_ones(server):
+    batches = {i: _rows(10 + i, seed=i) for i in range(1, 7)}
+    requests = [encode_predict_request(X, COLUMNS, request_id=i) for i, X in batches.items()]
+    requests.insert(3, encode_predict_request(_rows(2)[:, :3], COLUMNS[:3], request_id=99))
+
+    with grpc.insecure_channel(server.address) as channel:
+        responses = [decode_predict_response(body) for body in channel.stream_stream(PREDICT_STREAM_METHOD)(iter(requests))]
+
+    by_id = {message["request_id"]: message for message in responses}
+    assert sorted(by_id) == [1, 2, 3, 4, 5, 6, 99]
+    assert by_id[99]["code"] == "INVALID_ARGUMENT"
+    for i, X in batches.items():
+        np.testing.assert_array_equal(by_id[i]["predictions"], server.registry.current.adapter.predict(X)[0])
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_grpc_dofn_emits_prediction_rows(server, streaming):
+    from dataflow.iris_inference_pipeline import BatchCallGrpcService
+
+    dofn = BatchCallGrpcService(server.address, streaming=streaming)
+    dofn.setup()
+    try:
+        outputs = []
+        for seed in (1, 2, 3):
+            X = _rows(5, seed=seed)
+            batch = [dict(zip(COLUMNS, map(float, row)), entity_id=f"e{seed}_{i}") for i, row in enumerate(X)]
+            outputs.append((X, list(dofn.process(batch))))
+        stream = dofn._stream
+    finally:
+        dofn.teardown()
+
+    assert (stream is not None) == streaming
+    for X, rows in outputs:
+        expected = server.registry.current.adapter.predict(X)[0]
+        assert [row["prediction"] for row in rows] == [str(cls) for cls in expected]
+        assert all(row["model_service"] == f"grpc://{server.address}" for row in rows)
+
+
+def test_grpc_dofn_dead_letters_after_retries(tmp_path):
+    from dataflow.iris_inference_pipeline import BatchCallGrpcService
+    from dataflow.utils.dead_letter import DEAD_LETTER_TAG
+
+    dofn = BatchCallGrpcService(f"unix://{tmp_path / 'nobody.sock'}", streaming=True)
+    dofn.RETRY_BACKOFF_BASE = 0
+    dofn.setup()
+    try:
+        outputs = list(dofn.process([dict(zip(COLUMNS, [5.0, 3.0, 1.5, 0.2]), entity_id="e1")]))
+    finally:
+        dofn.teardown()
+
+    assert [output.tag for output in outputs] == [DEAD_LETTER_TAG]
+    assert outputs[0].value["entity_id"] == "e1"
+    assert outputs[0].value["retry_count"] == dofn.MAX_RETRIES
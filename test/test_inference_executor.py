@@ -0,0 +1,68 @@
+"""Tests that every INFERENCE_EXECUTOR mode returns the same predictions."""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.datasets import load_iris
+from sklearn.ensemble import RandomForestClassifier
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp"))
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp/iris_xgboost/pipelines/components/fastapi"))
+
+from executor import EXECUTOR_MODES, InferenceExecutor, cpu_limit  # noqa: E402
+from model_adapter import load_adapter  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    X, y = load_iris(return_X_y=True)
+    path = tmp_path_factory.mktemp("model") / "model.joblib"
+    joblib.dump(RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y), path)
+    return str(path)
+
+
+@pytest.mark.parametrize("mode", EXECUTOR_MODES)
+def test_modes_match_direct_prediction(model_path, mode):
+    adapter = load_adapter(model_path)
+    X = load_iris().data.astype(np.float32)
+    expected_classes, expected_proba = adapter.predict(X)
+
+    executor = InferenceExecutor(mode, workers=2)
+    executor.start(model_path)
+    try:
+        classes, proba = asyncio.run(executor.run(adapter, X))
+    finally:
+        executor.shutdown()
+
+    np.testing.assert_array_equal(classes, expected_classes)
+    np.testing.assert_array_equal(proba, expected_proba)
+
+
+def test_unknown_mode_rejected():
+    with pytest.raises(ValueError):
+        InferenceExecutor("gpu")
+
+
+def test_cpu_limit_is_positive():
+    assert cpu_limit() >= 1
+
+
+def test_warm_all_loads_a_new_version_in_every_process_worker(model_path, tmp_path):
+    X, y = load_iris(return_X_y=True)
+    new_path = str(tmp_path / "model.joblib")
+    joblib.dump(RandomForestClassifier(n_estimators=5, random_state=1).fit(X, y), new_path)
+    adapter = load_adapter(new_path)
+
+    executor = InferenceExecutor("process", workers=3)
+    executor.start(model_path)
+    try:
+        pids = asyncio.run(executor.warm_all(adapter, X[:4].astype(np.float32)))
+    finally:
+        executor.shutdown()
+
+    assert len(set(pids)) == 3
@@ -0,0 +1,80 @@
+"""Tests for scoring inside the Dataflow workers with --inference_mode=local."""
+
+import os
+import sys
+from pathlib import Path
+
+import apache_beam as beam
+import joblib
+import numpy as np
+from apache_beam.testing.util import assert_that, equal_to
+from sklearn.tree import DecisionTreeClassifier
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataflow.iris_inference_pipeline import (  # noqa: E402
+    FEATURE_COLUMNS,
+    PREDICTION_SCHEMA,
+    PredictWithLocalModel,
+)
+from dataflow.utils.dead_letter import DEAD_LETTER_TAG  # noqa: E402
+
+
+def _elements(n, seed=0):
+    rows = np.round(np.random.default_rng(seed).uniform(0, 8, size=(n, len(FEATURE_COLUMNS))), 1)
+    return [{"entity_id": f"{i}_streaming", **dict(zip(FEATURE_COLUMNS, map(float, row)))} for i, row in enumerate(rows)]
+
+
+def _save_model(path, labels_from_column):
+    X = np.array([[e[col] for col in FEATURE_COLUMNS] for e in _elements(200, seed=1)], dtype=np.float32)
+    y = (X[:, labels_from_column] > 4).astype(int)
+    joblib.dump(DecisionTreeClassifier(random_state=0).fit(X, y), path)
+    return X
+
+
+def test_rows_match_the_model_and_the_prediction_schema(tmp_path):
+    model_path = str(tmp_path / "model.joblib")
+    _save_model(model_path, labels_from_column=0)
+    model = joblib.load(model_path)
+    elements = _elements(30)
+    X = np.array([[e[col] for col in FEATURE_COLUMNS] for e in elements], dtype=np.float32)
+    expected = [(e["entity_id"], str(cls)) for e, cls in zip(elements, model.predict(X))]
+    fields = {f["name"] for f in PREDICTION_SCHEMA["fields"]} - {"dataflow_processing_time"}
+
+    with beam.Pipeline() as pipeline:
+        results = (
+            pipeline
+            | beam.Create([elements[:10], elements[10:]], reshuffle=False)
+            | beam.ParDo(PredictWithLocalModel(model_path)).with_outputs(DEAD_LETTER_TAG, main="predictions")
+        )
+        assert_that(results.predictions | beam.Map(lambda row: (row["entity_id"], row["prediction"])), equal_to(expected))
+        assert_that(
+            results.predictions | beam.Map(lambda row: (set(row) == fields, len(row["class_probabilities"]))),
+            equal_to([(True, 2)] * len(elements)),
+            label="CheckSchema",
+        )
+        assert_that(results[DEAD_LETTER_TAG], equal_to([]), label="CheckNoDeadLetters")
+
+
+def test_instances_share_the_model_and_pick_up_a_new_one(tmp_path):
+    model_path = str(tmp_path / "model.joblib")
+    _save_model(model_path, labels_from_column=0)
+    first, second = PredictWithLocalModel(model_path, refresh_interval_secs=1e-9), PredictWithLocalModel(model_path)
+    # Pickled copies of one DoFn share its Shared handle, as instances on a worker do
+    second._shared_model = first._shared_model
+    first.setup()
+    second.setup()
+    assert first._model is second._model
+
+    # The first model labels by column 0 and the second by column 1; a and b differ in column 1 only
+    elements = [
+        {"entity_id": "a", **dict(zip(FEATURE_COLUMNS, [1.0, 1.0, 1.0, 1.0]))},
+        {"entity_id": "b", **dict(zip(FEATURE_COLUMNS, [1.0, 7.0, 1.0, 1.0]))},
+    ]
+    assert [row["prediction"] for row in first.process(elements)] == ["0", "0"]
+
+    _save_model(model_path, labels_from_column=1)
+    stat = os.stat(model_path)
+    os.utime(model_path, (stat.st_atime, stat.st_mtime + 10))
+    assert [row["prediction"] for row in first.process(elements)] == ["0", "1"]
+    assert first._model is not second._model
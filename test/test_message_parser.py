@@ -0,0 +1,100 @@
+"""Tests for batch parsing of Pub/Sub messages in both pipelines."""
+
+import json
+import sys
+from pathlib import Path
+
+import apache_beam as beam
+from apache_beam.testing.util import assert_that, equal_to
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataflow import iris_feature_pipeline, iris_inference_pipeline  # noqa: E402
+from dataflow.models.iris_schema import PubSubIrisMessage  # noqa: E402
+from dataflow.utils.dead_letter import DEAD_LETTER_TAG  # noqa: E402
+from dataflow.utils.message_parser import JSON_DECODE, VALIDATION, BatchMessageParser, ParseError  # noqa: E402
+
+
+def _message(i, **fields):
+    return json.dumps({
+        "sepal_length": 5.1, "sepal_width": 3.5, "petal_length": 1.4, "petal_width": 0.2 + i, "sample_id": i,
+        **fields,
+    }).encode()
+
+
+def test_batch_parse_keeps_each_failure_at_its_own_index():
+    payloads = [
+        _message(0, unrelated="dropped"),
+        b"not json",
+        _message(2, sepal_length="wide"),
+        b"[1, 2]",
+        json.dumps({"sepal_length": 5.1, "sepal_width": 3.5, "petal_length": "1.4", "petal_width": 0.2}).encode(),
+        _message(5, petal_width=None),
+        b'{"sepal_length": NaN}',
+    ]
+    parsed = BatchMessageParser(PubSubIrisMessage).parse(payloads)
+
+    assert parsed[0] == {
+        "sepal_length": 5.1, "sepal_width": 3.5, "petal_length": 1.4, "petal_width": 0.2, "sample_id": 0,
+        "timestamp": None,
+    }
+    # Lax coercion and defaults, as the Pydantic model applied
+    assert parsed[4] == {
+        "sepal_length": 5.1, "sepal_width": 3.5, "petal_length": 1.4, "petal_width": 0.2, "timestamp": None,
+        "sample_id": None,
+    }
+    assert [p.error_type if isinstance(p, ParseError) else None for p in parsed] == [
+        None, JSON_DECODE, VALIDATION, JSON_DECODE, None, VALIDATION, JSON_DECODE,
+    ]
+    # Each validation failure carries the message's own errors, not the batch's
+    assert [error["loc"] for error in parsed[2].error.errors()] == [("sepal_length",)]
+    assert [error["loc"] for error in parsed[5].error.errors()] == [("petal_width",)]
+
+    # Without a record type any JSON object is a record, passed through as decoded
+    assert BatchMessageParser().parse([b'{"entity_id": "a"}', b"[]"])[0] == {"entity_id": "a"}
+
+
+def test_feature_pipeline_parses_in_batches_with_the_same_dead_letters():
+    payloads = [_message(i) for i in range(7)] + [b"{oops", _message(8, petal_width="x")]
+    with beam.Pipeline() as pipeline:
+        results = (
+            pipeline
+            | beam.Create(payloads)
+            | beam.ParDo(iris_feature_pipeline.ParsePubSubMessage(batch_size=3)).with_outputs(
+                DEAD_LETTER_TAG, main="parsed",
+            )
+        )
+        assert_that(results.parsed | beam.Map(lambda m: m["sample_id"]), equal_to(list(range(7))), label="parsed")
+        assert_that(
+            results[DEAD_LETTER_TAG] | beam.Map(lambda dl: (dl["error_type"], dl["original_message"])),
+            equal_to([("json_decode", "{oops"), ("validation", payloads[8].decode())]),
+            label="dead letters",
+        )
+
+
+def test_inference_pipeline_parses_in_batches_with_the_same_dead_letters():
+    payloads = [
+        b'{"entity_id": "abc", "timestamp": "t"}',
+        b'{"sample_id": 7}',
+        b'{"timestamp": "t"}',
+        b"\xff",
+        b'"abc"',
+    ]
+    with beam.Pipeline() as pipeline:
+        results = (
+            pipeline
+            | beam.Create(payloads)
+            | beam.ParDo(iris_inference_pipeline.ParsePubSubMessage(batch_size=2)).with_outputs(
+                DEAD_LETTER_TAG, main="parsed",
+            )
+        )
+        assert_that(
+            results.parsed,
+            equal_to([{"entity_id": "abc", "timestamp": "t"}, {"entity_id": "7_streaming", "timestamp": None}]),
+            label="parsed",
+        )
+        assert_that(
+            results[DEAD_LETTER_TAG] | beam.Map(lambda dl: dl["error_type"]),
+            equal_to(["missing_field", "json_decode", "json_decode"]),
+            label="dead letters",
+        )
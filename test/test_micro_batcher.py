@@ -0,0 +1,116 @@
+"""Tests for the FastAPI server's in-process micro-batcher."""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src/ml_pipelines_kfp/iris_xgboost/pipelines/components/fastapi"))
+
+from batcher import MicroBatcher  # noqa: E402
+
+
+class RecordingModel:
+    """Echo model: class is the first feature, records every merged batch size."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, X):
+        self.calls.append(len(X))
+        return X[:, 0].astype(int), np.repeat(X[:, :1], 3, axis=1)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_requests_share_one_model_call():
+    model = RecordingModel()
+
+    async def scenario():
+        batcher = MicroBatcher(model, max_batch_size=100, max_wait_ms=50)
+        batcher.start()
+        inputs = [np.full((n, 4), i, dtype=np.float32) for i, n in enumerate([1, 3, 2])]
+        results = await asyncio.gather(*(batcher.submit(x) for x in inputs))
+        await batcher.stop()
+        return inputs, results
+
+    inputs, results = _run(scenario())
+
+    assert model.calls == [6]
+    for x, (predictions, probabilities) in zip(inputs, results):
+        assert len(predictions) == len(x)
+        assert (predictions == x[:, 0]).all()
+        assert probabilities.shape == (len(x), 3)
+
+
+def test_batches_are_capped_without_splitting_requests():
+    model = RecordingModel()
+    flushes = []
+
+    async def scenario():
+        batcher = MicroBatcher(
+            model, max_batch_size=4, max_wait_ms=50,
+            on_flush=lambda rows, depth, waits: flushes.append((rows, depth, len(waits))),
+        )
+        batcher.start()
+        inputs = [np.zeros((3, 4), dtype=np.float32) for _ in range(3)]
+        await asyncio.gather(*(batcher.submit(x) for x in inputs))
+        await batcher.stop()
+
+    _run(scenario())
+
+    assert model.calls == [3, 3, 3]
+    assert [rows for rows, _, _ in flushes] == [3, 3, 3]
+    assert flushes[0][1] == 3
+
+
+def test_requests_for_different_models_are_not_merged():
+    calls = []
+
+    async def versioned(X, version):
+        calls.append((version, len(X)))
+        return np.full(len(X), version), np.zeros((len(X), 3))
+
+    async def scenario():
+        batcher = MicroBatcher(versioned, max_batch_size=100, max_wait_ms=50)
+        batcher.start()
+        results = await asyncio.gather(
+            batcher.submit(np.zeros((1, 4)), 1),
+            batcher.submit(np.zeros((2, 4)), 1),
+            batcher.submit(np.zeros((3, 4)), 2),
+        )
+        await batcher.stop()
+        return results
+
+    results = _run(scenario())
+
+    assert calls == [(1, 3), (2, 3)]
+    assert [list(predictions) for predictions, _ in results] == [[1], [1, 1], [2, 2, 2]]
+
+
+def test_model_errors_reach_every_caller():
+    async def failing(X):
+        raise RuntimeError("boom")
+
+    async def scenario():
+        batcher = MicroBatcher(failing, max_batch_size=10, max_wait_ms=10)
+        batcher.start()
+        results = await asyncio.gather(
+            batcher.submit(np.zeros((1, 4))), batcher.submit(np.zeros((2, 4))),
+            return_exceptions=True,
+        )
+        await batcher.stop()
+        return results
+
+    results = _run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_submit_requires_start():
+    batcher = MicroBatcher(RecordingModel())
+    with pytest.raises(RuntimeError):
+        _run(batcher.submit(np.zeros((1, 4))))
@@ -0,0 +1,187 @@
+"""DirectRunner tests for timer-based retries of entities missing from the online store."""
+
+import sys
+import time
+from pathlib import Path
+
+import apache_beam as beam
+import pytest
+from apache_beam.options.pipeline_options import PipelineOptions, StandardOptions
+from apache_beam.testing import test_stream
+from apache_beam.testing.util import assert_that, equal_to
+from apache_beam.utils.timestamp import Timestamp
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataflow.testing.fake_online_store import FakeOnlineStore, online_store_client  # noqa: E402
+from dataflow.utils.dead_letter import DEAD_LETTER_TAG  # noqa: E402
+from dataflow.utils.online_store_reader import (  # noqa: E402
+    MISSING_FEATURES_TAG,
+    FetchFeaturesFromOnlineStore,
+    RetryMissingFeatures,
+)
+
+COLUMNS = ["sepal_length_cm", "sepal_width_cm", "petal_length_cm", "petal_width_cm"]
+BACKOFF_SECS = 1.0
+
+# Wall-clock duration of each FetchFeatures process() call (the DirectRunner runs in-process)
+PROCESS_SECS = []
+
+
+class FakeStoreFetch(FetchFeaturesFromOnlineStore):
+    def __init__(self, target, **kwargs):
+        super().__init__("project", "region", "store", "view", COLUMNS, **kwargs)
+        self.target = target
+
+    def _create_client(self):
+        return online_store_client(self.target)
+
+    def process(self, batch):
+        start = time.perf_counter()
+        yield from super().process(batch)
+        PROCESS_SECS.append(time.perf_counter() - start)
+
+
+class FakeStoreRetry(RetryMissingFeatures):
+    def __init__(self, target, **kwargs):
+        super().__init__("project", "region", "store", "view", COLUMNS, **kwargs)
+        self.target = target
+
+    def _create_client(self):
+        return online_store_client(self.target)
+
+
+class _Bag:
+    def __init__(self):
+        self.values = []
+
+    def read(self):
+        return iter(self.values)
+
+    def add(self, value):
+        self.values.append(value)
+
+    def clear(self):
+        self.values = []
+
+
+class _Timer:
+    def __init__(self):
+        self.at = None
+
+    def set(self, timestamp):
+        self.at = timestamp
+
+
+def _features(i):
+    return {col: float(i + j) for j, col in enumerate(COLUMNS)}
+
+
+@pytest.mark.parametrize("retries", [1, 5])
+def test_missing_features_are_retried_on_timers_without_holding_the_bundle(retries):
+    # "late" is written by the feature pipeline after two empty reads; "never" never is
+    store = FakeOnlineStore(
+        {**{f"e{i}": _features(i) for i in range(5)}, "late": _features(9)},
+        available_after={"late": 2},
+    )
+    # Horizon admitting exactly `retries` re-fetches: 1 + 2 + ... + 2^(retries - 1) backoffs
+    horizon = BACKOFF_SECS * (2 ** retries - 1)
+    batch = [{"entity_id": e} for e in ["e0", "e1", "late", "e2", "never", "e3", "e4"]]
+
+    events = test_stream.TestStream().add_elements([batch])
+    for _ in range(retries + 1):
+        # Each processing-time advance fires one round of retry timers
+        events = events.advance_processing_time(1e10)
+    events = events.advance_watermark_to_infinity()
+
+    options = PipelineOptions()
+    options.view_as(StandardOptions).streaming = True
+    PROCESS_SECS.clear()
+    with store, beam.Pipeline(options=options) as pipeline:
+        fetched = (
+            pipeline
+            | events
+            | "Fetch" >> beam.ParDo(FakeStoreFetch(store.target, defer_missing=True, initial_backoff_secs=BACKOFF_SECS))
+            .with_outputs(DEAD_LETTER_TAG, MISSING_FEATURES_TAG, main="fetched")
+        )
+        retried = (
+            fetched[MISSING_FEATURES_TAG]
+            | beam.Map(lambda e: (e["entity_id"], e))
+            | "Retry" >> beam.ParDo(FakeStoreRetry(
+                store.target, retry_horizon_secs=horizon, initial_backoff_secs=BACKOFF_SECS,
+            )).with_outputs(DEAD_LETTER_TAG, main="fetched")
+        )
+
+        recovered = ["late"] if retries >= 2 else []
+        assert_that(
+            (fetched.fetched, retried.fetched) | beam.Flatten() | beam.Map(lambda e: e["entity_id"]),
+            equal_to([f"e{i}" for i in range(5)] + recovered),
+        )
+        expired = [("never", "missing_features", retries)] + ([] if recovered else [("late", "missing_features", retries)])
+        assert_that(
+            retried[DEAD_LETTER_TAG] | beam.Map(lambda d: (d["entity_id"], d["error_type"], d["retry_count"])),
+            equal_to(expired),
+            label="CheckDeadLetters",
+        )
+        assert_that(fetched[DEAD_LETTER_TAG], equal_to([]), label="CheckNoFetchDeadLetters")
+
+    # The fetch bundle never waits out a backoff, however many retries follow
+    assert PROCESS_SECS and max(PROCESS_SECS) < BACKOFF_SECS
+
+
+def test_elements_sharing_a_key_keep_their_own_retry_schedules(monkeypatch):
+    clock = [Timestamp(1000)]
+    monkeypatch.setattr(Timestamp, "now", staticmethod(lambda: clock[0]))
+    available, fetches = [False], []
+
+    def request(entity_id):
+        fetches.append((clock[0], entity_id))
+        return _features(0) if available[0] else {}
+
+    dofn = RetryMissingFeatures("project", "region", "store", "view", COLUMNS, retry_horizon_secs=10.0)
+    dofn._request = request
+    pending, timer = _Bag(), _Timer()
+
+    def add(element, at):
+        clock[0] = Timestamp(at)
+        list(dofn.process(("a", element), pending=pending, retry_timer=timer))
+
+    def fire():
+        clock[0] = timer.at
+        return [element["sample_id"] for element in dofn.retry(fired_at=timer.at, pending=pending, retry_timer=timer)]
+
+    add({"entity_id": "a", "sample_id": 0}, 1000)
+    add({"entity_id": "a", "sample_id": 1}, 1000)
+    # A duplicate joining later does not pull the others' retries forward
+    add({"entity_id": "a", "sample_id": 2}, 1000.25)
+    assert timer.at == Timestamp(1000.5)
+
+    # Both due elements, one fetch
+    assert fire() == [] and fetches == [(Timestamp(1000.5), "a")]
+    assert timer.at == Timestamp(1000.75)
+    assert fire() == [] and len(fetches) == 2
+    assert timer.at == Timestamp(1001.5)
+
+    available[0] = True
+    assert fire() == [0, 1] and len(fetches) == 3
+    # Still on its own backoff, not re-fetched with the others
+    assert [element["sample_id"] for element, *_ in pending.values] == [2]
+    assert timer.at == Timestamp(1001.75)
+    assert fire() == [2] and len(fetches) == 4
+    assert pending.values == []
+
+
+def test_the_horizon_counts_the_time_since_first_deferred(monkeypatch):
+    monkeypatch.setattr(Timestamp, "now", staticmethod(lambda: Timestamp(1002.5)))
+    dofn = RetryMissingFeatures(
+        "project", "region", "store", "view", COLUMNS, retry_horizon_secs=3.0, initial_backoff_secs=1.0,
+    )
+    dofn._request = lambda entity_id: {}
+    pending, timer = _Bag(), _Timer()
+    pending.add(({"entity_id": "a"}, 0, Timestamp(1000), Timestamp(1001)))
+
+    # Fired late: 2.5s have passed, and the next 2s backoff would end past the horizon
+    (dead_letter,) = dofn.retry(fired_at=Timestamp(1001), pending=pending, retry_timer=timer)
+    assert dead_letter.tag == DEAD_LETTER_TAG
+    assert (dead_letter.value["error_type"], dead_letter.value["retry_count"]) == ("missing_features", 1)
+    assert pending.values == []
@@ -0,0 +1,98 @@
+"""Parity tests: ModelAdapter's single pass matches predict() + predict_proba().
+
+Trains the Decision Tree and Random Forest exactly as the KFP components in
+components/models.py do, on the bundled iris CSV.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.svm import SVC, LinearSVC
+from sklearn.tree import DecisionTreeClassifier
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp"))
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp/iris_xgboost/pipelines/components/fastapi"))
+
+from model_adapter import PREDICT_ONLY, PROBA_ARGMAX, SEPARATE_CALLS, ModelAdapter  # noqa: E402
+
+FEATURES = ["sepal_length_cm", "sepal_width_cm", "petal_length_cm", "petal_width_cm"]
+
+
+@pytest.fixture(scope="module")
+def iris_split():
+    df = pd.read_csv(REPO_ROOT / "src/ml_pipelines_kfp/iris_xgboost/data/iris.csv")
+    df.columns = FEATURES + ["species"]
+    df["species"] = df["species"].replace({"Versicolor": 0, "Virginica": 1, "Setosa": 2}).astype(int)
+    return train_test_split(df.drop("species", axis=1), df["species"], test_size=0.2, random_state=42)
+
+
+def _score_rows(X_test):
+    rng = np.random.default_rng(0)
+    random_rows = np.round(rng.uniform([4.0, 2.0, 1.0, 0.1], [8.0, 4.5, 7.0, 2.5], size=(500, 4)), 1)
+    return [X_test.to_numpy(dtype=np.float32), random_rows.astype(np.float32)]
+
+
+@pytest.mark.parametrize("estimator_cls", [DecisionTreeClassifier, RandomForestClassifier])
+def test_single_pass_matches_separate_calls(iris_split, estimator_cls):
+    X_train, X_test, y_train, _ = iris_split
+    model = estimator_cls()
+    model.fit(X_train, y_train)
+
+    adapter = ModelAdapter(model)
+    assert adapter.mode == PROBA_ARGMAX
+
+    for X in _score_rows(X_test):
+        predictions, probabilities = adapter.predict(X)
+        np.testing.assert_array_equal(predictions, model.predict(X))
+        np.testing.assert_array_equal(probabilities, model.predict_proba(X))
+
+
+def test_string_labels_map_through_classes(iris_split):
+    X_train, X_test, y_train, _ = iris_split
+    model = RandomForestClassifier(n_estimators=10, random_state=0)
+    model.fit(X_train, y_train.map({0: "versicolor", 1: "virginica", 2: "setosa"}))
+
+    predictions, _ = ModelAdapter(model).predict(X_test.to_numpy())
+    np.testing.assert_array_equal(predictions, model.predict(X_test.to_numpy()))
+
+
+def test_estimators_without_predict_proba_fall_back(iris_split):
+    X_train, X_test, y_train, _ = iris_split
+    model = LinearSVC().fit(X_train, y_train)
+
+    adapter = ModelAdapter(model)
+    predictions, probabilities = adapter.predict(X_test.to_numpy())
+
+    assert adapter.mode == PREDICT_ONLY
+    np.testing.assert_array_equal(predictions, model.predict(X_test.to_numpy()))
+    assert probabilities.shape == (len(X_test), 0)
+
+
+def test_non_tree_classifier_parity(iris_split):
+    X_train, X_test, y_train, _ = iris_split
+    model = LogisticRegression(max_iter=500).fit(X_train, y_train)
+
+    predictions, _ = ModelAdapter(model).predict(X_test.to_numpy())
+    np.testing.assert_array_equal(predictions, model.predict(X_test.to_numpy()))
+
+
+def test_platt_scaled_svc_keeps_its_own_predict(iris_split):
+    X_train, X_test, y_train, _ = iris_split
+    model = SVC(probability=True, random_state=0).fit(X_train, y_train)
+
+    adapter = ModelAdapter(model)
+    assert adapter.mode == SEPARATE_CALLS
+    # A single pass would change the served labels
+    random_rows = _score_rows(X_test)[1]
+    assert (model.classes_[model.predict_proba(random_rows).argmax(axis=1)] != model.predict(random_rows)).any()
+    for X in _score_rows(X_test):
+        predictions, probabilities = adapter.predict(X)
+        np.testing.assert_array_equal(predictions, model.predict(X))
+        np.testing.assert_array_equal(probabilities, model.predict_proba(X))
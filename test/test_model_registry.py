@@ -0,0 +1,97 @@
+"""Tests for hot reload through the FastAPI server's model registry."""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.datasets import load_iris
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp"))
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp/iris_xgboost/pipelines/components/fastapi"))
+
+from model_adapter import load_adapter  # noqa: E402
+from model_registry import LocalDirectorySource, ModelRegistry  # noqa: E402
+
+
+def _publish(root, version, estimator, mtime):
+    X, y = load_iris(return_X_y=True)
+    path = root / version / "model.joblib"
+    path.parent.mkdir(parents=True)
+    joblib.dump(estimator.fit(X, y), path)
+    os.utime(path, (mtime, mtime))
+
+
+def _registry(root, **kwargs):
+    return ModelRegistry(LocalDirectorySource(str(root), ["model.joblib"]), loader=load_adapter, **kwargs)
+
+
+def test_new_version_is_loaded_and_old_one_stays_pinnable(tmp_path):
+    _publish(tmp_path, "v1", DecisionTreeClassifier(random_state=0), mtime=1_000)
+    registry = _registry(tmp_path)
+
+    async def scenario():
+        first = await registry.refresh()
+        unchanged = await registry.refresh()
+        _publish(tmp_path, "v2", RandomForestClassifier(n_estimators=5, random_state=0), mtime=2_000)
+        second = await registry.refresh()
+        return first, unchanged, second
+
+    first, unchanged, second = asyncio.run(scenario())
+
+    assert unchanged is None
+    assert registry.get() is second and second.version == "v2"
+    assert registry.get("v1") is first
+    assert isinstance(first.adapter.estimator, DecisionTreeClassifier)
+    assert [v["version"] for v in registry.list_versions()] == ["v2", "v1"]
+    with pytest.raises(KeyError):
+        registry.get("v0")
+
+
+def test_versions_beyond_max_are_unloaded(tmp_path):
+    registry = _registry(tmp_path, max_versions=2)
+
+    async def scenario():
+        for i in range(3):
+            _publish(tmp_path, f"v{i}", DecisionTreeClassifier(random_state=i), mtime=1_000 + i)
+            await registry.refresh()
+
+    asyncio.run(scenario())
+
+    assert [v["version"] for v in registry.list_versions()] == ["v2", "v1"]
+    with pytest.raises(KeyError):
+        registry.get("v0")
+
+
+def test_version_is_published_only_after_warmup(tmp_path):
+    _publish(tmp_path, "v1", DecisionTreeClassifier(random_state=0), mtime=1_000)
+    seen_during_warmup = []
+
+    async def warmup(entry):
+        seen_during_warmup.append(registry.current)
+        entry.adapter.predict(np.ones((8, 4), dtype=np.float32))
+
+    registry = _registry(tmp_path, warmup=warmup)
+
+    async def scenario():
+        await registry.refresh()
+        _publish(tmp_path, "v2", DecisionTreeClassifier(random_state=1), mtime=2_000)
+        await registry.refresh()
+
+    asyncio.run(scenario())
+
+    assert seen_during_warmup[0] is None
+    assert seen_during_warmup[1].version == "v1"
+    assert registry.current.version == "v2"
+    assert registry.current.load_timings["warmup"] >= 0
+
+
+def test_missing_artifact_fails_first_load(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(_registry(tmp_path / "empty").refresh())
@@ -0,0 +1,120 @@
+"""Tests for serial and concurrent feature fetches against a fake online store."""
+
+import copy
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataflow.testing.fake_online_store import FakeOnlineStore  # noqa: E402
+from dataflow.utils.dead_letter import DEAD_LETTER_TAG  # noqa: E402
+from dataflow.utils.feature_cache import EXPIRED, HIT, MISS, NEGATIVE_HIT, FeatureCache  # noqa: E402
+from dataflow.utils.online_store_reader import FetchFeaturesFromOnlineStore  # noqa: E402
+
+COLUMNS = ["sepal_length_cm", "sepal_width_cm", "petal_length_cm", "petal_width_cm"]
+
+
+class FakeStoreFetch(FetchFeaturesFromOnlineStore):
+    def __init__(self, store, **kwargs):
+        super().__init__("project", "region", "store", "view", COLUMNS, **kwargs)
+        self.store = store
+
+    def _create_client(self):
+        return self.store.client()
+
+
+def _features(i):
+    return {col: float(i + j) for j, col in enumerate(COLUMNS)}
+
+
+def _run(dofn, batch):
+    dofn.setup()
+    try:
+        return list(dofn.process([dict(e) for e in batch]))
+    finally:
+        dofn.teardown()
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 8])
+def test_fetched_elements_and_dead_letters(max_concurrency):
+    store = FakeOnlineStore({f"e{i}": _features(i) for i in range(10)})
+    batch = [{"entity_id": f"e{i}"} for i in range(12)]
+
+    with store:
+        outputs = _run(FakeStoreFetch(store, max_concurrency=max_concurrency, initial_backoff_secs=0.01), batch)
+
+    fetched = {o["entity_id"]: o for o in outputs if isinstance(o, dict)}
+    dead = [o for o in outputs if not isinstance(o, dict)]
+    assert sorted(fetched) == sorted(f"e{i}" for i in range(10))
+    assert fetched["e3"]["petal_length_cm"] == 5.0
+    assert {d.tag for d in dead} == {DEAD_LETTER_TAG}
+    assert sorted(d.value["entity_id"] for d in dead) == ["e10", "e11"]
+    assert all(d.value["error_type"] == "missing_features" and d.value["retry_count"] == 1 for d in dead)
+    # One initial attempt per entity plus one retry for each missing one
+    assert store.requests == 14
+
+
+def test_concurrent_retries_do_not_block_other_entities():
+    store = FakeOnlineStore({f"e{i}": _features(i) for i in range(7)}, latency_secs=0.05)
+    batch = [{"entity_id": f"e{i}"} for i in range(8)]
+
+    with store:
+        start = time.monotonic()
+        outputs = _run(FakeStoreFetch(store, max_concurrency=8, max_retries=2, initial_backoff_secs=0.2), batch)
+        elapsed = time.monotonic() - start
+
+    # Found entities settle after one round trip, before the missing one's backoff ends
+    assert sorted(o["entity_id"] for o in outputs[:7]) == [f"e{i}" for i in range(7)]
+    assert outputs[7].value["retry_count"] == 2
+    # 3 round trips plus 0.2s + 0.4s of backoff, not 8 serial round trips
+    assert elapsed < 0.05 * 3 + 0.6 + 0.3
+
+
+def test_concurrent_fetch_retries_injected_failures():
+    store = FakeOnlineStore({f"e{i}": _features(i) for i in range(40)}, failure_rate=0.3, seed=1)
+    batch = [{"entity_id": f"e{i}"} for i in range(40)]
+
+    with store:
+        outputs = _run(FakeStoreFetch(store, max_concurrency=8, max_retries=5, initial_backoff_secs=0.001), batch)
+
+    assert sorted(o["entity_id"] for o in outputs) == sorted(e["entity_id"] for e in batch)
+    assert store.requests > 40
+
+
+def test_feature_cache_is_shared_across_instances_and_caches_misses_briefly():
+    store = FakeOnlineStore({f"e{i}": _features(i) for i in range(5)})
+    batch = [{"entity_id": f"e{i}"} for i in range(6)]
+    dofn = FakeStoreFetch(store, max_retries=0, cache_max_entries=100, cache_negative_ttl_secs=0.2)
+
+    with store:
+        first = _run(copy.copy(dofn), batch)
+        second = _run(copy.copy(dofn), batch)
+        assert store.requests == 6
+        time.sleep(0.25)
+        third = _run(copy.copy(dofn), batch)
+
+    assert [o["entity_id"] for o in second if isinstance(o, dict)] == [f"e{i}" for i in range(5)]
+    assert second[-1].value["error_type"] == "missing_features"
+    assert len(first) == len(second) == len(third) == 6
+    # Only the negative entry expired
+    assert store.requests == 7
+
+
+def test_feature_cache_ttl_and_capacity():
+    clock = [0.0]
+    cache = FeatureCache(max_entries=2, ttl_secs=10, negative_ttl_secs=1, clock=lambda: clock[0])
+
+    assert cache.store("a", {"x": 1.0}) == 0
+    assert cache.store_missing("b") == 0
+    assert cache.lookup("a") == (HIT, {"x": 1.0})
+    assert cache.store("c", {"x": 3.0}) == 1
+    assert cache.lookup("b") == (MISS, None)
+
+    cache.store_missing("d")
+    assert cache.lookup("d") == (NEGATIVE_HIT, None)
+    clock[0] = 2
+    assert cache.lookup("d") == (EXPIRED, None)
+    assert cache.lookup("c") == (HIT, {"x": 3.0})
@@ -0,0 +1,154 @@
+"""Tests for WriteToOnlineStore's direct-write stream against a fake online store."""
+
+import functools
+import sys
+import threading
+from pathlib import Path
+
+import apache_beam as beam
+from apache_beam.metrics.metric import MetricsFilter
+from apache_beam.testing.util import assert_that, equal_to
+from apache_beam.transforms.window import GlobalWindow
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataflow.testing.fake_online_store import FakeOnlineStore, direct_write_client  # noqa: E402
+from dataflow.utils.dead_letter import DEAD_LETTER_TAG  # noqa: E402
+from dataflow.utils.online_store_writer import DirectWriteStream, WriteToOnlineStore, _BatchWrite  # noqa: E402
+
+FEATURE_COLUMNS = ["sepal_length_cm", "petal_length_cm"]
+
+
+def _writer(target, **kwargs):
+    return WriteToOnlineStore(
+        "project", "us-central1", "store", "iris_features", FEATURE_COLUMNS,
+        client_factory=functools.partial(direct_write_client, target), **kwargs,
+    )
+
+
+def _batches(n_batches, batch_size):
+    return [
+        [{"entity_id": f"b{b}e{i}", "sepal_length_cm": float(i), "petal_length_cm": 1.5} for i in range(batch_size)]
+        for b in range(n_batches)
+    ]
+
+
+def test_rows_are_written_over_one_stream_and_refused_rows_dead_lettered():
+    batches = _batches(6, 5)
+    refused = {"b1e2", "b4e0", "b4e4"}
+    with FakeOnlineStore(write_latency_secs=0.05, refused_keys=refused) as store:
+        with beam.Pipeline() as pipeline:
+            results = (
+                pipeline
+                | beam.Create(batches, reshuffle=False)
+                | beam.ParDo(_writer(store.target, max_in_flight_batches=3)).with_outputs(DEAD_LETTER_TAG, main="written")
+            )
+            assert_that(
+                results.written | beam.Map(lambda row: row["entity_id"]),
+                equal_to([row["entity_id"] for batch in batches for row in batch if row["entity_id"] not in refused]),
+            )
+            assert_that(
+                results[DEAD_LETTER_TAG] | beam.Map(lambda dl: (dl["entity_id"], dl["stage"], dl["error_type"])),
+                equal_to([(key, "write_online_store", "write_error") for key in refused]),
+                label="CheckDeadLetters",
+            )
+
+    assert store.write_streams == 1
+    assert store.write_requests == len(batches)
+    assert store.written["b0e3"] == {"sepal_length_cm": 3.0, "petal_length_cm": 1.5}
+
+
+def _counter(result, name):
+    counters = result.metrics().query(MetricsFilter().with_name(name))["counters"]
+    return sum(counter.committed for counter in counters)
+
+
+def test_only_failed_keys_are_retried_until_their_retries_run_out():
+    batches = _batches(4, 5)
+    # b0e1 recovers on its second retry; b2e3 is still failing after the third
+    flaky = {"b0e1": 2, "b2e3": 10}
+    with FakeOnlineStore(refused_keys={"b3e0"}, flaky_keys=flaky) as store:
+        pipeline = beam.Pipeline()
+        results = (
+            pipeline
+            | beam.Create(batches, reshuffle=False)
+            | beam.ParDo(_writer(store.target, max_retries=3, initial_backoff_secs=0.01))
+            .with_outputs(DEAD_LETTER_TAG, main="written")
+        )
+        assert_that(
+            results[DEAD_LETTER_TAG] | beam.Map(lambda dl: (dl["entity_id"], dl["retry_count"], dl["error_message"])),
+            equal_to([("b2e3", 3, "UNAVAILABLE: Injected failure"), ("b3e0", 0, "INVALID_ARGUMENT: Injected failure")]),
+        )
+        result = pipeline.run()
+        result.wait_until_finish()
+
+    assert set(store.written) == {row["entity_id"] for batch in batches for row in batch} - {"b2e3", "b3e0"}
+    # Each batch's failed keys are retried on their own: b0e1 twice, b2e3 three times
+    assert store.write_requests == 4 + 2 + 3
+    assert _counter(result, "rows_written") == 18
+    assert _counter(result, "rows_retried") == 2 + 2 + 1
+    assert _counter(result, "rows_recovered") == 1
+    assert _counter(result, "rows_retries_exhausted") == 1
+    assert _counter(result, "rows_refused") == 1
+
+
+def test_rows_in_flight_on_a_failed_stream_are_dead_lettered():
+    # Nothing listens on port 1, so every stream fails as it opens
+    dofn = _writer("127.0.0.1:1", max_in_flight_batches=2)
+    dofn.setup()
+    try:
+        dofn.start_bundle()
+        outputs = []
+        for batch in _batches(3, 4):
+            outputs.extend(dofn.process(batch, timestamp=0, window=GlobalWindow()))
+        outputs.extend(dofn.finish_bundle() or [])
+    finally:
+        dofn.teardown()
+
+    assert len(outputs) == 12
+    assert all(output.tag == DEAD_LETTER_TAG for output in outputs)
+    assert {output.value.value["error_type"] for output in outputs} == {"stream_error"}
+
+
+class _HungCall:
+    """A direct-write RPC that never reads a request or answers until cancelled."""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def __iter__(self):
+        self.cancelled.wait()
+        raise RuntimeError("Cancelled")
+
+
+class _HungClient:
+    def __init__(self):
+        self.call = _HungCall()
+
+    def feature_view_direct_write(self, requests):
+        return self.call
+
+
+def test_abort_releases_a_send_blocked_on_a_full_queue_and_cancels_the_call():
+    client = _HungClient()
+    settled = []
+    stream = DirectWriteStream(client, max_queued=1, on_settled=settled.append)
+    writes = [_BatchWrite([{"entity_id": f"e{i}"}], request=f"request {i}") for i in range(3)]
+    assert stream.send(writes[0]) and stream.send(writes[1])
+    # The queue holds one request plus the close marker's slot, both taken now
+    blocked = threading.Thread(target=stream.send, args=(writes[2],))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+
+    stream.abort("No direct write response")
+    blocked.join(5)
+    stream._reader.join(5)
+
+    assert not blocked.is_alive()
+    assert client.call.cancelled.is_set() and not stream._reader.is_alive()
+    assert sorted(settled, key=writes.index) == writes
+    assert {write.errors[0][0] for write in writes} == {"stream_error"}
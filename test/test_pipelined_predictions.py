@@ -0,0 +1,45 @@
+"""DirectRunner test for BatchCallFastAPIService with several batches in flight."""
+
+import sys
+from pathlib import Path
+
+import apache_beam as beam
+from apache_beam.metrics.metric import MetricsFilter
+from apache_beam.testing.util import assert_that, equal_to
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataflow.iris_inference_pipeline import FEATURE_COLUMNS, BatchCallFastAPIService  # noqa: E402
+from dataflow.testing.fake_prediction_service import FakePredictionService  # noqa: E402
+from dataflow.utils.dead_letter import DEAD_LETTER_TAG  # noqa: E402
+
+
+def _counter(result, name):
+    counters = result.metrics().query(MetricsFilter().with_name(name))["counters"]
+    return sum(counter.committed for counter in counters)
+
+
+def test_batches_overlap_and_metrics_reach_the_bundle():
+    batches = [
+        [{"entity_id": f"b{b}e{i}", **{col: float(i) for col in FEATURE_COLUMNS}} for i in range(5)]
+        for b in range(8)
+    ]
+    expected = [(e["entity_id"], str(int(e[FEATURE_COLUMNS[0]]) % 3)) for batch in batches for e in batch]
+
+    with FakePredictionService(FEATURE_COLUMNS, latency_secs=0.1) as service:
+        pipeline = beam.Pipeline()
+        results = (
+            pipeline
+            | beam.Create(batches, reshuffle=False)
+            | beam.ParDo(BatchCallFastAPIService(service.url, max_in_flight_batches=3))
+            .with_outputs(DEAD_LETTER_TAG, main="predictions")
+        )
+        assert_that(results.predictions | beam.Map(lambda row: (row["entity_id"], row["prediction"])), equal_to(expected))
+        assert_that(results[DEAD_LETTER_TAG], equal_to([]), label="CheckNoDeadLetters")
+        result = pipeline.run()
+        result.wait_until_finish()
+
+    assert service.requests == len(batches)
+    assert 1 < service.peak_in_flight <= 3
+    # Updated on the background loop thread, replayed on the bundle thread
+    assert _counter(result, "prediction_success") == len(expected)
@@ -0,0 +1,102 @@
+"""Tests for the FastAPI server's per-row prediction cache."""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src/ml_pipelines_kfp/iris_xgboost/pipelines/components/fastapi"))
+
+from prediction_cache import CAPACITY, EXPIRED, MODEL_CHANGE, PredictionCache  # noqa: E402
+
+
+class RecordingModel:
+    """Predicts class = round(first feature) and records every batch it is called with."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, X):
+        self.calls.append(np.array(X))
+        predictions = np.round(X[:, 0]).astype(np.int64)
+        probabilities = np.stack([X[:, 0], 1 - X[:, 0]], axis=1)
+        return predictions, probabilities
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _recording_cache(**kwargs):
+    events = {"hits": 0, "misses": 0, CAPACITY: 0, EXPIRED: 0, MODEL_CHANGE: 0}
+
+    def on_lookup(hits, misses):
+        events["hits"] += hits
+        events["misses"] += misses
+
+    def on_evict(count, reason):
+        events[reason] += count
+
+    return PredictionCache(on_lookup=on_lookup, on_evict=on_evict, **kwargs), events
+
+
+def test_only_distinct_misses_reach_the_model():
+    cache, events = _recording_cache()
+    model = RecordingModel()
+    first = np.array([[0.1, 1.0], [0.2, 1.0]], dtype=np.float32)
+    second = np.array([[0.2, 1.0], [0.3, 1.0], [0.1, 1.0], [0.3, 1.0]], dtype=np.float32)
+
+    asyncio.run(cache.predict_through("v1", first, model))
+    predictions, probabilities = asyncio.run(cache.predict_through("v1", second, model))
+
+    assert len(model.calls) == 2
+    np.testing.assert_array_equal(model.calls[1], second[[1]])
+    expected_predictions, expected_probabilities = asyncio.run(RecordingModel()(second))
+    np.testing.assert_array_equal(predictions, expected_predictions)
+    np.testing.assert_array_equal(probabilities, expected_probabilities)
+    assert (events["hits"], events["misses"]) == (2, 4)
+
+
+def test_quantisation_folds_float_noise_only():
+    cache, _ = _recording_cache(decimals=6)
+    model = RecordingModel()
+
+    asyncio.run(cache.predict_through("v1", np.array([[5.1, 0.0]], dtype=np.float32), model))
+    asyncio.run(cache.predict_through("v1", np.array([[5.1, -0.0]], dtype=np.float64), model))
+    asyncio.run(cache.predict_through("v1", np.array([[5.11, 0.0]]), model))
+
+    assert len(model.calls) == 2
+
+
+def test_versions_never_share_entries_and_unloaded_versions_are_dropped():
+    cache, events = _recording_cache()
+    model = RecordingModel()
+    X = np.array([[0.4, 0.0], [0.6, 0.0]])
+
+    asyncio.run(cache.predict_through("v1", X, model))
+    asyncio.run(cache.predict_through("v2", X, model))
+    assert len(model.calls) == 2
+
+    cache.retain_versions(["v2"])
+    assert len(cache) == 2 and events[MODEL_CHANGE] == 2
+    asyncio.run(cache.predict_through("v2", X, model))
+    assert len(model.calls) == 2
+
+
+def test_ttl_and_capacity_evictions():
+    clock = FakeClock()
+    cache, events = _recording_cache(max_entries=2, ttl_s=10, clock=clock)
+    model = RecordingModel()
+
+    asyncio.run(cache.predict_through("v1", np.array([[1.0, 0.0], [2.0, 0.0], [3.0, 0.0]]), model))
+    assert len(cache) == 2 and events[CAPACITY] == 1
+
+    clock.now = 11
+    asyncio.run(cache.predict_through("v1", np.array([[3.0, 0.0]]), model))
+    assert events[EXPIRED] == 1
+    assert len(model.calls) == 2
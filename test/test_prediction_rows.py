@@ -0,0 +1,72 @@
+"""Tests for the full and compact prediction row formats and sampled row logging."""
+
+import logging
+import sys
+from pathlib import Path
+
+import pytest
+from apache_beam.transforms.window import GlobalWindow
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataflow.iris_inference_pipeline import (  # noqa: E402
+    FEATURE_COLUMNS,
+    PREDICTION_SCHEMAS,
+    BatchCallFastAPIService,
+)
+from dataflow.testing.fake_prediction_service import FakePredictionService  # noqa: E402
+from dataflow.utils.bigquery_storage_write import ProtoRowEncoder  # noqa: E402
+from dataflow.utils.sampled_log import SampledLog  # noqa: E402
+
+
+def _rows(output_format, batch):
+    with FakePredictionService(FEATURE_COLUMNS, model_version="v7") as service:
+        dofn = BatchCallFastAPIService(service.url, output_format=output_format, wire_format="msgpack")
+        dofn.setup()
+        try:
+            dofn.start_bundle()
+            return list(dofn.process(batch, timestamp=0, window=GlobalWindow())), service.url
+        finally:
+            dofn.teardown()
+
+
+def test_compact_rows_carry_typed_features_and_the_model_version():
+    batch = [{"entity_id": f"e{i}", "timestamp": "2026-01-01T00:00:00+00:00",
+              **{col: float(i) + 0.5 for col in FEATURE_COLUMNS}} for i in range(4)]
+    full, url = _rows("full", batch)
+    compact, _ = _rows("compact", batch)
+
+    assert [row["prediction"] for row in compact] == [row["prediction"] for row in full]
+    assert compact[1]["feature_values"] == [1.5] * len(FEATURE_COLUMNS)
+    assert {row["model_version"] for row in compact} == {"v7"}
+    assert {row["model_service"] for row in full} == {url}
+    assert "features" not in compact[0] and "model_service" not in compact[0]
+
+    # Both encode against their own schema, the compact rows in fewer bytes
+    for rows in (full, compact):
+        for row in rows:
+            row["dataflow_processing_time"] = "2026-01-01T00:00:01+00:00"
+    full_bytes = sum(len(ProtoRowEncoder(PREDICTION_SCHEMAS["full"]).encode(row)) for row in full)
+    compact_bytes = sum(len(ProtoRowEncoder(PREDICTION_SCHEMAS["compact"]).encode(row)) for row in compact)
+    assert compact_bytes < full_bytes
+
+
+def test_unknown_output_format_is_refused():
+    with pytest.raises(ValueError, match="output_format"):
+        BatchCallFastAPIService("http://localhost", output_format="tiny")
+
+
+def test_sampled_log_logs_one_row_in_n_and_periodic_counts(caplog):
+    now = [0.0]
+    log = SampledLog(logging.getLogger("sampled"), "Row processed", sample_every=10, summary_interval_secs=5,
+                     clock=lambda: now[0])
+    with caplog.at_level(logging.INFO, logger="sampled"):
+        for i in range(25):
+            now[0] = i * 0.25
+            log.log({"n": i})
+    messages = [record.getMessage() for record in caplog.records]
+    assert [m for m in messages if m.startswith("Row processed (")] == [
+        f"Row processed (1 in 10) - {{'n': {i}}}" for i in (0, 10, 20)
+    ]
+    # The clock reaches 5s at row 20
+    assert [m for m in messages if m.startswith("Row processed:")] == ["Row processed: 21 rows in the last 5s (21 in total)"]
@@ -0,0 +1,85 @@
+"""Tests for the Beam schema row types generated from FeatureConfig."""
+
+import functools
+import pickle
+import sys
+from pathlib import Path
+
+import apache_beam as beam
+import pytest
+from apache_beam.coders import PickleCoder, RowCoder
+from apache_beam.testing.util import assert_that, equal_to
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataflow.iris_feature_pipeline import FEATURE_TABLE_SCHEMA  # noqa: E402
+from dataflow.iris_inference_pipeline import PREDICTION_ROW_TYPES, PREDICTION_SCHEMAS  # noqa: E402
+from dataflow.models.row_schemas import IrisFeatureRow, IrisRequest, row_types, to_dict, to_row  # noqa: E402
+from dataflow.testing.fake_bigquery_write import FakeBigQueryWrite, bigquery_write_client  # noqa: E402
+from dataflow.utils.bigquery_storage_write import WriteToBigQueryStorage, table_path  # noqa: E402
+from feature_store.schema import FeatureConfig  # noqa: E402
+
+TABLE = "project:dataset.iris_features"
+
+
+def _feature_row(i):
+    return {
+        "sepal_length_cm": 5.1, "sepal_width_cm": 3.5, "petal_length_cm": 1.4, "petal_width_cm": 0.2 + i,
+        "species": None, "source": "streaming", "entity_id": f"{i}_streaming",
+        "feature_timestamp": "2026-01-01T00:00:00+00:00",
+    }
+
+
+def test_row_types_follow_the_feature_config_and_the_bigquery_schemas():
+    config = FeatureConfig(
+        name="fraud_score", feature_columns=["amount", "merchant_risk"], entity_id_column="txn_id",
+        target_column="is_fraud", column_mappings={"snake": {"amt": "amount", "risk": "merchant_risk"}},
+    )
+    rows = row_types(config)
+    assert rows.feature_row.__name__ == "FraudScoreFeatureRow"
+    assert rows.message._fields == ("amt", "risk", "timestamp", "sample_id")
+    assert rows.scoring_row._fields == ("txn_id", "timestamp", "amount", "merchant_risk")
+
+    assert set(IrisFeatureRow._fields) == {field["name"] for field in FEATURE_TABLE_SCHEMA["fields"]}
+    for output_format, row_type in PREDICTION_ROW_TYPES.items():
+        assert set(row_type._fields) == {field["name"] for field in PREDICTION_SCHEMAS[output_format]["fields"]}
+
+
+def test_rows_round_trip_through_row_coder_in_fewer_bytes_than_pickled_dicts():
+    row = to_row({**_feature_row(3), "unrelated": "dropped"}, IrisFeatureRow)
+    coder = beam.coders.registry.get_coder(IrisFeatureRow)
+    assert isinstance(coder, RowCoder)
+    assert coder.decode(coder.encode(row)) == row
+    assert type(coder.decode(coder.encode(row))) is IrisFeatureRow
+    assert to_dict(row) == _feature_row(3)
+    assert len(coder.encode(row)) < len(PickleCoder().encode(_feature_row(3))) / 2
+    # Importable by name, so workers unpickle them by reference
+    assert pickle.loads(pickle.dumps(IrisRequest)) is IrisRequest
+
+
+@pytest.mark.parametrize("exactly_once", [False, True])
+def test_storage_write_sink_shuffles_schema_rows(exactly_once):
+    rows = [_feature_row(i) for i in range(20)]
+    rows[7]["source"] = None
+    with FakeBigQueryWrite() as fake:
+        with beam.Pipeline() as pipeline:
+            dead_letters = (
+                pipeline
+                | beam.Create(rows)
+                | WriteToBigQueryStorage(
+                    TABLE, FEATURE_TABLE_SCHEMA, pipeline="feature", exactly_once=exactly_once, batch_size=8,
+                    num_shards=3, client_factory=functools.partial(bigquery_write_client, fake.target),
+                    row_type=IrisFeatureRow,
+                )
+            )
+            # A REQUIRED column left empty is still dead-lettered rather than failing the encode. Not checked
+            # for exactly-once: a shard's last batch is flushed at the end of the window, and assert_that on
+            # the DirectRunner can miss what comes out then
+            if not exactly_once:
+                assert_that(
+                    dead_letters | beam.Map(lambda dl: (dl["entity_id"], dl["error_type"])),
+                    equal_to([("7_streaming", "encode_error")]),
+                )
+
+    written = fake.rows(table_path(TABLE))
+    assert sorted(row["petal_width_cm"] for row in written) == [0.2 + i for i in range(20) if i != 7]
@@ -0,0 +1,123 @@
+"""Tests for the memory-mapped serving artifact and the GCS artifact cache."""
+
+import base64
+import hashlib
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sklearn.datasets import load_iris
+from sklearn.ensemble import RandomForestClassifier
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp"))
+sys.path.insert(0, str(REPO_ROOT / "src/ml_pipelines_kfp/iris_xgboost/pipelines/components/fastapi"))
+
+from artifact_cache import ArtifactCache  # noqa: E402
+from compiled_trees import compile_model  # noqa: E402
+from model_adapter import COMPILED, load_adapter  # noqa: E402
+from serving_artifact import (  # noqa: E402
+    PAGE_SIZE,
+    load_serving_artifact,
+    read_header,
+    serving_artifact_path,
+    write_serving_artifact,
+)
+
+
+@pytest.fixture(scope="module")
+def forest():
+    X, y = load_iris(return_X_y=True)
+    return RandomForestClassifier(n_estimators=25, random_state=0).fit(X, y), X
+
+
+def test_round_trip_is_page_aligned_and_exact(forest, tmp_path):
+    model, X = forest
+    path = str(tmp_path / "model.serving")
+    write_serving_artifact(compile_model(model), path)
+
+    header = read_header(path)
+    assert all(spec["offset"] % PAGE_SIZE == 0 for spec in header["arrays"].values())
+
+    loaded = load_serving_artifact(path)
+    assert not loaded.value.flags.writeable
+    np.testing.assert_array_equal(loaded.classes_, model.classes_)
+    np.testing.assert_array_equal(loaded.predict_proba(X), model.predict_proba(X))
+
+
+def test_load_adapter_maps_serving_artifact(forest, tmp_path):
+    model, X = forest
+    path = serving_artifact_path(str(tmp_path / "model.joblib"))
+    write_serving_artifact(compile_model(model), path)
+
+    adapter = load_adapter(path)
+    predictions, _ = adapter.predict(X.astype(np.float32))
+
+    assert adapter.backend == COMPILED
+    np.testing.assert_array_equal(predictions, model.predict(X))
+
+
+class _FakeBlob:
+    def __init__(self, source):
+        self.source = source
+        self.generation = 1
+        self.downloads = 0
+
+    @property
+    def md5_hash(self):
+        return base64.b64encode(hashlib.md5(self.source.read_bytes()).digest()).decode()
+
+    def reload(self):
+        pass
+
+    def download_to_filename(self, filename):
+        self.downloads += 1
+        shutil.copyfile(self.source, filename)
+
+
+class _FakeClient:
+    def __init__(self, blob):
+        self._blob = blob
+
+    def bucket(self, name):
+        return self
+
+    def blob(self, path, generation=None):
+        return self._blob
+
+
+def test_artifact_cache_reuses_same_generation(tmp_path):
+    source = tmp_path / "model.joblib"
+    source.write_bytes(b"v1")
+    blob = _FakeBlob(source)
+    cache = ArtifactCache(str(tmp_path / "cache"), client=_FakeClient(blob))
+
+    first_path, first_hit = cache.fetch("gs://bucket/deployed-models/svc/model.joblib")
+    second_path, second_hit = cache.fetch("gs://bucket/deployed-models/svc/model.joblib")
+    assert (first_hit, second_hit) == (False, True)
+    assert first_path == second_path and blob.downloads == 1
+
+    source.write_bytes(b"v2")
+    blob.generation = 2
+    new_path, new_hit = cache.fetch("gs://bucket/deployed-models/svc/model.joblib")
+    assert not new_hit and Path(new_path).read_bytes() == b"v2"
+    assert not Path(first_path).exists()
+
+
+def test_artifact_cache_keeps_generations_still_served(tmp_path):
+    source = tmp_path / "model.joblib"
+    blob = _FakeBlob(source)
+    served = set()
+    cache = ArtifactCache(str(tmp_path / "cache"), client=_FakeClient(blob), in_use=lambda: served)
+
+    paths = []
+    for generation in (1, 2, 3):
+        source.write_bytes(f"v{generation}".encode())
+        blob.generation = generation
+        paths.append(cache.fetch("gs://bucket/deployed-models/svc/model.joblib")[0])
+        if generation == 1:
+            served.add(paths[0])
+
+    assert [Path(path).exists() for path in paths] == [True, False, True]
@@ -0,0 +1,61 @@
+"""Round-trip tests for the msgpack and Arrow IPC /predict encodings."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src/ml_pipelines_kfp"))
+
+from wire_format import (  # noqa: E402
+    ARROW,
+    MSGPACK,
+    decode_request,
+    decode_response,
+    encode_request,
+    encode_response,
+    media_type,
+)
+
+COLUMNS = ["sepal_length_cm", "sepal_width_cm", "petal_length_cm", "petal_width_cm"]
+
+
+@pytest.mark.parametrize("media", [MSGPACK, ARROW])
+def test_request_round_trip_reorders_to_model_columns(media):
+    X = np.random.default_rng(0).uniform(0, 8, size=(20, 4)).astype(np.float32)
+    model_order = [COLUMNS[i] for i in (3, 1, 0, 2)]
+
+    decoded = decode_request(encode_request(X, COLUMNS, media), media, model_order)
+
+    assert decoded.dtype == np.float32 and decoded.flags.c_contiguous
+    np.testing.assert_array_equal(decoded, X[:, [3, 1, 0, 2]])
+
+
+@pytest.mark.parametrize("media", [MSGPACK, ARROW])
+def test_response_round_trip(media):
+    predictions = np.array([0, 2, 1])
+    probabilities = np.array([[0.9, 0.1, 0.0], [0.0, 0.2, 0.8], [0.3, 0.6, 0.1]])
+
+    classes, probas = decode_response(encode_response(predictions, probabilities, media), media)
+
+    np.testing.assert_array_equal(classes, predictions)
+    np.testing.assert_array_equal(probas, probabilities)
+
+
+@pytest.mark.parametrize("media", [MSGPACK, ARROW])
+def test_invalid_requests_raise_value_error(media):
+    X = np.ones((2, 4), dtype=np.float32)
+    X[1, 2] = np.nan
+    with pytest.raises(ValueError, match="Null"):
+        decode_request(encode_request(X, COLUMNS, media), media, COLUMNS)
+    with pytest.raises(ValueError, match="Missing columns"):
+        decode_request(encode_request(X[:, :3], COLUMNS[:3], media), media, COLUMNS)
+    with pytest.raises(ValueError):
+        decode_request(b"not a payload", media, COLUMNS)
+
+
+def test_media_type_negotiation():
+    assert media_type("application/x-msgpack") == MSGPACK
+    assert media_type("text/html, application/vnd.apache.arrow.stream;q=0.9") == ARROW
+    assert media_type("*/*") is None
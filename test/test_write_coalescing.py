@@ -0,0 +1,107 @@
+"""Tests for coalescing feature rows by entity before the online store write."""
+
+import sys
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+import apache_beam as beam
+from apache_beam.options.pipeline_options import PipelineOptions, StandardOptions
+from apache_beam.testing import test_stream
+from apache_beam.testing.util import assert_that, equal_to
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dataflow.utils.online_store_writer import CoalesceLatestByKey  # noqa: E402
+
+
+def _row(entity_id, second, value):
+    return {"entity_id": entity_id, "feature_timestamp": f"2026-01-01T00:00:{second:02d}+00:00", "sepal_length_cm": value}
+
+
+class _State:
+    def __init__(self):
+        self.value = None
+
+    def read(self):
+        return self.value
+
+    def write(self, value):
+        self.value = value
+
+    def clear(self):
+        self.value = None
+
+
+class _Timer:
+    def set(self, timestamp):
+        pass
+
+
+class _Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+def test_only_the_latest_row_per_entity_in_each_window_is_kept():
+    first_window = [_row("a", 1, 1.0), _row("b", 1, 2.0), _row("a", 3, 1.1), _row("a", 2, 0.9), _row("b", 4, 2.2)]
+    second_window = [_row("a", 10, 1.5), _row("c", 10, 3.0), _row("a", 11, 1.6)]
+    events = (
+        test_stream.TestStream()
+        .add_elements(first_window)
+        # Fires the first window's flush timers before the later rows arrive
+        .advance_processing_time(1e10)
+        .add_elements(second_window)
+        .advance_processing_time(1e10)
+        .advance_watermark_to_infinity()
+    )
+
+    options = PipelineOptions()
+    options.view_as(StandardOptions).streaming = True
+    pipeline = beam.Pipeline(options=options)
+    rows = pipeline | events
+    latest = (
+        rows
+        | beam.Map(lambda row: (row["entity_id"], row)).with_output_types(Tuple[str, Dict[str, Any]])
+        | beam.ParDo(CoalesceLatestByKey(window_secs=30))
+    )
+    assert_that(
+        latest | beam.Map(lambda row: (row["entity_id"], row["sepal_length_cm"])),
+        # "a" at 00:02 arrived after 00:03 and does not replace it
+        equal_to([("a", 1.1), ("b", 2.2), ("a", 1.6), ("c", 3.0)]),
+    )
+    # The rows before coalescing, as the offline store sees them, are all still there
+    assert_that(
+        rows | "All Values" >> beam.Map(lambda row: row["sepal_length_cm"]),
+        equal_to([row["sepal_length_cm"] for row in first_window + second_window]),
+        label="CheckFullHistory",
+    )
+    pipeline.run().wait_until_finish()
+
+
+def test_every_row_held_back_from_the_write_is_counted():
+    dofn = CoalesceLatestByKey(window_secs=30)
+    dofn.rows_coalesced, dofn.rows_emitted = _Counter(), _Counter()
+    states, timers = {}, {}
+
+    def process(rows):
+        for row in rows:
+            key = row["entity_id"]
+            latest, flush_timer = states.setdefault(key, _State()), timers.setdefault(key, _Timer())
+            dofn.process((key, row), latest=latest, flush_timer=flush_timer)
+
+    def flush():
+        rows = [row for state in states.values() for row in dofn.flush(latest=state)]
+        return [(row["entity_id"], row["sepal_length_cm"]) for row in rows]
+
+    process([_row("a", 1, 1.0), _row("b", 1, 2.0), _row("a", 3, 1.1), _row("a", 2, 0.9), _row("b", 4, 2.2)])
+    assert flush() == [("a", 1.1), ("b", 2.2)]
+    # Replaced rows and the out-of-order one that lost to the held row alike
+    assert dofn.rows_coalesced.value == 3
+
+    process([_row("a", 10, 1.5), _row("c", 10, 3.0), _row("a", 11, 1.6)])
+    assert sorted(flush()) == [("a", 1.6), ("c", 3.0)]
+    assert dofn.rows_coalesced.value == 4
+    assert dofn.rows_emitted.value == 4